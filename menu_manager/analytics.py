@@ -0,0 +1,131 @@
+"""
+Sales reports from the hourly and daily rollups in the orders database.
+
+The rollups are kept up to date by OrderRepository.save_tickets, so every report
+reads a handful of rows per hour or day, however many orders were taken.
+Days are "YYYY-MM-DD" strings (or date objects) in the till's local time.
+
+Usage:
+    python menu_manager/analytics.py --from 2024-05-01 --to 2024-05-31
+    python menu_manager/analytics.py --rebuild
+"""
+import argparse
+from datetime import date
+from models import DISCOUNTS, OrderRepository
+from pricing import to_dollars
+
+ORDERS_DB = "menu_manager/database/orders.db"
+
+class SalesReport:
+    """Answers sales questions for a range of days from an OrderRepository's rollups."""
+    def __init__(self, order_repo):
+        """
+        Initialize the SalesReport object.
+
+        :param order_repo: the OrderRepository whose orders are reported on
+        """
+        self.order_repo = order_repo
+
+    def query(self, sql, params):
+        """Run a read-only query on the orders database and return every row."""
+        return self.order_repo.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def day_range(start_day, end_day):
+        """Return (start_day, end_day) as strings. end_day defaults to start_day."""
+        start_day = str(start_day)
+        return start_day, str(end_day) if end_day is not None else start_day
+
+    def daily_totals(self, start_day, end_day=None):
+        """Return (day, orders, subtotal_cents, tax_cents, total_cents) rows, one per day with sales."""
+        start_day, end_day = self.day_range(start_day, end_day)
+        return self.query("""
+            SELECT substr(hour, 1, 10), SUM(orders), SUM(subtotal_cents), SUM(tax_cents), SUM(total_cents)
+            FROM sales_hourly
+            WHERE hour BETWEEN ? AND ?
+            GROUP BY 1 ORDER BY 1;
+        """, (start_day, end_day + "T99"))
+
+    def hourly_volume(self, start_day, end_day=None):
+        """Return (hour, orders, total_cents) rows, one per hour with sales. Hours look like "2024-05-01T13"."""
+        start_day, end_day = self.day_range(start_day, end_day)
+        return self.query("""
+            SELECT hour, orders, total_cents FROM sales_hourly
+            WHERE hour BETWEEN ? AND ?
+            ORDER BY hour;
+        """, (start_day, end_day + "T99"))
+
+    def tax_collected(self, start_day, end_day=None):
+        """Return the tax collected over the days, in cents."""
+        start_day, end_day = self.day_range(start_day, end_day)
+        return self.query("""
+            SELECT COALESCE(SUM(tax_cents), 0) FROM sales_hourly WHERE hour BETWEEN ? AND ?;
+        """, (start_day, end_day + "T99"))[0][0]
+
+    def revenue_by_category(self, start_day, end_day=None):
+        """Return {category: (quantity, revenue_cents)} over the days, before tax, highest revenue first."""
+        start_day, end_day = self.day_range(start_day, end_day)
+        rows = self.query("""
+            SELECT category, SUM(quantity), SUM(revenue_cents) FROM sales_daily_categories
+            WHERE day BETWEEN ? AND ?
+            GROUP BY category ORDER BY 3 DESC, category;
+        """, (start_day, end_day))
+        return {category: (quantity, revenue) for category, quantity, revenue in rows}
+
+    def best_sellers(self, start_day, end_day=None, limit=10, by="quantity"):
+        """
+        Return the best selling items over the days. Promotions are left out.
+
+        :param limit: the number of items to return
+        :param by: "quantity" to rank by servings sold, or "revenue" to rank by money taken
+        :return: a list of (name, category, quantity, revenue_cents) rows
+        """
+        if by not in ("quantity", "revenue"):
+            raise ValueError(f"Can't rank best sellers by {by!r}.")
+        start_day, end_day = self.day_range(start_day, end_day)
+        order = "4 DESC, 3 DESC" if by == "revenue" else "3 DESC, 4 DESC"
+        return self.query(f"""
+            SELECT name, category, SUM(quantity), SUM(revenue_cents) FROM sales_daily_items
+            WHERE day BETWEEN ? AND ? AND category != ?
+            GROUP BY name, category ORDER BY {order}, name
+            LIMIT ?;
+        """, (start_day, end_day, DISCOUNTS, limit))
+
+def print_report(report, start_day, end_day, limit=10):
+    """Print a plain-text sales report for a range of days."""
+    print(f"Sales from {start_day} to {end_day}")
+    print()
+    print("Day          Orders   Subtotal        Tax      Total")
+    for day, orders, subtotal, tax, total in report.daily_totals(start_day, end_day):
+        print(f"{day}  {orders:>7} {to_dollars(subtotal):>10} {to_dollars(tax):>10} {to_dollars(total):>10}")
+    print(f"Tax collected: ${to_dollars(report.tax_collected(start_day, end_day))}")
+    print()
+    print("Revenue by category")
+    for category, (quantity, revenue) in report.revenue_by_category(start_day, end_day).items():
+        print(f"  {category:<20} {quantity:>7} sold  ${to_dollars(revenue)}")
+    print()
+    print(f"Top {limit} items")
+    for name, category, quantity, revenue in report.best_sellers(start_day, end_day, limit):
+        print(f"  {name:<30} {category:<15} {quantity:>7} sold  ${to_dollars(revenue)}")
+    print()
+    print("Busiest hours")
+    busiest = sorted(report.hourly_volume(start_day, end_day), key=lambda row: row[1], reverse=True)
+    for hour, orders, total in busiest[:limit]:
+        print(f"  {hour.replace('T', ' ')}:00  {orders:>7} orders  ${to_dollars(total)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a sales report from the orders database.")
+    parser.add_argument("--from", dest="start_day", default=date.today().isoformat(), help="first day, YYYY-MM-DD (default today)")
+    parser.add_argument("--to", dest="end_day", help="last day, YYYY-MM-DD (default the first day)")
+    parser.add_argument("--limit", type=int, default=10, help="rows in the top items and busiest hours lists")
+    parser.add_argument("--db", default=ORDERS_DB, help="orders database file")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the rollups from every saved order first")
+    args = parser.parse_args(argv)
+
+    order_repo = OrderRepository(args.db)
+    if args.rebuild:
+        order_repo.rebuild_rollups()
+    print_report(SalesReport(order_repo), args.start_day, args.end_day or args.start_day, args.limit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmarks for the repositories and order pricing.
+
+Each benchmark runs against freshly generated data in a temporary directory and
+reports latency percentiles and throughput. Results can be saved as a baseline,
+and later runs fail (exit status 1) when a benchmark's median gets slower than
+the baseline by more than the tolerance.
+
+Usage:
+    python menu_manager/benchmark.py --sizes 1000 10000 --save-baseline
+    python menu_manager/benchmark.py --sizes 1000 10000
+    python menu_manager/benchmark.py --sizes 1000000 --samples 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from connections import ConnectionManager
+from models import InventoryRepository, MenuItem, MenuRepository, Order
+from pricing import price_orders, to_cents
+import sample_data
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+def measure(function, samples):
+    """Call function samples times and return the sorted durations in seconds."""
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return durations
+
+def percentile(sorted_durations, fraction):
+    """Return a percentile of already sorted durations (nearest rank)."""
+    index = min(len(sorted_durations) - 1, max(0, round(fraction * len(sorted_durations)) - 1))
+    return sorted_durations[index]
+
+def summarize(durations, operations=1):
+    """Return latency percentiles in milliseconds and throughput in operations per second."""
+    return {
+        "p50_ms": percentile(durations, 0.50) * 1000,
+        "p95_ms": percentile(durations, 0.95) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+        "ops_per_s": operations * len(durations) / sum(durations) if sum(durations) else float("inf"),
+    }
+
+def run_size(size, samples, seed, directory):
+    """Run every benchmark against size generated rows. Returns {name: summary}."""
+    connections = ConnectionManager()
+    menu_repo = MenuRepository(os.path.join(directory, f"menu_{size}.db"), connections)
+    inventory_repo = InventoryRepository(os.path.join(directory, f"inventory_{size}.db"), connections)
+    with menu_repo.transaction():
+        menu_repo.bulk_create(sample_data.menu_items(size, seed))
+    with inventory_repo.transaction():
+        inventory_repo.bulk_create(sample_data.inventory_items(size, seed))
+
+    rng = random.Random(seed)
+    catalog = menu_repo.get_catalog()
+    menu_ids = list(catalog.items_by_id)
+    names = [catalog.items_by_id[menu_id].name for menu_id in rng.sample(menu_ids, min(samples, size))]
+    inventory_names = [item.item_name for item in inventory_repo.iter_inventory_items()]
+    inventory_names = rng.sample(inventory_names, min(samples, size))
+    results = {}
+
+    def cold_load():
+        menu_repo.invalidate_catalog()
+        menu_repo.get_all_menu_items()
+    results["get_all_menu_items (cold)"] = summarize(measure(cold_load, max(3, samples // 20)))
+    results["get_all_menu_items (cached)"] = summarize(measure(menu_repo.get_all_menu_items, samples))
+
+    lookups = iter(names * (samples // len(names) + 1))
+    results["get_menu_item_by_name"] = summarize(measure(lambda: menu_repo.get_menu_item_by_name(next(lookups)), samples))
+    lookups = iter(inventory_names * (samples // len(inventory_names) + 1))
+    results["get_inventory_item_by_name"] = summarize(measure(lambda: inventory_repo.get_inventory_item_by_name(next(lookups)), samples))
+
+    order = Order()
+    for menu_id, quantity in next(sample_data.order_stream(1, menu_ids, max_lines=size, seed=seed)):
+        order.add_item(catalog.get(menu_id), menu_id, quantity)
+    results["Order.total_cost"] = summarize(measure(order.total_cost, samples))
+
+    prices = {menu_id: to_cents(item.price) for menu_id, item in catalog.items_by_id.items()}
+    orders = list(sample_data.order_stream(size, menu_ids, seed=seed))
+    results["price_orders (whole stream)"] = summarize(measure(lambda: price_orders(orders, prices, Order.TAX_RATE), 3), operations=len(orders))
+
+    new_items = sample_data.menu_items(samples, seed, start=size)
+    results["create_menu_item"] = summarize(measure(lambda: menu_repo.create_menu_item(next(new_items)), samples))
+    updates = iter(rng.sample(menu_ids, min(samples, size)) * (samples // size + 1))
+
+    def update_menu_item():
+        menu_id = next(updates)
+        item = catalog.get(menu_id)
+        menu_repo.update_menu_item(menu_id, MenuItem(item.name, item.description, item.price + 0.01, item.calories, item.category))
+    results["update_menu_item"] = summarize(measure(update_menu_item, samples))
+    stock_ids = iter(range(1, samples + 1))
+
+    def update_inventory_item():
+        stock_id = next(stock_ids)
+        inventory_repo.update_inventory_item(stock_id, f"benchmark {stock_id}", 1, "Misc")
+    results["update_inventory_item"] = summarize(measure(update_inventory_item, min(samples, size)))
+
+    next_number = [size + samples]
+
+    def bulk_insert():
+        with menu_repo.transaction():
+            menu_repo.bulk_create(sample_data.menu_items(1000, seed, start=next_number[0]))
+        next_number[0] += 1000
+    results["bulk_create (1000 rows)"] = summarize(measure(bulk_insert, 3), operations=1000)
+
+    connections.close_all()
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages for medians slower than baseline * (1 + tolerance)."""
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, summary in benchmarks.items():
+            previous = baseline.get(size, {}).get(name)
+            if previous and summary["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{name} at {size} rows: p50 {summary['p50_ms']:.4f} ms vs baseline {previous['p50_ms']:.4f} ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the repositories and order pricing.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="rows to generate (10^3 to 10^6)")
+    parser.add_argument("--samples", type=int, default=200, help="timed calls per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown before failing (0.5 = 50%%)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results[str(size)] = run_size(size, args.samples, args.seed, directory)
+            print(f"\n{size} rows")
+            print(f"  {'benchmark':32} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>12}")
+            for name, summary in results[str(size)].items():
+                print(f"  {name:32} {summary['p50_ms']:10.4f} {summary['p95_ms']:10.4f} {summary['p99_ms']:10.4f} {summary['ops_per_s']:12.0f}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
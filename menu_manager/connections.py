@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+
+class ConnectionManager:
+    """
+    Hands out configured sqlite3 connections, one per database file per thread.
+
+    Connections are opened once and reused, so repositories and refreshes never pay
+    connection setup again. Every connection uses WAL journaling, which lets readers
+    keep reading while a writer commits, and synchronous=NORMAL, which is safe with
+    WAL and avoids an fsync on every commit.
+    """
+    def __init__(self, cached_statements=256, timeout=5.0):
+        """
+        Initialize the ConnectionManager object.
+
+        :param cached_statements: how many prepared statements each connection keeps
+        :param timeout: seconds to wait for a lock held by another connection
+        """
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.connections = []
+
+    def connect(self, db_name):
+        """Return this thread's connection to db_name, opening and configuring it the first time."""
+        key = db_name if db_name == ":memory:" else os.path.abspath(db_name)
+        thread_connections = getattr(self.local, "connections", None)
+        if thread_connections is None:
+            thread_connections = self.local.connections = {}
+        conn = thread_connections.get(key)
+        if conn is None:
+            conn = sqlite3.connect(
+                db_name,
+                timeout=self.timeout,
+                cached_statements=self.cached_statements,
+                check_same_thread=False, # Each connection is only used by the thread that opened it, except close_all.
+            )
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            thread_connections[key] = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def close_all(self):
+        """Close every connection opened by this manager, on any thread."""
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
+
+# The connection manager shared by repositories that aren't given their own.
+default_connections = ConnectionManager()
@@ -0,0 +1,143 @@
+"""
+Import and export menu items and inventory as CSV or JSON Lines files.
+
+Files are read and written one row at a time, and every import runs inside a
+single transaction, so large catalogs load with one commit.
+
+Usage:
+    python menu_manager/data_io.py export menu menu.csv
+    python menu_manager/data_io.py import inventory delivery.jsonl --upsert
+"""
+import argparse
+import csv
+import json
+from models import InventoryRepository, MenuItem, MenuRepository
+
+MENU_DB = "menu_manager/database/menu.db"
+INVENTORY_DB = "menu_manager/database/inventory.db"
+
+MENU_FIELDS = ["name", "description", "price", "calories", "category"]
+INVENTORY_FIELDS = ["item_name", "quantity", "category"]
+RECIPE_FIELDS = ["menu_id", "inventory_id", "quantity"]
+
+def file_format(path):
+    """Return "csv" or "json" based on the file extension."""
+    if path.lower().endswith(".csv"):
+        return "csv"
+    if path.lower().endswith((".json", ".jsonl")):
+        return "json"
+    raise ValueError(f"Unsupported file type: {path} (use .csv, .json, or .jsonl)")
+
+def read_records(path, fields):
+    """Yield one dict per row of a CSV or JSON Lines file."""
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format(path) == "csv":
+            for row in csv.DictReader(file):
+                yield {field: row.get(field) for field in fields}
+        else:
+            for line in file:
+                if line.strip():
+                    row = json.loads(line)
+                    yield {field: row.get(field) for field in fields}
+
+def write_records(path, fields, records):
+    """Write dicts to a CSV or JSON Lines file, one row at a time. Return the row count."""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if file_format(path) == "csv":
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+                count += 1
+    return count
+
+def import_menu(menu_repo, path, upsert=False):
+    """Load menu items from a file in one transaction. Return the number of rows written."""
+    items = (
+        MenuItem(row["name"], row["description"] or "", float(row["price"]), int(row["calories"] or 0), row["category"])
+        for row in read_records(path, MENU_FIELDS)
+    )
+    with menu_repo.transaction():
+        if upsert:
+            return menu_repo.bulk_upsert(items)
+        return menu_repo.bulk_create(items)
+
+def export_menu(menu_repo, path):
+    """Write every menu item to a file. Return the number of rows written."""
+    records = (
+        {"name": item.name, "description": item.description, "price": item.price,
+         "calories": item.calories, "category": item.category}
+        for _, item in menu_repo.iter_menu_items()
+    )
+    return write_records(path, MENU_FIELDS, records)
+
+def import_inventory(inventory_repo, path, upsert=False):
+    """Load inventory items from a file in one transaction. Return the number of rows written."""
+    items = (
+        (row["item_name"], int(row["quantity"]), row["category"])
+        for row in read_records(path, INVENTORY_FIELDS)
+    )
+    with inventory_repo.transaction():
+        if upsert:
+            return inventory_repo.bulk_upsert(items)
+        return inventory_repo.bulk_create(items)
+
+def export_inventory(inventory_repo, path):
+    """Write every inventory item to a file. Return the number of rows written."""
+    records = (
+        {"item_name": item.item_name, "quantity": item.quantity, "category": item.category}
+        for item in inventory_repo.iter_inventory_items()
+    )
+    return write_records(path, INVENTORY_FIELDS, records)
+
+def import_recipes(inventory_repo, path, upsert=False):
+    """Load recipe lines from a file in one transaction. Return the number of rows written."""
+    rows = (
+        (int(row["menu_id"]), int(row["inventory_id"]), int(row["quantity"]))
+        for row in read_records(path, RECIPE_FIELDS)
+    )
+    with inventory_repo.transaction():
+        if upsert:
+            return inventory_repo.bulk_upsert_recipes(rows)
+        return inventory_repo.bulk_create_recipes(rows)
+
+def export_recipes(inventory_repo, path):
+    """Write every recipe line to a file. Return the number of rows written."""
+    records = (
+        {"menu_id": row[0], "inventory_id": row[1], "quantity": row[2]}
+        for row in inventory_repo.iter_recipes()
+    )
+    return write_records(path, RECIPE_FIELDS, records)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export menu items and inventory.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("table", choices=["menu", "inventory", "recipes"])
+    parser.add_argument("path", help="a .csv, .json, or .jsonl (JSON Lines) file")
+    parser.add_argument("--upsert", action="store_true", help="update existing items (or recipe lines) instead of failing")
+    parser.add_argument("--db", help="database file (defaults to the app's menu.db or inventory.db)")
+    args = parser.parse_args(argv)
+
+    if args.table == "menu":
+        repo = MenuRepository(args.db or MENU_DB)
+        action = import_menu if args.action == "import" else export_menu
+    elif args.table == "inventory":
+        repo = InventoryRepository(args.db or INVENTORY_DB)
+        action = import_inventory if args.action == "import" else export_inventory
+    else:
+        repo = InventoryRepository(args.db or INVENTORY_DB)
+        action = import_recipes if args.action == "import" else export_recipes
+
+    if args.action == "import":
+        count = action(repo, args.path, upsert=args.upsert)
+    else:
+        count = action(repo, args.path)
+    print(f"{args.action.capitalize()}ed {count} {args.table} rows.")
+
+if __name__ == "__main__":
+    main()
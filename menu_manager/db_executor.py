@@ -0,0 +1,91 @@
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox as msgbox
+
+logger = logging.getLogger(__name__)
+
+class DatabaseExecutor:
+    """
+    Runs database calls on a background thread and hands results back to Tkinter.
+
+    Tkinter widgets may only be touched from the main thread, so finished calls are
+    put on a queue that the main loop drains every poll_interval milliseconds with
+    root.after, and their callbacks run there. A single worker keeps every query in
+    submission order, which is what SQLite's one-writer model wants anyway.
+    """
+    def __init__(self, root, poll_interval=20):
+        """
+        Initialize the DatabaseExecutor object and start polling for results.
+
+        :param root: the Tk root window
+        :param poll_interval: milliseconds between checks for finished calls
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self.results = queue.Queue()
+        self.callbacks = queue.Queue()
+        self.stopped = False
+        self.poll_id = self.root.after(self.poll_interval, self.poll)
+
+    def submit(self, function, *args, on_done=None, on_error=None, **kwargs):
+        """
+        Run function(*args, **kwargs) on the database thread.
+
+        :param on_done: called on the main thread with the function's return value
+        :param on_error: called on the main thread with the exception, if one was raised
+            (by default an error box is shown)
+        :return: a concurrent.futures.Future for the call
+        """
+        future = self.executor.submit(function, *args, **kwargs)
+        future.add_done_callback(lambda done: self.results.put((done, on_done, on_error)))
+        return future
+
+    def call_soon(self, callback, *args):
+        """Run callback(*args) on the main thread at the next poll. Safe to call from any thread."""
+        self.callbacks.put((callback, args))
+
+    def poll(self):
+        """
+        Run the callbacks for every call that has finished since the last poll.
+
+        A callback that raises is logged and skipped, and the next poll is always
+        scheduled, so one bad callback can't stop every later result from arriving.
+        """
+        try:
+            while True:
+                try:
+                    callback, args = self.callbacks.get_nowait()
+                except queue.Empty:
+                    break
+                self.run_callback(callback, *args)
+            while True:
+                try:
+                    future, on_done, on_error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                error = future.exception()
+                if error is not None:
+                    if on_error:
+                        self.run_callback(on_error, error)
+                    else:
+                        self.run_callback(msgbox.showerror, "Database Error", str(error))
+                elif on_done:
+                    self.run_callback(on_done, future.result())
+        finally:
+            if not self.stopped:
+                self.poll_id = self.root.after(self.poll_interval, self.poll)
+
+    def run_callback(self, callback, *args):
+        """Run one callback on the main thread, logging anything it raises."""
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Callback %r failed", callback)
+
+    def shutdown(self):
+        """Finish any queued calls and stop the database thread. Their callbacks are not run."""
+        self.stopped = True
+        self.root.after_cancel(self.poll_id)
+        self.executor.shutdown(wait=True)
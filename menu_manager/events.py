@@ -0,0 +1,208 @@
+"""
+An in-process publish/subscribe bus for committed repository changes.
+
+Repositories publish a ChangeEvent after every committed write. Subscribers either
+get each event as it happens, on the thread that made the change, or get them in
+batches: events that arrive within a short delay of each other are collected,
+coalesced, and delivered together on the bus's dispatch thread. Coalescing turns
+a create followed by updates into one create, drops rows created and deleted in
+the same batch, and folds row events into a single "reload" when a table was
+reloaded or had too many changes to be worth applying one at a time.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# source is the database file that changed, so subscribers can tell shards apart.
+# action is "create", "update", "delete", or "reload" (item_id is None for reloads).
+ChangeEvent = namedtuple("ChangeEvent", ["source", "table", "action", "item_id"])
+
+# What two changes to the same row in one batch amount to. None drops the row.
+MERGED_ACTIONS = {
+    ("create", "update"): "create",
+    ("create", "delete"): None,
+    ("update", "delete"): "delete",
+    ("delete", "create"): "update",
+}
+
+def coalesce(events, reload_threshold=None):
+    """
+    Reduce a burst of events to the fewest with the same end result, in first-seen order.
+
+    :param events: a list of ChangeEvents, oldest first
+    :param reload_threshold: replace a table's row events with one "reload" if there are more than this many
+    :return: a list of ChangeEvents
+    """
+    reloaded = {(event.source, event.table) for event in events if event.action == "reload"}
+    merged = {} # (source, table, item_id) -> ChangeEvent; item_id is "reload" for whole-table events
+    for event in events:
+        table = (event.source, event.table)
+        if table in reloaded or event.item_id is None:
+            merged.setdefault(table + ("reload",), ChangeEvent(event.source, event.table, "reload", None))
+            continue
+        key = table + (event.item_id,)
+        previous = merged.get(key)
+        if previous is None:
+            merged[key] = event
+            continue
+        action = MERGED_ACTIONS.get((previous.action, event.action), event.action)
+        if action is None:
+            del merged[key]
+        else:
+            merged[key] = previous._replace(action=action)
+    coalesced = list(merged.values())
+    if reload_threshold is not None:
+        counts = {}
+        for event in coalesced:
+            counts[(event.source, event.table)] = counts.get((event.source, event.table), 0) + 1
+        busy = {table for table, count in counts.items() if count > reload_threshold}
+        if busy:
+            reduced = {}
+            for event in coalesced:
+                table = (event.source, event.table)
+                if table in busy:
+                    reduced.setdefault(table + ("reload",), ChangeEvent(event.source, event.table, "reload", None))
+                else:
+                    reduced[table + (event.item_id,)] = event
+            coalesced = list(reduced.values())
+    return coalesced
+
+class Subscription:
+    """One subscriber's callback and filters. Returned by subscribe() so it can be unsubscribed."""
+    def __init__(self, callback, tables=None, sources=None, delay=None, reload_threshold=None):
+        self.callback = callback
+        self.tables = frozenset(tables) if tables is not None else None
+        self.sources = frozenset(sources) if sources is not None else None
+        self.delay = delay # None for immediate delivery
+        self.reload_threshold = reload_threshold
+        self.pending = []
+        self.due = None # When the pending batch should be delivered
+
+    def wants(self, event):
+        """Whether event passes this subscription's table and source filters."""
+        return ((self.tables is None or event.table in self.tables)
+                and (self.sources is None or event.source in self.sources))
+
+class EventBus:
+    """Delivers ChangeEvents to subscribers, one at a time or in coalesced batches."""
+    def __init__(self):
+        self.subscriptions = () # Replaced, never changed in place, so publish() can read it without the lock
+        self.condition = threading.Condition()
+        self.dispatcher = None
+        self.closed = False
+
+    def subscribe(self, callback, tables=None, sources=None):
+        """
+        Call callback(event) for every matching event, on the publishing thread, as soon as it is published.
+
+        :param tables: only deliver events for these table names (defaults to all)
+        :param sources: only deliver events from these database files (defaults to all)
+        :return: a Subscription for unsubscribe()
+        """
+        return self.add(Subscription(callback, tables, sources))
+
+    def subscribe_batches(self, callback, tables=None, sources=None, delay=0.05, reload_threshold=200):
+        """
+        Call callback(events) with coalesced lists of matching events, on the bus's dispatch thread.
+
+        A batch is delivered delay seconds after its first event, so a burst of writes
+        arrives as one call.
+
+        :param tables: only deliver events for these table names (defaults to all)
+        :param sources: only deliver events from these database files (defaults to all)
+        :param delay: seconds to wait for more events before delivering a batch
+        :param reload_threshold: deliver one "reload" instead of more row events than this for a table
+        :return: a Subscription for unsubscribe()
+        """
+        subscription = self.add(Subscription(callback, tables, sources, delay, reload_threshold))
+        with self.condition:
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self.dispatch, name="event-bus", daemon=True)
+                self.dispatcher.start()
+        return subscription
+
+    def add(self, subscription):
+        with self.condition:
+            self.subscriptions = self.subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop delivering events to a subscription. Undelivered batched events are dropped."""
+        with self.condition:
+            self.subscriptions = tuple(other for other in self.subscriptions if other is not subscription)
+            subscription.pending = []
+            subscription.due = None
+
+    def publish(self, event):
+        """Deliver an event to the immediate subscribers, and queue it for the batched ones."""
+        queued = False
+        for subscription in self.subscriptions:
+            if not subscription.wants(event):
+                continue
+            if subscription.delay is None:
+                try:
+                    subscription.callback(event)
+                except Exception:
+                    logger.exception("Event subscriber failed on %s", event)
+            else:
+                with self.condition:
+                    if subscription.due is None:
+                        subscription.due = time.monotonic() + subscription.delay
+                    subscription.pending.append(event)
+                queued = True
+        if queued:
+            with self.condition:
+                self.condition.notify()
+
+    def take_due(self, now):
+        """Remove and return (subscription, events) for every batch due by now. Called with the lock held."""
+        batches = []
+        for subscription in self.subscriptions:
+            if subscription.due is not None and subscription.due <= now:
+                batches.append((subscription, subscription.pending))
+                subscription.pending = []
+                subscription.due = None
+        return batches
+
+    def deliver(self, batches):
+        for subscription, events in batches:
+            try:
+                subscription.callback(coalesce(events, subscription.reload_threshold))
+            except Exception:
+                logger.exception("Event subscriber failed on a batch of %d events", len(events))
+
+    def dispatch(self):
+        """Deliver batches as they fall due. Runs on the dispatch thread until close()."""
+        while True:
+            with self.condition:
+                while True:
+                    if self.closed:
+                        return
+                    now = time.monotonic()
+                    batches = self.take_due(now)
+                    if batches:
+                        break
+                    dues = [subscription.due for subscription in self.subscriptions if subscription.due is not None]
+                    self.condition.wait(min(dues) - now if dues else None)
+            self.deliver(batches)
+
+    def flush(self):
+        """Deliver every pending batch now, on the calling thread."""
+        with self.condition:
+            batches = self.take_due(float("inf"))
+        self.deliver(batches)
+
+    def close(self):
+        """Deliver what is pending and stop the dispatch thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.dispatcher is not None and self.dispatcher is not threading.current_thread():
+            self.dispatcher.join()
+        self.flush()
+
+# The bus repositories publish to unless they are given another one.
+default_bus = EventBus()
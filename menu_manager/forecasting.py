@@ -0,0 +1,104 @@
+"""
+Low-stock alerts and reorder suggestions from the inventory's stock ledger.
+
+Usage over each window is summed in one query for the whole inventory, so a
+report across thousands of items takes milliseconds. An item is low once its
+quantity is at or below its reorder point: the level set with
+InventoryRepository.set_reorder_level, or else enough stock to last the lead time.
+
+Usage:
+    python menu_manager/forecasting.py
+    python menu_manager/forecasting.py --lead-time 3 --cover 14 --all
+"""
+import argparse
+import math
+from collections import namedtuple
+from datetime import datetime, timedelta
+from models import InventoryRepository
+
+INVENTORY_DB = "menu_manager/database/inventory.db"
+
+# One inventory item's forecast. daily_usage is None for items with no sales in any
+# window, and days_left is None when nothing is being used.
+StockForecast = namedtuple("StockForecast", [
+    "inventory_id", "item_name", "quantity", "daily_usage", "days_left", "reorder_point", "order_quantity", "low",
+])
+
+class ReorderEngine:
+    """Forecasts how fast each inventory item is used and how much to reorder."""
+    def __init__(self, inventory_repo, windows=(7, 28), lead_time_days=2, cover_days=7):
+        """
+        Initialize the ReorderEngine object.
+
+        :param inventory_repo: the InventoryRepository to read stock and the ledger from
+        :param windows: the lengths in days of the sliding windows usage is averaged over
+        :param lead_time_days: how long a delivery takes to arrive
+        :param cover_days: how many days of usage an order should cover once it arrives
+        """
+        if not windows or any(days <= 0 for days in windows):
+            raise ValueError("Usage windows must be a positive number of days.")
+        self.inventory_repo = inventory_repo
+        self.windows = tuple(windows)
+        self.lead_time_days = lead_time_days
+        self.cover_days = cover_days
+
+    def forecast(self, now=None):
+        """
+        Return a StockForecast for every inventory item.
+
+        The daily usage is the highest of the windows' averages, so a recent rush
+        raises the forecast straight away but a quiet few days only lower it once
+        the longer windows agree.
+        """
+        now = now or datetime.now()
+        since = [(now - timedelta(days=days)).isoformat(timespec="seconds") for days in self.windows]
+        forecasts = []
+        for item_id, item_name, quantity, reorder_point, reorder_quantity, *used in self.inventory_repo.get_stock_usage(since):
+            daily_usage = max(amount / days for amount, days in zip(used, self.windows))
+            if daily_usage <= 0:
+                daily_usage = None
+            days_left = quantity / daily_usage if daily_usage else None
+            if reorder_point is None:
+                reorder_point = math.ceil(daily_usage * self.lead_time_days) if daily_usage else None
+            low = reorder_point is not None and quantity <= reorder_point
+            order_quantity = 0
+            if low:
+                if reorder_quantity is not None:
+                    order_quantity = reorder_quantity
+                elif daily_usage:
+                    order_quantity = max(math.ceil(daily_usage * (self.lead_time_days + self.cover_days)) - quantity, 0)
+            forecasts.append(StockForecast(item_id, item_name, quantity, daily_usage, days_left,
+                                           reorder_point, order_quantity, low))
+        return forecasts
+
+    def low_stock(self, now=None):
+        """Return the forecasts for items at or below their reorder point, soonest to run out first."""
+        low = [forecast for forecast in self.forecast(now) if forecast.low]
+        low.sort(key=lambda forecast: (forecast.days_left if forecast.days_left is not None else math.inf, forecast.item_name))
+        return low
+
+def format_forecast(forecast):
+    """Return one line describing a forecast."""
+    usage = f"{forecast.daily_usage:.1f}/day" if forecast.daily_usage else "no recent sales"
+    days_left = f", {forecast.days_left:.1f} days left" if forecast.days_left is not None else ""
+    order = f" - order {forecast.order_quantity}" if forecast.order_quantity else ""
+    return f"{forecast.item_name}: {forecast.quantity} in stock ({usage}{days_left}){order}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List low-stock inventory items and how much to reorder.")
+    parser.add_argument("--db", default=INVENTORY_DB, help="inventory database file")
+    parser.add_argument("--windows", type=int, nargs="+", default=[7, 28], help="usage windows in days")
+    parser.add_argument("--lead-time", type=float, default=2, help="days a delivery takes to arrive")
+    parser.add_argument("--cover", type=float, default=7, help="days of usage each order should cover")
+    parser.add_argument("--all", action="store_true", help="list every item, not just the low ones")
+    args = parser.parse_args(argv)
+
+    engine = ReorderEngine(InventoryRepository(args.db), args.windows, args.lead_time, args.cover)
+    forecasts = engine.forecast() if args.all else engine.low_stock()
+    for forecast in forecasts:
+        print(format_forecast(forecast))
+    if not forecasts:
+        print("Nothing is low on stock.")
+
+if __name__ == "__main__":
+    main()
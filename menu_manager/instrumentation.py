@@ -0,0 +1,185 @@
+"""
+Timing, counters, and profiling hooks for the repositories and the GUI.
+
+Nothing is recorded until metrics are enabled, either with enable() or by setting
+the MENU_MANAGER_METRICS environment variable to 1. While disabled, a timed()
+function costs one attribute check per call.
+
+Collected numbers can be read with snapshot(), written as JSON lines with
+write_log(), or served at http://127.0.0.1:<port>/metrics with start_metrics_server().
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections.abc import Sized
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("menu_manager.metrics")
+
+class Metrics:
+    """A thread-safe collection of timings and counters."""
+    def __init__(self):
+        self.enabled = os.environ.get("MENU_MANAGER_METRICS") == "1"
+        self.lock = threading.Lock()
+        self.timings = {} # name -> [calls, total seconds, max seconds, rows]
+        self.counters = {}
+
+    def record(self, name, seconds, rows=0):
+        """Add one call's duration (and rows returned or written) to a timing."""
+        with self.lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = [0, 0.0, 0.0, 0]
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            timing[3] += rows
+
+    def count(self, name, amount=1):
+        """Add to a counter, if metrics are enabled."""
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Return every timing and counter as a JSON-ready dict."""
+        with self.lock:
+            return {
+                "timings": {
+                    name: {"calls": calls, "total_ms": total * 1000, "mean_ms": total * 1000 / calls,
+                           "max_ms": longest * 1000, "rows": rows}
+                    for name, (calls, total, longest, rows) in sorted(self.timings.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self.lock:
+            self.timings.clear()
+            self.counters.clear()
+
+# The metrics shared by the whole program.
+metrics = Metrics()
+
+def enable():
+    """Start recording metrics."""
+    metrics.enabled = True
+
+def disable():
+    """Stop recording metrics. What was recorded is kept."""
+    metrics.enabled = False
+
+def count_rows(result):
+    """Guess how many rows a repository call returned: collection length, summed dict-of-lists lengths, or 1."""
+    if result is None:
+        return 0
+    if isinstance(result, Sized) and not isinstance(result, (tuple, str, dict)):
+        return len(result)
+    if isinstance(result, dict) and all(isinstance(value, list) for value in result.values()):
+        return sum(len(value) for value in result.values())
+    return 1
+
+def rows_written(result):
+    """Row count for bulk write methods, which return the number of rows written."""
+    return max(result or 0, 0)
+
+def timed(name, rows=count_rows):
+    """
+    Decorate a function so each call's duration and row count are recorded under name.
+
+    :param rows: a function that gets the row count from the call's return value
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            metrics.record(name, time.perf_counter() - start, rows(result))
+            return result
+        return wrapper
+    return decorator
+
+def write_log(stream=None):
+    """Write the current snapshot as one JSON line, to stream or to the metrics logger."""
+    line = json.dumps(dict(metrics.snapshot(), time=time.time()))
+    if stream is not None:
+        stream.write(line + "\n")
+    else:
+        logger.info(line)
+
+def start_metrics_server(port=9100, host="127.0.0.1"):
+    """Serve the current snapshot as JSON at /metrics on a background thread. Returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Keep the console quiet
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+class Profiler:
+    """
+    Optional profiling for a whole run.
+
+    mode "cprofile" traces every call with cProfile (accurate, slower). mode "sample"
+    looks at the main thread's stack every interval seconds and counts which
+    functions are running (rough, nearly free). stop() writes the report to path.
+    """
+    def __init__(self, path, mode="sample", interval=0.005):
+        self.path = path
+        self.mode = mode
+        self.interval = interval
+        self.samples = {}
+        self.running = False
+
+    def start(self):
+        """Begin profiling the calling thread."""
+        self.running = True
+        if self.mode == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.thread_id = threading.get_ident()
+            self.thread = threading.Thread(target=self.sample, name="sampler", daemon=True)
+            self.thread.start()
+
+    def sample(self):
+        """The sampling thread's loop."""
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            while frame is not None:
+                key = f"{frame.f_code.co_filename}:{frame.f_code.co_firstlineno} {frame.f_code.co_name}"
+                self.samples[key] = self.samples.get(key, 0) + 1
+                frame = frame.f_back
+            time.sleep(self.interval)
+
+    def stop(self):
+        """Stop profiling and write the report."""
+        self.running = False
+        if self.mode == "cprofile":
+            self.profile.disable()
+            self.profile.dump_stats(self.path) # Read with: python -m pstats <path>
+        else:
+            self.thread.join()
+            with open(self.path, "w", encoding="utf-8") as file:
+                for key, hits in sorted(self.samples.items(), key=lambda pair: -pair[1]):
+                    file.write(f"{hits:8d}  {key}\n")
@@ -0,0 +1,137 @@
+"""
+A crash-safe, append-only journal of writes that have been accepted but not yet applied.
+
+Each entry is one line of JSON. append() returns once the line is on disk, so a
+write can be acknowledged straight away and applied to the databases later.
+checkpoint() records how far the entries have been applied; after a crash,
+pending() returns every entry past the last checkpoint, and applying them again
+must be harmless (each entry carries its own idempotency key). A line cut short
+by a crash was never acknowledged, and is dropped.
+
+Once every entry has been applied and the file has grown past compact_size, it
+is emptied, so the journal only ever holds recent work.
+"""
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    """An append-only file of JSON entries, with a checkpoint of how many bytes of it have been applied."""
+    def __init__(self, path, sync=True, compact_size=1024 * 1024):
+        """
+        Initialize the Journal object, creating the file if it doesn't exist.
+
+        :param path: the journal file; the checkpoint is kept next to it in path + ".checkpoint"
+        :param sync: fsync every append and checkpoint (turn off only for tests and benchmarks)
+        :param compact_size: empty the file once everything is applied and it is at least this many bytes
+        """
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.sync = sync
+        self.compact_size = compact_size
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.applied = min(self.read_checkpoint(), self.size)
+
+    def read_checkpoint(self):
+        """Return the applied offset saved by the last checkpoint, or 0."""
+        try:
+            with open(self.checkpoint_path, encoding="ascii") as file:
+                return int(file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            logger.warning("Ignoring an unreadable journal checkpoint in %s", self.checkpoint_path)
+            return 0
+
+    def write_checkpoint(self, offset):
+        """Save offset as the applied position, replacing the old checkpoint in one step."""
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w", encoding="ascii") as file:
+            file.write(str(offset))
+            file.flush()
+            if self.sync:
+                os.fsync(file.fileno())
+        os.replace(temporary, self.checkpoint_path)
+
+    def append(self, entry):
+        """
+        Write an entry to the end of the journal and wait until it is on disk.
+
+        :param entry: a JSON-serializable value
+        :return: the offset just past the entry, to pass to checkpoint() once it is applied
+        :raises OSError: if the entry couldn't be written; nothing is left behind in that case
+        """
+        data = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            try:
+                self.file.write(data)
+                self.file.flush()
+                if self.sync:
+                    os.fsync(self.file.fileno())
+            except OSError:
+                try:
+                    self.file.truncate(self.size)
+                except OSError:
+                    pass
+                raise
+            self.size += len(data)
+            return self.size
+
+    def pending(self):
+        """
+        Return (offset, entry) pairs for every entry after the last checkpoint, oldest first.
+
+        A partial last line, left by a crash in the middle of append(), is cut off the file.
+        """
+        with self.lock:
+            with open(self.path, "rb") as file:
+                file.seek(self.applied)
+                data = file.read(self.size - self.applied)
+            entries = []
+            offset = self.applied
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    logger.warning("Dropping a partial entry at the end of %s", self.path)
+                    self.file.truncate(offset)
+                    self.size = offset
+                    break
+                offset += len(line)
+                try:
+                    entries.append((offset, json.loads(line)))
+                except ValueError:
+                    logger.warning("Skipping an unreadable entry in %s ending at byte %d", self.path, offset)
+            return entries
+
+    def checkpoint(self, offset):
+        """
+        Record that every entry up to offset has been applied, so it isn't replayed after a restart.
+
+        :param offset: a value returned by append() or pending()
+        """
+        with self.lock:
+            if offset <= self.applied:
+                return
+            if offset == self.size and self.size >= self.compact_size:
+                # Reset the checkpoint first: a crash in between only replays applied entries.
+                self.write_checkpoint(0)
+                self.file.truncate(0)
+                if self.sync:
+                    os.fsync(self.file.fileno())
+                self.size = self.applied = 0
+            else:
+                self.write_checkpoint(offset)
+                self.applied = offset
+
+    def backlog(self):
+        """Return the number of bytes of entries not yet applied."""
+        return self.size - self.applied
+
+    def close(self):
+        """Close the journal file."""
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,392 @@
+"""
+Kitchen tickets: route order lines to stations, schedule them by prep time, and push them to displays.
+
+Every saved order is split by menu category into items for the station that makes
+them (grill, fryer, bar, ...). Each station works from a priority queue ordered by
+the time an item has to be started so that everything on its ticket is ready
+together: the slowest item on a ticket starts straight away, and quicker ones are
+held back until there is just enough time left to make them.
+
+New orders come from the repository's change events, so nothing polls the
+database. Kitchen displays are web pages; each keeps one connection open and
+the server pushes every new or bumped item to it as a server-sent event.
+
+The stations and prep times are read from kitchen.json next to a location's
+databases, for example:
+
+    {"stations": {"Entrees": "grill", "Sides": "fryer", "Beverages": "bar"},
+     "prep_seconds": {"Entrees": 600, "Burger": 480, "Beverages": 60}}
+
+prep_seconds can name a menu item or a category; the item wins.
+
+Usage:
+    python menu_manager/main.py --kitchen-port 8090
+    python menu_manager/server.py --kitchen-port 8090
+    Then open http://<host>:8090/ on each kitchen display.
+"""
+import asyncio
+import heapq
+import html
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import quote, unquote
+from models import DISCOUNTS
+
+logger = logging.getLogger(__name__)
+
+KITCHEN_FILE = "menu_manager/database/kitchen.json"
+STATIONS = {"Entrees": "grill", "Sides": "fryer", "Beverages": "bar", "Desserts": "pastry"}
+DEFAULT_STATION = "kitchen"
+PREP_SECONDS = {"Entrees": 600, "Sides": 300, "Beverages": 60, "Desserts": 180}
+DEFAULT_PREP_SECONDS = 300
+
+# Seconds between keep-alive comments on an idle display connection.
+KEEP_ALIVE = 15
+
+# Events a display can fall behind by before it is sent a fresh snapshot instead.
+CLIENT_BACKLOG = 256
+
+# One order line at one station. start_by and due are time.time() values.
+KitchenItem = namedtuple("KitchenItem", [
+    "item_id", "ticket_id", "terminal", "station", "name", "quantity", "prep_seconds", "start_by", "due",
+])
+
+class KitchenScheduler:
+    """
+    The open kitchen items, with one priority queue per station.
+
+    Thread-safe. Listeners are called with (station, event) after every change,
+    on the thread that made it; event is a JSON-ready dict with a "type" of "add"
+    or "done".
+    """
+    def __init__(self, stations=None, prep_seconds=None, default_station=DEFAULT_STATION,
+                 default_prep_seconds=DEFAULT_PREP_SECONDS):
+        """
+        Initialize the KitchenScheduler object.
+
+        :param stations: a dict of menu category to station name
+        :param prep_seconds: a dict of menu item name or category to seconds to make one
+        :param default_station: the station for categories not in stations
+        :param default_prep_seconds: the prep time for items not in prep_seconds
+        """
+        self.stations = dict(STATIONS if stations is None else stations)
+        self.prep_seconds = dict(PREP_SECONDS if prep_seconds is None else prep_seconds)
+        self.default_station = default_station
+        self.default_prep_seconds = default_prep_seconds
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.items = {} # item_id -> KitchenItem, for every open item
+        self.queues = {} # station -> heap of (start_by, item_id); bumped items are skipped when reached
+        self.tickets = {} # ticket_id -> set of open item_ids
+        self.listeners = []
+
+    def station_names(self):
+        """Return every station an item can be sent to, sorted."""
+        return sorted(set(self.stations.values()) | {self.default_station} | set(self.queues))
+
+    def add_listener(self, listener):
+        """Call listener(station, event) after every change."""
+        self.listeners.append(listener)
+
+    def notify(self, station, event):
+        for listener in self.listeners:
+            try:
+                listener(station, event)
+            except Exception:
+                logger.exception("Kitchen listener failed on %s", event)
+
+    def add_ticket(self, ticket, now=None):
+        """
+        Send a Ticket's lines to their stations.
+
+        Promotion lines are left out, and a ticket already in the kitchen is ignored.
+
+        :param now: the time.time() the ticket arrived (defaults to now)
+        :return: the new KitchenItems
+        """
+        now = time.time() if now is None else now
+        lines = [line for line in ticket.lines if line.category != DISCOUNTS and line.quantity > 0]
+        if not lines:
+            return []
+        preps = [self.prep_seconds.get(line.name, self.prep_seconds.get(line.category, self.default_prep_seconds))
+                 for line in lines]
+        due = now + max(preps)
+        added = []
+        with self.lock:
+            if ticket.ticket_id in self.tickets:
+                return []
+            for line, prep in zip(lines, preps):
+                station = self.stations.get(line.category, self.default_station)
+                item = KitchenItem(next(self.ids), ticket.ticket_id, ticket.terminal, station, line.name,
+                                   line.quantity, prep, due - prep, due)
+                self.items[item.item_id] = item
+                heapq.heappush(self.queues.setdefault(station, []), (item.start_by, item.item_id))
+                added.append(item)
+            self.tickets[ticket.ticket_id] = {item.item_id for item in added}
+        for item in added:
+            self.notify(item.station, {"type": "add", "item": item._asdict()})
+        return added
+
+    def add_tickets(self, tickets):
+        """Send many Tickets to the kitchen. Returns the number of new items."""
+        return sum(len(self.add_ticket(ticket)) for ticket in tickets)
+
+    def bump(self, item_id):
+        """
+        Mark an item as made and take it off its station's queue.
+
+        :return: (the KitchenItem, whether that finished its whole ticket)
+        :raises KeyError: if no open item has that ID
+        """
+        with self.lock:
+            item = self.items.pop(item_id)
+            open_items = self.tickets[item.ticket_id]
+            open_items.discard(item_id)
+            ticket_done = not open_items
+            if ticket_done:
+                del self.tickets[item.ticket_id]
+            self.trim(item.station)
+        self.notify(item.station, {"type": "done", "item_id": item_id, "ticket_id": item.ticket_id,
+                                   "ticket_done": ticket_done})
+        return item, ticket_done
+
+    def trim(self, station):
+        """Drop bumped items from the top of a station's heap. Called with the lock held."""
+        queue = self.queues.get(station)
+        while queue and queue[0][1] not in self.items:
+            heapq.heappop(queue)
+
+    def next_item(self, station):
+        """Return the station's most urgent open KitchenItem, or None."""
+        with self.lock:
+            self.trim(station)
+            queue = self.queues.get(station)
+            return self.items[queue[0][1]] if queue else None
+
+    def queue(self, station):
+        """Return the station's open KitchenItems, most urgent first."""
+        with self.lock:
+            queue = self.queues.get(station, [])
+            if len(queue) > 2 * len(self.items) + 64: # Mostly bumped items; rebuild it
+                queue[:] = [entry for entry in queue if entry[1] in self.items]
+                heapq.heapify(queue)
+            return [self.items[item_id] for _, item_id in sorted(queue) if item_id in self.items]
+
+    def open_tickets(self):
+        """Return the number of tickets with items still to make."""
+        with self.lock:
+            return len(self.tickets)
+
+def load_scheduler(path=KITCHEN_FILE):
+    """
+    Return a KitchenScheduler set up from a JSON file, or with the default stations if it doesn't exist.
+
+    :raises ValueError: if the file isn't a JSON object
+    """
+    if not os.path.exists(path):
+        return KitchenScheduler()
+    with open(path, encoding="utf-8") as file:
+        settings = json.load(file)
+    if not isinstance(settings, dict):
+        raise ValueError(f"{path} should hold an object with stations and prep_seconds.")
+    return KitchenScheduler(settings.get("stations"), settings.get("prep_seconds"),
+                            settings.get("default_station", DEFAULT_STATION),
+                            settings.get("default_prep_seconds", DEFAULT_PREP_SECONDS))
+
+def follow_orders(scheduler, order_repo, bus=None):
+    """
+    Send every order saved through order_repo to the kitchen, as the event bus reports it.
+
+    :param bus: the EventBus the repository publishes to (defaults to order_repo.bus)
+    :return: the Subscription, for EventBus.unsubscribe
+    """
+    def on_orders(events): # Runs on the bus's dispatch thread
+        order_ids = [event.item_id for event in events if event.action == "create"]
+        if order_ids:
+            scheduler.add_tickets(order_repo.iter_tickets(order_ids))
+
+    # No reload threshold: every new order ID is needed, however many arrive at once.
+    return (bus or order_repo.bus).subscribe_batches(on_orders, tables=("orders",), sources=(order_repo.db_name,),
+                                                     delay=0.02, reload_threshold=None)
+
+DISPLAY_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>body {{ font-family: sans-serif; }} li {{ margin: 0.5em 0; }} .late {{ color: #b00; }}</style></head>
+<body><h1>{title}</h1><ol id="items"></ol>
+<script>
+const items = new Map();
+function render() {{
+    const list = document.getElementById("items");
+    list.innerHTML = "";
+    const now = Date.now() / 1000;
+    [...items.values()].sort((a, b) => a.start_by - b.start_by || a.item_id - b.item_id).forEach(item => {{
+        const row = document.createElement("li");
+        if (item.start_by < now) row.className = "late";
+        row.textContent = `${{item.quantity}} ${{item.name}} (${{item.ticket_id.slice(0, 8)}}) `;
+        const button = document.createElement("button");
+        button.textContent = "Bump";
+        button.onclick = () => fetch(`/items/${{item.item_id}}/bump`, {{method: "POST"}});
+        row.appendChild(button);
+        list.appendChild(row);
+    }});
+}}
+const events = new EventSource({events});
+events.onmessage = message => {{
+    const event = JSON.parse(message.data);
+    if (event.type === "snapshot") {{ items.clear(); event.items.forEach(item => items.set(item.item_id, item)); }}
+    else if (event.type === "add") items.set(event.item.item_id, event.item);
+    else if (event.type === "done") items.delete(event.item_id);
+    render();
+}};
+setInterval(render, 5000);
+</script></body></html>
+"""
+
+class KitchenDisplayServer:
+    """
+    Serves kitchen displays over HTTP, pushing changes to them as server-sent events.
+
+    Endpoints:
+        GET  /                          links to every station's display
+        GET  /stations/<station>        the display page for a station ("all" for every station)
+        GET  /stations/<station>/items  the station's open items as JSON, most urgent first
+        GET  /stations/<station>/events a text/event-stream: a snapshot, then every change
+        POST /items/<id>/bump           mark an item as made
+    """
+    def __init__(self, scheduler):
+        """
+        Initialize the KitchenDisplayServer object.
+
+        :param scheduler: the KitchenScheduler to show and bump items in
+        """
+        self.scheduler = scheduler
+        self.loop = None
+        self.clients = {} # station -> set of asyncio.Queues, one per open event stream
+        scheduler.add_listener(self.on_change)
+
+    def on_change(self, station, event):
+        """Called by the scheduler on any thread; hands the event to the server's loop."""
+        if self.loop is not None and self.clients:
+            self.loop.call_soon_threadsafe(self.broadcast, station, event)
+
+    def broadcast(self, station, event):
+        """Queue an event for every display of its station and of all stations."""
+        for key in (station, "all"):
+            for queue in self.clients.get(key, ()):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull: # A slow display gets a fresh snapshot instead
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait({"type": "snapshot"})
+
+    def items(self, station):
+        """Return a station's open items (every station's, for "all") as JSON-ready dicts."""
+        if station == "all":
+            items = [item for name in self.scheduler.station_names() for item in self.scheduler.queue(name)]
+            items.sort(key=lambda item: (item.start_by, item.item_id))
+        else:
+            items = self.scheduler.queue(station)
+        return [item._asdict() for item in items]
+
+    async def handle(self, reader, writer):
+        """Serve one request. Event streams stay open until the display disconnects."""
+        try:
+            request_line = await reader.readline()
+            try:
+                method, path, _ = request_line.decode("latin-1").split()
+            except ValueError:
+                return
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass # Nothing here needs the headers, and bumps have no body
+            parts = [unquote(part) for part in path.split("?")[0].split("/") if part]
+            if len(parts) == 3 and parts[0] == "stations" and parts[2] == "events" and method == "GET":
+                await self.stream(parts[1], writer)
+                return
+            status, content_type, body = self.respond(method, parts)
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, method, parts):
+        """Return (status line, content type, body bytes) for a request that isn't an event stream."""
+        if method == "GET" and not parts:
+            links = "".join(f'<li><a href="/stations/{html.escape(quote(name, safe=""))}">{html.escape(name)}</a></li>'
+                            for name in ["all"] + self.scheduler.station_names())
+            return "200 OK", "text/html; charset=utf-8", f"<!DOCTYPE html><h1>Kitchen</h1><ul>{links}</ul>".encode()
+        if method == "GET" and len(parts) == 2 and parts[0] == "stations":
+            # The title goes into HTML, the events URL into a JavaScript string literal.
+            events = json.dumps(f"/stations/{quote(parts[1], safe='')}/events")
+            page = DISPLAY_PAGE.format(title=html.escape(parts[1]), events=events)
+            return "200 OK", "text/html; charset=utf-8", page.encode()
+        if method == "GET" and len(parts) == 3 and parts[0] == "stations" and parts[2] == "items":
+            return "200 OK", "application/json", json.dumps(self.items(parts[1])).encode()
+        if method == "POST" and len(parts) == 3 and parts[0] == "items" and parts[2] == "bump" and parts[1].isdigit():
+            try:
+                _, ticket_done = self.scheduler.bump(int(parts[1]))
+            except KeyError:
+                return "404 Not Found", "application/json", b'{"error": "No open item with that ID."}'
+            return "200 OK", "application/json", json.dumps({"ticket_done": ticket_done}).encode()
+        return "404 Not Found", "application/json", b'{"error": "Not found."}'
+
+    async def stream(self, station, writer):
+        """Send a station's items, then every change to them, until the display disconnects."""
+        queue = asyncio.Queue(maxsize=CLIENT_BACKLOG)
+        self.clients.setdefault(station, set()).add(queue)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Connection: keep-alive\r\n\r\n")
+            event = {"type": "snapshot"}
+            while True:
+                if event is None:
+                    writer.write(b": keep-alive\n\n")
+                else:
+                    if event["type"] == "snapshot":
+                        event = {"type": "snapshot", "items": self.items(station)}
+                    writer.write(b"data: " + json.dumps(event).encode() + b"\n\n")
+                await writer.drain()
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEP_ALIVE)
+                except asyncio.TimeoutError:
+                    event = None
+        finally:
+            self.clients[station].discard(queue)
+            if not self.clients[station]:
+                del self.clients[station]
+
+    async def serve(self, host, port, started=None):
+        """Run the server on the current event loop until cancelled."""
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle, host, port)
+        if started is not None:
+            started.set()
+        async with server:
+            await server.serve_forever()
+
+def start_kitchen_server(scheduler, port, host="127.0.0.1"):
+    """Serve kitchen displays on a background thread. Returns the KitchenDisplayServer once it is listening."""
+    display_server = KitchenDisplayServer(scheduler)
+    started = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            asyncio.run(display_server.serve(host, port, started))
+        except OSError as error: # Usually the port is taken
+            errors.append(error)
+            started.set()
+
+    threading.Thread(target=run, name="kitchen-displays", daemon=True).start()
+    started.wait()
+    if errors:
+        raise errors[0]
+    return display_server
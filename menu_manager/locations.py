@@ -0,0 +1,187 @@
+"""
+One set of databases per store location, and queries that run across all of them.
+
+Each location keeps its own menu.db, inventory.db, orders.db, and (optionally)
+promotions.json and kitchen.json in menu_manager/database/<location>/. The
+databases directly in menu_manager/database are used when no location is given,
+as before.
+
+LocationRouter hands out the repositories for a location and fans queries out to
+every location at once on a thread pool. sqlite3 releases the GIL while a query
+runs, and every thread gets its own connections, so the locations are read in
+parallel. The per-location results are then merged here.
+
+Usage:
+    python menu_manager/locations.py list
+    python menu_manager/locations.py stock "Burger Buns"
+    python menu_manager/locations.py sales --from 2024-05-01 --to 2024-05-31
+"""
+import argparse
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from analytics import SalesReport
+from connections import ConnectionManager
+from models import InventoryRepository, MenuRepository, OrderRepository
+from pricing import to_dollars
+
+DATA_DIR = "menu_manager/database"
+DATABASE_FILES = {
+    "menu": "menu.db", "inventory": "inventory.db", "orders": "orders.db",
+    "promotions": "promotions.json", "kitchen": "kitchen.json",
+}
+LOCATION_NAME = re.compile(r"[A-Za-z0-9_-]+")
+REPOSITORY_CLASSES = {"menu": MenuRepository, "inventory": InventoryRepository, "orders": OrderRepository}
+
+def database_paths(location=None, data_dir=DATA_DIR):
+    """
+    Return {"menu": path, "inventory": path, "orders": path, "promotions": path, "kitchen": path} for a location.
+
+    The location's folder is created if it doesn't exist yet.
+
+    :param location: the location's name (letters, digits, "-" and "_"), or None for the unsharded databases
+    :param data_dir: the folder holding every location's databases
+    """
+    folder = data_dir
+    if location is not None:
+        if not LOCATION_NAME.fullmatch(location):
+            raise ValueError(f"Invalid location name: {location!r}")
+        folder = os.path.join(data_dir, location)
+    os.makedirs(folder, exist_ok=True)
+    return {kind: os.path.join(folder, file_name) for kind, file_name in DATABASE_FILES.items()}
+
+class LocationRouter:
+    """Routes repository calls to the right location's databases, and runs queries across all locations."""
+    def __init__(self, locations=None, data_dir=DATA_DIR, connections=None, max_workers=8):
+        """
+        Initialize the LocationRouter object.
+
+        :param locations: the location names to use (defaults to every folder in data_dir)
+        :param data_dir: the folder holding every location's databases
+        :param connections: the ConnectionManager to share (defaults to a new one, closed by close())
+        :param max_workers: the most locations queried at the same time
+        """
+        self.data_dir = data_dir
+        self.configured_locations = list(locations) if locations is not None else None
+        self.owns_connections = connections is None
+        self.connections = connections or ConnectionManager()
+        self.repositories = {} # (location, kind) -> repository
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="location")
+
+    def locations(self):
+        """Return the location names, sorted."""
+        if self.configured_locations is not None:
+            return sorted(self.configured_locations)
+        if not os.path.isdir(self.data_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.data_dir)
+            if LOCATION_NAME.fullmatch(name) and os.path.isdir(os.path.join(self.data_dir, name))
+        )
+
+    def repository(self, location, kind):
+        """Return the repository of a kind ("menu", "inventory", or "orders") for a location, creating it once."""
+        key = (location, kind)
+        repository = self.repositories.get(key)
+        if repository is None:
+            with self.lock:
+                repository = self.repositories.get(key)
+                if repository is None:
+                    path = database_paths(location, self.data_dir)[kind]
+                    repository = self.repositories[key] = REPOSITORY_CLASSES[kind](path, self.connections)
+        return repository
+
+    def menu_repo(self, location):
+        """Return the MenuRepository for a location."""
+        return self.repository(location, "menu")
+
+    def inventory_repo(self, location):
+        """Return the InventoryRepository for a location."""
+        return self.repository(location, "inventory")
+
+    def order_repo(self, location):
+        """Return the OrderRepository for a location."""
+        return self.repository(location, "orders")
+
+    def fan_out(self, function, locations=None):
+        """
+        Call function(location) for every location in parallel.
+
+        :param function: called on a pool thread with each location's name
+        :param locations: the locations to query (defaults to all of them)
+        :return: a dict of location to result, in location order
+        :raises: the first location's exception, if any call fails
+        """
+        locations = self.locations() if locations is None else list(locations)
+        futures = [(location, self.pool.submit(function, location)) for location in locations]
+        return {location: future.result() for location, future in futures}
+
+    def stock_by_location(self, item_name):
+        """Return {location: quantity} of an inventory item, for the locations that stock it."""
+        found = self.fan_out(lambda location: self.inventory_repo(location).get_inventory_item_by_name(item_name))
+        return {location: item.quantity for location, item in found.items() if item is not None}
+
+    def total_stock(self, item_name):
+        """Return the quantity of an inventory item across every location."""
+        return sum(self.stock_by_location(item_name).values())
+
+    def search_inventory(self, text, limit=None):
+        """Return (location, InventoryItem) pairs matching text at any location, by location."""
+        found = self.fan_out(lambda location: self.inventory_repo(location).search_inventory_items(text, limit))
+        return [(location, item) for location, items in found.items() for item in items]
+
+    def menu_item_locations(self, name):
+        """Return {location: (MenuItem, id)} for the locations whose menu has an item called name."""
+        found = self.fan_out(lambda location: self.menu_repo(location).get_menu_item_by_name(name))
+        return {location: match for location, match in found.items() if match[0] is not None}
+
+    def sales_by_day(self, start_day, end_day=None):
+        """Return (day, orders, subtotal_cents, tax_cents, total_cents) rows summed across every location."""
+        found = self.fan_out(lambda location: SalesReport(self.order_repo(location)).daily_totals(start_day, end_day))
+        totals = {}
+        for rows in found.values():
+            for day, *amounts in rows:
+                sums = totals.setdefault(day, [0, 0, 0, 0])
+                for index, amount in enumerate(amounts):
+                    sums[index] += amount
+        return [(day, *totals[day]) for day in sorted(totals)]
+
+    def close(self):
+        """Stop the pool, and close the connections if this router opened them."""
+        self.pool.shutdown(wait=True)
+        if self.owns_connections:
+            self.connections.close_all()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Work with every store location's databases at once.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="the folder holding one folder per location")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the locations")
+    stock = commands.add_parser("stock", help="show an inventory item's quantity at every location")
+    stock.add_argument("item_name")
+    sales = commands.add_parser("sales", help="show daily sales summed across every location")
+    sales.add_argument("--from", dest="start_day", default=date.today().isoformat(), help="first day, YYYY-MM-DD (default today)")
+    sales.add_argument("--to", dest="end_day", help="last day, YYYY-MM-DD (default the first day)")
+    args = parser.parse_args(argv)
+
+    router = LocationRouter(data_dir=args.data_dir)
+    try:
+        if args.command == "list":
+            for location in router.locations():
+                print(location)
+        elif args.command == "stock":
+            stock_by_location = router.stock_by_location(args.item_name)
+            for location, quantity in stock_by_location.items():
+                print(f"{location}: {quantity}")
+            print(f"Total: {sum(stock_by_location.values())}")
+        else:
+            for day, orders, subtotal, tax, total in router.sales_by_day(args.start_day, args.end_day):
+                print(f"{day}  {orders:>7} orders  ${to_dollars(total)} (tax ${to_dollars(tax)})")
+    finally:
+        router.close()
+
+if __name__ == "__main__":
+    main()
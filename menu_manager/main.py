@@ -1,59 +1,231 @@
+import argparse
+import sqlite3
+import sys
+import time
 import tkinter as tk
 import tkinter.ttk as ttk
+from tkinter import filedialog
 from tkinter import messagebox as msgbox
-from models import *
+from connections import ConnectionManager
+from db_executor import DatabaseExecutor
+from events import EventBus
+from forecasting import ReorderEngine, format_forecast
+from instrumentation import Profiler, enable as enable_metrics, start_metrics_server, timed, write_log
+from journal import Journal
+from kitchen import follow_orders, load_scheduler, start_kitchen_server
+from locations import database_paths
+from models import INVENTORY_CATEGORIES, MENU_CATEGORIES, InventoryRepository, MenuItem, MenuRepository, Order, OrderRepository
+from order_writer import OrderWriter, describe, journal_path
+from pricing import to_dollars
+from promotions import PromotionEngine, load_promotions
+from rendering import format_for_path, get_renderer
+from search import words
+from views import ListRows, PagedRows, TextView, VirtualListView, inventory_row, menu_item_row, menu_text_lines
+
+# Seconds from launch until the menu is on screen. Going over prints a warning.
+STARTUP_BUDGET = 0.5
+
+# Seconds to wait for more changes before refreshing the views, so a burst of writes refreshes once.
+REFRESH_DELAY = 0.02
+
+# File types offered when saving the menu or a receipt. The extension picks the format.
+DOCUMENT_TYPES = [("Text", "*.txt"), ("HTML", "*.html"), ("ESC/POS printer data", "*.bin")]
+
+# How many items the Low Stock button lists before pointing at forecasting.py.
+LOW_STOCK_LINES = 20
+
+# Rows shown at once by the menu item and inventory lists. Only these rows are read from the database.
+LIST_HEIGHT = 10
+
+def category_choices(defaults, found):
+    """Return the categories for a dropdown: the defaults, then any others already in use."""
+    return list(defaults) + sorted(set(found) - set(defaults))
 
 # MENU
 
 class MenuManagerApp:
-    """The main application class. It is a Tkinter window with tabs for menu, menu items, orders, and inventory."""
-    def __init__(self, root):
+    """
+    The main application class. It is a Tkinter window with tabs for menu, menu items, orders, and inventory.
+
+    Only the Menu tab is built at startup. The other tabs are built the first time
+    they are selected, and every tab shares the catalog from one initial query.
+    """
+    def __init__(self, root, started_at=None, location=None, kitchen_port=None, kitchen_host="127.0.0.1"):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.startup_time = None # Seconds until the menu was first shown
         self.root = root
-        self.root.title("Menu Manager")
+        self.root.title(f"Menu Manager - {location}" if location else "Menu Manager")
         self.root.geometry("800x600")
-        self.menu_repo = MenuRepository("menu_manager/database/menu.db")
-        self.inventory_repo = InventoryRepository("menu_manager/database/inventory.db")
+        self.connections = ConnectionManager()
+        self.events = EventBus()
+        paths = database_paths(location)
+        self.menu_repo = MenuRepository(paths["menu"], self.connections, self.events)
+        self.inventory_repo = InventoryRepository(paths["inventory"], self.connections, self.events)
+        self.order_repo = OrderRepository(paths["orders"], self.connections, self.events)
+        self.reorder_engine = ReorderEngine(self.inventory_repo)
+        try:
+            self.promotions = load_promotions(paths["promotions"])
+        except (OSError, ValueError) as error:
+            msgbox.showwarning("Promotions", f"Promotions are off; {paths['promotions']} could not be read: {error}")
+            self.promotions = PromotionEngine()
+        self.db = DatabaseExecutor(self.root) # Every repository call goes through self.db.submit
+        # Orders and inventory edits are journaled before they are saved, and the writer thread
+        # also takes orders out of stock.
+        self.order_writer = OrderWriter(self.order_repo, journal=Journal(journal_path(paths["orders"])),
+                                        inventory_repo=self.inventory_repo, on_failure=self.on_write_failure)
+        self.events.subscribe_batches(self.on_repository_changes, tables=("menu_items", "inventory", "recipes"),
+                                      delay=REFRESH_DELAY)
+        if kitchen_port:
+            self.start_kitchen(paths["kitchen"], kitchen_port, kitchen_host)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.menu_items = None # The latest catalog, shared by every tab
+        self.built_tabs = set()
+        self.menu_searches = {} # Tab -> search box text, for the tabs that list menu items
+        self.menu_matches = {} # Tab -> ListRows of the items matching its search box, or None to show everything
+        # The menu item and inventory lists page through these, in (category, name) and id order.
+        self.menu_pages = PagedRows(self.menu_repo.page_menu_items, self.menu_repo.count_menu_items,
+                                    key=lambda row: (row[1].category, row[1].name))
+        self.inventory_pages = PagedRows(self.inventory_repo.page_inventory_items,
+                                         self.inventory_repo.count_inventory_items, key=lambda item: item.id)
+
+        # Load the catalog once for every tab. The repositories connect on the database thread.
+        self.db.submit(self.menu_repo.get_all_menu_items, on_done=self.show_menu)
 
         # Create a notebook for tabs
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(pady=10, expand=True)
 
-        # Create menu tab
+        # Create the tab frames. Their contents are built when first selected.
         self.menu_tab = tk.Frame(self.notebook)
         self.notebook.add(self.menu_tab, text="Menu")
-
-        # Create text widget to display menu
-        self.menu_text = tk.Text(self.menu_tab, width=80, height=20)
-        self.menu_text.pack(pady=10)
-        self.menu_text.config(state="disabled")
-        self.update_menu_text()
-
-        # Create menu items tab
         self.menu_items_tab = tk.Frame(self.notebook)
         self.notebook.add(self.menu_items_tab, text="Menu Items")
-        self.create_menu_items_tab()
-
-        # Create orders tab
         self.orders_tab = tk.Frame(self.notebook)
         self.notebook.add(self.orders_tab, text="Orders")
-        self.create_orders_tab()
-
-        # Create inventory tab
         self.inventory_tab = tk.Frame(self.notebook)
         self.notebook.add(self.inventory_tab, text="Inventory")
-        self.create_inventory_tab()
-    
-    def update_menu_text(self):
-        """Updates the menu text in the text widget."""
-        self.menu_text.config(state="normal")
-        self.menu_text.delete(1.0, tk.END)
-        menu_items = self.menu_repo.get_all_menu_items()
-        for category, items in menu_items.items():
-            self.menu_text.insert(tk.END, f"{category}:\n")
-            for item in items:
-                self.menu_text.insert(tk.END, f"  {item}\n")
-            self.menu_text.insert(tk.END, "\n")
+        self.tab_builders = {
+            self.menu_tab: self.create_menu_tab,
+            self.menu_items_tab: self.create_menu_items_tab,
+            self.orders_tab: self.create_orders_tab,
+            self.inventory_tab: self.create_inventory_tab,
+        }
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.build_tab(self.menu_tab)
+
+    @timed("ui.on_tab_changed")
+    def on_tab_changed(self, event):
+        """Builds the selected tab if this is the first time it has been shown."""
+        self.build_tab(self.notebook.nametowidget(self.notebook.select()))
+
+    def build_tab(self, tab):
+        """Builds a tab's widgets, once."""
+        if tab not in self.built_tabs:
+            self.built_tabs.add(tab)
+            self.tab_builders[tab]()
+
+    def create_menu_tab(self):
+        """Creates the menu tab."""
+
+        # Create text widget to display menu
+        self.menu_text = tk.Text(self.menu_tab, width=80, height=20)
+        self.menu_text.pack(pady=10)
         self.menu_text.config(state="disabled")
+        self.menu_text_view = TextView(self.menu_text)
+
+        # Create button to save the menu as a document
+        self.save_menu_button = tk.Button(self.menu_tab, text="Save Menu", command=self.save_menu_document)
+        self.save_menu_button.pack()
+        if self.menu_items is not None:
+            self.show_menu_text(self.menu_items)
+
+    @timed("ui.save_menu_document")
+    def save_menu_document(self):
+        """Saves the menu as a text, HTML, or ESC/POS file, chosen by the file extension."""
+        if self.menu_items is None:
+            return
+        path = filedialog.asksaveasfilename(title="Save Menu", defaultextension=".txt", filetypes=DOCUMENT_TYPES)
+        if path:
+            self.save_document(path, lambda renderer, stream: renderer.menu(self.menu_items, stream))
+
+    def save_document(self, path, render):
+        """Opens path for the format its extension names and calls render(renderer, stream)."""
+        renderer = get_renderer(format_for_path(path))
+        try:
+            if renderer.encoding:
+                with open(path, "wb") as stream:
+                    render(renderer, stream)
+            else:
+                with open(path, "w", encoding="utf-8") as stream:
+                    render(renderer, stream)
+        except OSError as error:
+            msgbox.showerror("Error", f"Could not save {path}: {error}")
+
+    def start_kitchen(self, kitchen_file, port, host="127.0.0.1"):
+        """Sends completed orders to kitchen displays served on host and port."""
+        try:
+            self.kitchen = load_scheduler(kitchen_file)
+            start_kitchen_server(self.kitchen, port, host)
+        except (OSError, ValueError) as error:
+            msgbox.showwarning("Kitchen", f"Kitchen displays are off: {error}")
+            return
+        follow_orders(self.kitchen, self.order_repo, self.events)
+
+    def close(self):
+        """Saves any queued orders, closes the database connections, and closes the window."""
+        self.events.close()
+        self.db.shutdown()
+        self.order_writer.close()
+        self.connections.close_all()
+        self.root.destroy()
+
+    def on_write_failure(self, entry, error):
+        """Called on the order writer's thread when a journaled order or inventory edit can never be saved."""
+        self.db.call_soon(msgbox.showerror, "Error", f"Could not save the {describe(entry)}: {error}")
+
+    def on_repository_changes(self, events):
+        """Called on the event bus thread with a coalesced batch of committed changes."""
+        self.db.call_soon(self.run_refreshes, events)
+
+    @timed("ui.run_refreshes")
+    def run_refreshes(self, events):
+        """Refreshes the views for every table changed in a batch of events."""
+        tables = {event.table for event in events}
+        if "menu_items" in tables:
+            self.db.submit(self.menu_pages.invalidate)
+            self.db.submit(self.menu_repo.get_all_menu_items, on_done=self.show_menu)
+            for tab, search_text in self.menu_searches.items():
+                if self.menu_matches.get(tab) is not None:
+                    self.filter_menu_list(tab, search_text.get())
+        if "inventory" in tables:
+            self.db.submit(self.inventory_pages.invalidate)
+            if self.inventory_tab in self.built_tabs:
+                self.refresh_inventory_list()
+        if "menu_items" not in tables and tables & {"inventory", "recipes"}:
+            self.update_menu_availability()
+
+    @timed("ui.show_menu")
+    def show_menu(self, menu_items):
+        """Stores the latest catalog and brings every built view of the menu up to date."""
+        self.menu_items = menu_items
+        if self.menu_tab in self.built_tabs:
+            self.show_menu_text(menu_items)
+        if self.menu_items_tab in self.built_tabs:
+            self.show_menu_items_list(menu_items)
+        if self.orders_tab in self.built_tabs:
+            self.show_available_menu_items(menu_items)
+        if self.startup_time is None:
+            self.root.after_idle(self.record_startup_time)
+
+    def record_startup_time(self):
+        """Records how long it took from launch until the menu was on screen."""
+        self.startup_time = time.perf_counter() - self.started_at
+        if self.startup_time > STARTUP_BUDGET:
+            print(f"Warning: startup took {self.startup_time:.3f}s (budget {STARTUP_BUDGET}s)", file=sys.stderr)
+
+    def show_menu_text(self, menu_items):
+        """Shows menu items grouped by category in the menu text widget."""
+        self.menu_text_view.sync(menu_text_lines(menu_items))
 
     def clear_form_fields(self, form_type=None):
         """Clears the form fields for menu items and inventory items."""
@@ -70,15 +242,71 @@ class MenuManagerApp:
         else:
             raise ValueError("Invalid form type")
 
+    def create_search_box(self, tab, on_search):
+        """Creates a Search box at the top of a tab. on_search(text) is called every time its text changes."""
+        search_text = tk.StringVar()
+        search_label = tk.Label(tab, text="Search:")
+        search_label.pack()
+        search_entry = tk.Entry(tab, textvariable=search_text)
+        search_entry.pack()
+        search_text.trace_add("write", lambda *args: on_search(search_text.get()))
+        return search_text
+
+    def create_list(self, tab, format_row, on_render=None):
+        """Creates a Listbox with a scrollbar on a tab, and returns the VirtualListView that fills it."""
+        frame = tk.Frame(tab)
+        frame.pack()
+        listbox = tk.Listbox(frame)
+        listbox.pack(side=tk.LEFT)
+        scrollbar = tk.Scrollbar(frame, orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        return VirtualListView(listbox, scrollbar, self.db.submit, format_row, LIST_HEIGHT, on_render)
+
+    def find_menu_items(self, text):
+        """
+        Returns ListRows of the menu items matching text, or None if text is blank. Runs on the database thread.
+
+        Names are matched as they are typed with the catalog's prefix trie, and
+        descriptions and categories through the full-text index. Matches are sorted
+        by category and name, like the full list.
+        """
+        if not words(text):
+            return None
+        matches = dict(self.menu_repo.complete_menu_items(text) + self.menu_repo.search_menu_items(text))
+        return ListRows(sorted(matches.items(), key=lambda row: (row[1].category, row[1].name)))
+
+    @timed("ui.filter_menu_list")
+    def filter_menu_list(self, tab, text):
+        """Narrows a tab's list of menu items to those matching text."""
+        self.db.submit(self.find_menu_items, text, on_done=lambda matches: self.show_menu_matches(tab, matches))
+
+    def menu_list_source(self, tab):
+        """Returns the rows a tab's menu item list shows: its search matches, or every menu item."""
+        matches = self.menu_matches.get(tab)
+        return self.menu_pages if matches is None else matches
+
+    @timed("ui.show_menu_matches")
+    def show_menu_matches(self, tab, matches):
+        """Shows only the menu items in matches on a tab, or all of them if matches is None."""
+        self.menu_matches[tab] = matches
+        if tab is self.menu_items_tab:
+            self.menu_items_view.set_source(self.menu_list_source(tab))
+        elif tab is self.orders_tab:
+            self.available_menu_items_view.set_source(self.menu_list_source(tab))
+
         # MENU ITEMS
 
     
     def create_menu_items_tab(self):
         """Creates GUI elements for menu items tab."""
 
+        # Create search box to filter the menu items as you type
+        self.menu_searches[self.menu_items_tab] = self.create_search_box(
+            self.menu_items_tab, lambda text: self.filter_menu_list(self.menu_items_tab, text))
+
         # Create listbox to display menu items
-        self.menu_items_listbox = tk.Listbox(self.menu_items_tab)
-        self.menu_items_listbox.pack()
+        self.menu_items_view = self.create_list(self.menu_items_tab, menu_item_row)
+        self.menu_items_listbox = self.menu_items_view.listbox
 
         # Create Edit button
         self.edit_button = tk.Button(self.menu_items_tab, text="Edit", command=self.edit_menu_item)
@@ -115,8 +343,7 @@ class MenuManagerApp:
         # Create Category dropdown
         self.category_label = tk.Label(self.menu_items_tab, text="Category:")
         self.category_label.pack()
-        categories = list(self.menu_repo.get_all_menu_items().keys())
-        self.category_entry = ttk.Combobox(self.menu_items_tab, values=categories)
+        self.category_entry = ttk.Combobox(self.menu_items_tab)
         self.category_entry.pack()
 
         # Create Save button
@@ -124,51 +351,57 @@ class MenuManagerApp:
         self.save_button.pack()
 
         # Populate menu items list
-        self.update_menu_items_list()
+        self.menu_items_view.set_source(self.menu_list_source(self.menu_items_tab))
+        if self.menu_items is not None:
+            self.category_entry.config(values=category_choices(MENU_CATEGORIES, self.menu_items))
 
-    def update_menu_items_list(self):
-        """Updates the menu items list in the listbox."""
-        self.menu_items_listbox.delete(0, tk.END)
-        menu_items = self.menu_repo.get_all_menu_items()
-        for category, items in menu_items.items():
-            for item in items:
-                self.menu_items_listbox.insert(tk.END, item.name)
+    def show_menu_items_list(self, menu_items):
+        """Refreshes the menu items listbox, and shows the categories in the dropdown."""
+        self.menu_items_view.refresh()
+        self.category_entry.config(values=category_choices(MENU_CATEGORIES, menu_items))
 
+    @timed("ui.edit_menu_item")
     def edit_menu_item(self):
         """Populates the form fields with the selected menu item's details for editing."""
-        # print("Edit menu item") # TESTING PURPOSES ONLY
-        index = self.menu_items_listbox.curselection()
-        if index:
-            menu_item_name = self.menu_items_listbox.get(index[0])
-            menu_item, menu_item_id = self.menu_repo.get_menu_item_by_name(menu_item_name)
-            if menu_item and menu_item_id:
-                self.name_entry.delete(0, tk.END)
-                self.name_entry.insert(0, menu_item.name)
-                self.description_entry.delete(0, tk.END)
-                self.description_entry.insert(0, menu_item.description)
-                self.price_entry.delete(0, tk.END)
-                self.price_entry.insert(tk.END, str(menu_item.price))
-                self.calories_entry.delete(0, tk.END)
-                self.calories_entry.insert(tk.END, str(menu_item.calories))
-                self.category_entry.set(menu_item.category)
-                self.category_entry.update_idletasks()
-
-                self.current_menu_item_id = menu_item_id  # Store ID for future use.
+        row = self.menu_items_view.selected()
+        if row:
+            self.db.submit(self.menu_repo.get_menu_item_by_name, row[1].name, on_done=self.fill_menu_item_form)
+
+    @timed("ui.fill_menu_item_form")
+    def fill_menu_item_form(self, found):
+        """Fills the menu item form with a (menu_item, menu_item_id) pair from the repository."""
+        menu_item, menu_item_id = found
+        if menu_item and menu_item_id:
+            self.name_entry.delete(0, tk.END)
+            self.name_entry.insert(0, menu_item.name)
+            self.description_entry.delete(0, tk.END)
+            self.description_entry.insert(0, menu_item.description)
+            self.price_entry.delete(0, tk.END)
+            self.price_entry.insert(tk.END, str(menu_item.price))
+            self.calories_entry.delete(0, tk.END)
+            self.calories_entry.insert(tk.END, str(menu_item.calories))
+            self.category_entry.set(menu_item.category)
+            self.category_entry.update_idletasks()
+
+            self.current_menu_item_id = menu_item_id  # Store ID for future use.
 
+    @timed("ui.delete_menu_item")
     def delete_menu_item(self):
         """Deletes the selected menu item from the database."""
-        # print("Delete menu item") # TESTING PURPOSES ONLY
-        index = self.menu_items_listbox.curselection()
-        if index:
-            menu_item_name = self.menu_items_listbox.get(index[0])
-            menu_item, menu_item_id = self.menu_repo.get_menu_item_by_name(menu_item_name)
-            if menu_item and menu_item_id:
-                self.menu_repo.delete_menu_item(menu_item_id)
-                self.update_menu_items_list()
+        row = self.menu_items_view.selected()
+        if row:
+            menu_item_name = row[1].name
 
+            def delete(): # Runs on the database thread
+                menu_item, menu_item_id = self.menu_repo.get_menu_item_by_name(menu_item_name)
+                if menu_item and menu_item_id:
+                    self.menu_repo.delete_menu_item(menu_item_id)
+
+            self.db.submit(delete)
+
+    @timed("ui.save_menu_item")
     def save_menu_item(self):
         """Saves the updated or new menu item to the database."""
-        print("Save menu item") # TESTING PURPOSES ONLY
         menu_item_name = self.name_entry.get().strip()
         menu_item_description = self.description_entry.get().strip()
         menu_item_price = self.price_entry.get().strip()
@@ -191,17 +424,28 @@ class MenuManagerApp:
 
         if hasattr(self, "current_menu_item_id") and self.current_menu_item_id:
             # Update existing menu item
-            self.menu_repo.update_menu_item(self.current_menu_item_id, menu_item)
-            msgbox.showinfo("Success", "Menu item updated successfully.")
+            self.db.submit(self.menu_repo.update_menu_item, self.current_menu_item_id, menu_item,
+                           on_done=lambda _: self.menu_item_saved("Menu item updated successfully."),
+                           on_error=lambda error: self.menu_item_save_failed(error, menu_item_name))
             del self.current_menu_item_id
         else:
             # Create new menu item
-            self.menu_repo.create_menu_item(menu_item)
-            msgbox.showinfo("Success", "Menu item created successfully.")
-
-        self.update_menu_items_list()
+            self.db.submit(self.menu_repo.create_menu_item, menu_item,
+                           on_done=lambda _: self.menu_item_saved("Menu item created successfully."),
+                           on_error=lambda error: self.menu_item_save_failed(error, menu_item_name))
+
+    @timed("ui.menu_item_saved")
+    def menu_item_saved(self, message):
+        """Confirms a saved menu item. The menu displays refresh themselves from the change event."""
+        msgbox.showinfo("Success", message)
         self.clear_form_fields("menu_item") # Clear input fields after saving
-        self.update_menu_text()
+
+    def menu_item_save_failed(self, error, menu_item_name):
+        """Reports a menu item that could not be saved."""
+        if isinstance(error, sqlite3.IntegrityError): # Menu item names are unique
+            msgbox.showerror("Error", f"A menu item named '{menu_item_name}' already exists.")
+        else:
+            msgbox.showerror("Error", f"The menu item could not be saved: {error}")
 
 
 
@@ -211,21 +455,22 @@ class MenuManagerApp:
         """Creates the orders tab."""
 
         # Initialize self.order
-        self.order = Order()
+        self.order = Order(self.promotions)
 
         # Create label to display "Order"
         self.order_label = tk.Label(self.orders_tab, text="Order")
         self.order_label.pack()
 
-        # Create listbox to display available menu items
-        self.available_menu_items_listbox = tk.Listbox(self.orders_tab)
-        self.available_menu_items_listbox.pack()
+        # Create search box to filter the available menu items as you type
+        self.menu_searches[self.orders_tab] = self.create_search_box(
+            self.orders_tab, lambda text: self.filter_menu_list(self.orders_tab, text))
+
+        # Create listbox to display available menu items, greyed out as they are shown if they can't be made
+        self.available_menu_items_view = self.create_list(self.orders_tab, menu_item_row, self.update_menu_availability)
+        self.available_menu_items_listbox = self.available_menu_items_view.listbox
 
         # Populate listbox with available menu items
-        menu_items = self.menu_repo.get_all_menu_items()
-        for category, items in menu_items.items():
-            for item in items:
-                self.available_menu_items_listbox.insert(tk.END, item.name)
+        self.available_menu_items_view.set_source(self.menu_list_source(self.orders_tab))
 
         # Create button to add item to order
         self.add_item_button = tk.Button(self.orders_tab, text="Add Item", command=self.add_item_to_order)
@@ -235,7 +480,9 @@ class MenuManagerApp:
         self.order_listbox = tk.Listbox(self.orders_tab)
         self.order_listbox.pack()
 
-        # Create labels to display subtotal, tax, and total
+        # Create labels to display discounts, subtotal, tax, and total
+        self.discount_label = tk.Label(self.orders_tab, text="Discounts: $0.00")
+        self.discount_label.pack()
         self.subtotal_label = tk.Label(self.orders_tab, text="Subtotal: $0.00")
         self.subtotal_label.pack()
         self.tax_label = tk.Label(self.orders_tab, text="Tax: $0.00")
@@ -243,46 +490,151 @@ class MenuManagerApp:
         self.total_label = tk.Label(self.orders_tab, text="Total: $0.00")
         self.total_label.pack()
 
+        # Create button to complete order
+        self.complete_order_button = tk.Button(self.orders_tab, text="Complete Order", command=self.complete_order)
+        self.complete_order_button.pack()
+
+        # Create button to save the last completed order's receipt
+        self.last_ticket = None
+        self.save_receipt_button = tk.Button(self.orders_tab, text="Save Receipt", command=self.save_receipt)
+        self.save_receipt_button.pack()
+
         # Create button to clear order
         self.clear_order_button = tk.Button(self.orders_tab, text="Clear Order", command=self.clear_order)
         self.clear_order_button.pack()
 
+    @timed("ui.add_item_to_order")
     def add_item_to_order(self):
         """Adds the selected menu item to the order and updates the order display."""
-        index = self.available_menu_items_listbox.curselection()
-        if index and index[0] >= 0:
-            menu_item_name = self.available_menu_items_listbox.get(index[0])
-            selected_item = self.menu_repo.get_menu_item_by_name(menu_item_name)
-            if selected_item:
-                # print(f"Selected item: {selected_item[0].name}, Price: {selected_item[0].price}") # TESTING PURPOSES ONLY
-                menu_item, _ = selected_item # Extract the MenuItem object from the tuple. THIS WAS DIFFICULT TO FIGURE OUT FOR ME
-                self.order.add_item(menu_item)
-                self.order_listbox.insert(tk.END, menu_item_name)
-                subtotal, tax, total = self.order.total_cost()
-                self.subtotal_label.config(text=f"Subtotal: ${subtotal:.2f}")
-                self.tax_label.config(text=f"Tax: ${tax:.2f}")
-                self.total_label.config(text=f"Total: ${total:.2f}")
-            else:
-                msgbox.showerror("Error", "Item not found in menu.")
+        row = self.available_menu_items_view.selected()
+        if row:
+            menu_item_name = row[1].name
+
+            def look_up(): # Runs on the database thread
+                menu_item, menu_item_id = self.menu_repo.get_menu_item_by_name(menu_item_name)
+                return menu_item, menu_item_id, self.inventory_repo.get_availability().servings_left(menu_item_id)
+
+            self.db.submit(look_up, on_done=self.add_found_item_to_order)
         else:
             msgbox.showerror("Error", "Please select an item from the menu.")
 
+    @timed("ui.add_found_item_to_order")
+    def add_found_item_to_order(self, found):
+        """Adds a (menu_item, menu_item_id, servings_left) lookup result to the order."""
+        menu_item, menu_item_id, servings_left = found
+        if menu_item:
+            already_ordered = self.order.lines.get(menu_item_id, 0)
+            if servings_left is not None and servings_left < already_ordered + 1:
+                msgbox.showerror("Error", f"There is not enough inventory to make another {menu_item.name}.")
+                return
+            self.order.add_item(menu_item, menu_item_id)
+            self.order_listbox.insert(tk.END, menu_item.name)
+            self.show_order_totals()
+        else:
+            msgbox.showerror("Error", "Item not found in menu.")
+
+    def show_order_totals(self):
+        """Updates the discount, subtotal, tax, and total labels from the current order."""
+        subtotal, tax, total = self.order.total_cost()
+        self.discount_label.config(text=f"Discounts: -${to_dollars(self.order.discount_cents)}"
+                                   if self.order.discount_cents else "Discounts: $0.00")
+        self.subtotal_label.config(text=f"Subtotal: ${subtotal:.2f}")
+        self.tax_label.config(text=f"Tax: ${tax:.2f}")
+        self.total_label.config(text=f"Total: ${total:.2f}")
+
+    @timed("ui.complete_order")
+    def complete_order(self):
+        """
+        Journals the order, saves it and takes it out of stock in the background, and starts a new one.
+
+        The journal write (and its fsync) runs on the database thread, so the register
+        is free for the next order straight away. The finished order is kept aside
+        until the journal has it, and put back on screen if it couldn't be recorded.
+        """
+        if not self.order.lines:
+            msgbox.showerror("Error", "The order is empty.")
+            return
+        order, ticket = self.order, self.order.to_ticket()
+        self.order = Order(self.promotions)
+        self.order_listbox.delete(0, tk.END)
+        self.show_order_totals()
+        self.db.submit(self.order_writer.submit, ticket,
+                       on_done=lambda _: self.order_recorded(ticket),
+                       on_error=lambda error: self.order_not_recorded(order, error))
+
+    def order_recorded(self, ticket):
+        """Called on the main thread once a completed order is safely in the journal."""
+        self.last_ticket = ticket
+
+    def order_not_recorded(self, order, error):
+        """Called on the main thread when a completed order couldn't be written to the journal."""
+        if not self.order.lines:
+            # Nothing has been rung up since, so put the order back to be completed again.
+            self.order = order
+            self.order_listbox.delete(0, tk.END)
+            for item in order.items:
+                self.order_listbox.insert(tk.END, item.name)
+            self.show_order_totals()
+        msgbox.showerror("Error", f"Could not record the order: {error}")
+
+    @timed("ui.save_receipt")
+    def save_receipt(self):
+        """Saves the receipt for the last completed order."""
+        if self.last_ticket is None:
+            msgbox.showerror("Error", "Complete an order first.")
+            return
+        ticket = self.last_ticket
+        path = filedialog.asksaveasfilename(title="Save Receipt", defaultextension=".txt", filetypes=DOCUMENT_TYPES)
+        if path:
+            self.save_document(path, lambda renderer, stream: renderer.receipt(ticket, stream))
+
+    def show_available_menu_items(self, menu_items):
+        """Refreshes the menu items that can be ordered in the Orders tab's listbox."""
+        self.available_menu_items_view.refresh()
+
+    def update_menu_availability(self, rows=None):
+        """
+        Greys out menu items on the Orders tab that the current inventory can't make.
+
+        :param rows: the (id, MenuItem) rows on screen (defaults to the ones shown now)
+        """
+        if self.orders_tab not in self.built_tabs:
+            return
+        if rows is None:
+            rows = self.available_menu_items_view.rows
+        menu_item_ids = [menu_item_id for menu_item_id, _ in rows]
+
+        def check(): # Runs on the database thread
+            availability = self.inventory_repo.get_availability()
+            return [availability.can_make(menu_item_id) for menu_item_id in menu_item_ids]
+
+        self.db.submit(check, on_done=self.show_menu_availability)
+
+    @timed("ui.show_menu_availability")
+    def show_menu_availability(self, can_make):
+        """Colors the Orders tab's listbox rows from a list of booleans."""
+        # The list may have scrolled to fewer rows since; its own check will follow.
+        for index, available in enumerate(can_make[:self.available_menu_items_listbox.size()]):
+            self.available_menu_items_listbox.itemconfig(index, foreground="black" if available else "grey")
+
+    @timed("ui.clear_order")
     def clear_order(self):
         """Clears the order."""
-        self.order.items = []
+        self.order.clear()
         self.order_listbox.delete(0, tk.END)
-        self.subtotal_label.config(text="Subtotal: $0.00")
-        self.tax_label.config(text="Tax: $0.00")
-        self.total_label.config(text="Total: $0.00")
+        self.show_order_totals()
 
     # INVENTORY
 
     def create_inventory_tab(self):
         """Creates the inventory tab."""
 
+        # Create search box to filter the inventory as you type
+        self.inventory_search = self.create_search_box(self.inventory_tab, lambda text: self.update_inventory_listbox())
+
         # Create listbox to display inventory items
-        self.inventory_listbox = tk.Listbox(self.inventory_tab)
-        self.inventory_listbox.pack()
+        self.inventory_view = self.create_list(self.inventory_tab, inventory_row)
+        self.inventory_listbox = self.inventory_view.listbox
 
         # Create form to add new items
         self.add_item_label = tk.Label(self.inventory_tab, text="Add Item:")
@@ -297,8 +649,7 @@ class MenuManagerApp:
         self.add_item_quantity_entry.pack()
         self.add_item_category_label = tk.Label(self.inventory_tab, text="Category:")
         self.add_item_category_label.pack()
-        categories = ["Food", "Cleaning Supplies", "Misc"]
-        self.add_item_category_entry = ttk.Combobox(self.inventory_tab, values=categories)
+        self.add_item_category_entry = ttk.Combobox(self.inventory_tab, values=list(INVENTORY_CATEGORIES))
         self.add_item_category_entry.pack()
         self.add_item_button = tk.Button(self.inventory_tab, text="Save", command=self.add_item_to_inventory)
         self.add_item_button.pack()
@@ -308,70 +659,101 @@ class MenuManagerApp:
         self.edit_item_button.pack()
         self.delete_item_button = tk.Button(self.inventory_tab, text="Delete Item", command=self.delete_item_from_inventory)
         self.delete_item_button.pack()
+        self.low_stock_button = tk.Button(self.inventory_tab, text="Low Stock", command=self.show_low_stock)
+        self.low_stock_button.pack()
 
         # Populate listbox with inventory items
+        self.current_inventory_item_id = None
         self.update_inventory_listbox()
+        self.db.submit(self.inventory_repo.get_inventory_categories, on_done=self.show_inventory_categories)
 
+    @timed("ui.add_item_to_inventory")
     def add_item_to_inventory(self):
         """Adds a new item to the inventory, or updates an existing item if self.current_inventory_item_id is set."""
         item_name = self.add_item_name_entry.get()
         quantity = int(self.add_item_quantity_entry.get())
         category = self.add_item_category_entry.get()
+        self.db.submit(self.inventory_repo.get_inventory_item_by_name, item_name,
+                       on_done=lambda existing_item: self.save_inventory_item(existing_item, item_name, quantity, category))
 
-        existing_item = self.inventory_repo.get_inventory_item_by_name(item_name)
-
+    @timed("ui.save_inventory_item")
+    def save_inventory_item(self, existing_item, item_name, quantity, category):
+        """Creates or updates an inventory item once any existing item with the same name has been looked up."""
         if existing_item and not self.current_inventory_item_id:
             confirm_message = f"An item with the name '{item_name}' already exists. Do you want to update it?"
             confirm = msgbox.askyesno("Confirm Update", confirm_message)
 
             if confirm:
-                self.current_inventory_item_id = existing_item["id"]
+                self.current_inventory_item_id = existing_item.id
             else:
                 return
 
-        self.current_inventory_item_id = existing_item["id"] if existing_item else None
+        self.current_inventory_item_id = existing_item.id if existing_item else None
         if self.current_inventory_item_id:
-            self.inventory_repo.update_inventory_item(self.current_inventory_item_id, item_name, quantity, category)
+            self.db.submit(self.order_writer.submit_edit, "update", self.current_inventory_item_id, item_name, quantity, category)
         else:
-            self.inventory_repo.create_inventory_item(item_name, quantity, category)
+            self.db.submit(self.order_writer.submit_edit, "create", item_name, quantity, category)
 
-        self.update_inventory_listbox()
         self.clear_form_fields("inventory_item")
         self.current_inventory_item_id = None
 
     def update_inventory_listbox(self):
-        """Updates the listbox with the inventory items."""
-        self.inventory_listbox.delete(0, tk.END)
-        inventory_repo = InventoryRepository("menu_manager/database/inventory.db")
-        inventory_items = inventory_repo.get_all_inventory_items()
-        for item in inventory_items:
-            self.inventory_listbox.insert(tk.END, f"{item['item_name']} - {item['quantity']} - {item['category']}")
+        """Shows the inventory items that match the search box in the listbox, from the top."""
+        search_text = self.inventory_search.get()
+        if words(search_text):
+            self.db.submit(self.inventory_repo.search_inventory_items, search_text,
+                           on_done=lambda items: self.inventory_view.set_source(ListRows(items)))
+        else:
+            self.inventory_view.set_source(self.inventory_pages)
 
+    def refresh_inventory_list(self):
+        """Brings the inventory listbox and category dropdown up to date after the inventory changed."""
+        if words(self.inventory_search.get()):
+            self.update_inventory_listbox()
+        else:
+            self.inventory_view.refresh()
+        self.db.submit(self.inventory_repo.get_inventory_categories, on_done=self.show_inventory_categories)
+
+    def show_inventory_categories(self, categories):
+        """Offers the usual inventory categories and any others in use in the category dropdown."""
+        self.add_item_category_entry.config(values=category_choices(INVENTORY_CATEGORIES, categories))
+
+    @timed("ui.edit_item_in_inventory")
     def edit_item_in_inventory(self):
         """Populates the form fields with the selected inventory item's details for editing."""
-        index = self.inventory_listbox.curselection()
-        # print("Index:", index) # TESTING PURPOSES ONLY
-        if index:
-            inventory_item_name = self.inventory_listbox.get(index[0])
-            # print("Inventory item name:", inventory_item_name) # TESTING PURPOSES ONLY
-            # Extract just the item name from the string
-            item_name = inventory_item_name.split(' - ')[0]
-            # print("Item name:", item_name) # TESTING PURPOSES ONLY
-            inventory_item = self.inventory_repo.get_inventory_item_by_name(item_name)
-            # print("Inventory item:", inventory_item) # TESTING PURPOSES ONLY
-            if inventory_item:
-                self.add_item_name_entry.delete(0, tk.END)
-                self.add_item_name_entry.insert(0, inventory_item["name"])
-                # print("Add item name entry:", self.add_item_name_entry.get()) # TESTING PURPOSES ONLY
-                self.add_item_quantity_entry.delete(0, tk.END)
-                self.add_item_quantity_entry.insert(tk.END, str(inventory_item["quantity"]))
-                # print("Add item quantity entry:", self.add_item_quantity_entry.get()) # TESTING PURPOSES ONLY
-                self.add_item_category_entry.set(inventory_item["category"])
-                # print("Add item category entry:", self.add_item_category_entry.get()) # TESTING PURPOSES ONLY
-                self.add_item_category_entry.update_idletasks()
-
-                self.current_inventory_item_id = inventory_item["id"]  # Store ID for future use.
+        inventory_item = self.inventory_view.selected()
+        if inventory_item:
+            self.db.submit(self.inventory_repo.get_inventory_item, inventory_item.id, on_done=self.fill_inventory_item_form)
+
+    @timed("ui.fill_inventory_item_form")
+    def fill_inventory_item_form(self, inventory_item):
+        """Fills the inventory form with an inventory item from the repository."""
+        if inventory_item:
+            self.add_item_name_entry.delete(0, tk.END)
+            self.add_item_name_entry.insert(0, inventory_item.item_name)
+            self.add_item_quantity_entry.delete(0, tk.END)
+            self.add_item_quantity_entry.insert(tk.END, str(inventory_item.quantity))
+            self.add_item_category_entry.set(inventory_item.category)
+            self.add_item_category_entry.update_idletasks()
+
+            self.current_inventory_item_id = inventory_item.id  # Store ID for future use.
 
+    @timed("ui.show_low_stock")
+    def show_low_stock(self):
+        """Lists the inventory items that are low on stock, and how much of each to reorder."""
+        self.db.submit(self.reorder_engine.low_stock, on_done=self.show_low_stock_report)
+
+    def show_low_stock_report(self, low_stock):
+        """Shows the low-stock forecasts in a message box."""
+        if not low_stock:
+            msgbox.showinfo("Low Stock", "Nothing is low on stock.")
+            return
+        lines = [format_forecast(forecast) for forecast in low_stock[:LOW_STOCK_LINES]]
+        if len(low_stock) > LOW_STOCK_LINES:
+            lines.append(f"...and {len(low_stock) - LOW_STOCK_LINES} more. Run forecasting.py for the full list.")
+        msgbox.showwarning("Low Stock", "\n".join(lines))
+
+    @timed("ui.delete_item_from_inventory")
     def delete_item_from_inventory(self):
         """Deletes the selected inventory item."""
         if self.current_inventory_item_id:
@@ -379,12 +761,45 @@ class MenuManagerApp:
             confirm = msgbox.askyesno("Confirm Delete", confirm_message)
 
             if confirm:
-                self.inventory_repo.delete_inventory_item(self.current_inventory_item_id)
-                self.update_inventory_listbox()
+                self.db.submit(self.order_writer.submit_edit, "delete", self.current_inventory_item_id)
                 self.clear_form_fields("inventory_item")
                 self.current_inventory_item_id = None
 
 if __name__ == "__main__":
+    started_at = time.perf_counter()
+    parser = argparse.ArgumentParser(description="Menu Manager")
+    parser.add_argument("--location", help="the store location whose databases to open (default: the unsharded ones)")
+    parser.add_argument("--kitchen-port", type=int, help="serve kitchen displays at http://<this computer>:<port>/")
+    parser.add_argument("--kitchen-host", default="127.0.0.1",
+                        help="address to serve kitchen displays on; 0.0.0.0 lets other screens connect (default: this computer only)")
+    parser.add_argument("--startup-time", action="store_true", help="measure a cold start, print it, and quit")
+    parser.add_argument("--metrics", action="store_true", help="record query and callback timings, and print them as JSON on exit")
+    parser.add_argument("--metrics-port", type=int, help="also serve the timings at http://127.0.0.1:<port>/metrics")
+    parser.add_argument("--profile", metavar="PATH", help="profile the run and write the report to PATH")
+    parser.add_argument("--profile-mode", choices=["sample", "cprofile"], default="sample")
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_port:
+        enable_metrics()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    profiler = Profiler(args.profile, args.profile_mode) if args.profile else None
+    if profiler:
+        profiler.start()
+
     root = tk.Tk()
-    app = MenuManagerApp(root)
-    root.mainloop()
\ No newline at end of file
+    app = MenuManagerApp(root, started_at, args.location, args.kitchen_port, args.kitchen_host)
+    if args.startup_time:
+        def report():
+            if app.startup_time is None:
+                root.after(10, report)
+                return
+            print(f"Startup: {app.startup_time:.3f}s (budget {STARTUP_BUDGET}s)")
+            app.close()
+        report()
+    root.mainloop()
+
+    if profiler:
+        profiler.stop()
+    if args.metrics or args.metrics_port:
+        write_log(sys.stderr)
\ No newline at end of file
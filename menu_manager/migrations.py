@@ -0,0 +1,402 @@
+import sqlite3
+
+# Each entry is one schema version. Entry N (counting from 1) upgrades a database
+# whose PRAGMA user_version is N - 1. Never edit an entry once it has shipped;
+# append a new one instead so existing databases are upgraded in place.
+# user_version is per database file, so each list must own its own file
+# (menu.db and inventory.db).
+
+MENU_MIGRATIONS = [
+    # 1: the original table. IF NOT EXISTS adopts databases created before versioning.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS menu_items (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            calories INTEGER,
+            category TEXT NOT NULL
+        );
+        """,
+    ],
+    # 2: unique names and a category index. Older duplicates get their id appended
+    # to the name so the unique index can be built without losing any rows.
+    [
+        """
+        UPDATE menu_items SET name = name || ' (' || id || ')'
+        WHERE id NOT IN (SELECT MIN(id) FROM menu_items GROUP BY name);
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_menu_items_name ON menu_items (name);",
+        "CREATE INDEX IF NOT EXISTS idx_menu_items_category ON menu_items (category, name);",
+    ],
+    # 3: a full-text index over name, description, and category. The FTS table only
+    # stores the index; the triggers keep it in step with every write to menu_items.
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS menu_items_fts USING fts5 (
+            name, description, category,
+            content = 'menu_items', content_rowid = 'id'
+        );
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_items_fts_insert AFTER INSERT ON menu_items BEGIN
+            INSERT INTO menu_items_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_items_fts_delete AFTER DELETE ON menu_items BEGIN
+            INSERT INTO menu_items_fts (menu_items_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_items_fts_update AFTER UPDATE ON menu_items BEGIN
+            INSERT INTO menu_items_fts (menu_items_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+            INSERT INTO menu_items_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END;
+        """,
+        "INSERT INTO menu_items_fts (menu_items_fts) VALUES ('rebuild');",
+    ],
+    # 4: an append-only history of every version of every menu item. The triggers add
+    # a row whenever an item is created, changed, or deleted, and refuse to change or
+    # remove history rows. Items that already exist are entered as effective from the
+    # beginning of time ('').
+    [
+        """
+        CREATE TABLE IF NOT EXISTS menu_item_history (
+            id INTEGER PRIMARY KEY,
+            menu_id INTEGER NOT NULL,
+            effective_from TEXT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            calories INTEGER,
+            category TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_menu_item_history_menu_id ON menu_item_history (menu_id, effective_from);",
+        """
+        INSERT INTO menu_item_history (menu_id, effective_from, name, description, price, calories, category)
+        SELECT id, '', name, description, price, calories, category FROM menu_items;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_item_history_insert AFTER INSERT ON menu_items BEGIN
+            INSERT INTO menu_item_history (menu_id, effective_from, name, description, price, calories, category)
+            VALUES (new.id, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'),
+                    new.name, new.description, new.price, new.calories, new.category);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_item_history_update AFTER UPDATE ON menu_items
+        WHEN old.name IS NOT new.name OR old.description IS NOT new.description OR old.price IS NOT new.price
+            OR old.calories IS NOT new.calories OR old.category IS NOT new.category
+        BEGIN
+            INSERT INTO menu_item_history (menu_id, effective_from, name, description, price, calories, category)
+            VALUES (new.id, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'),
+                    new.name, new.description, new.price, new.calories, new.category);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_item_history_delete AFTER DELETE ON menu_items BEGIN
+            INSERT INTO menu_item_history (menu_id, effective_from, name, description, price, calories, category, deleted)
+            VALUES (old.id, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'),
+                    old.name, old.description, old.price, old.calories, old.category, 1);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_item_history_no_update BEFORE UPDATE ON menu_item_history BEGIN
+            SELECT RAISE(ABORT, 'menu_item_history is append-only');
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_item_history_no_delete BEFORE DELETE ON menu_item_history BEGIN
+            SELECT RAISE(ABORT, 'menu_item_history is append-only');
+        END;
+        """,
+    ],
+    # 5: a count of changes to menu_items, bumped by triggers on every row written
+    # however it is written, so a process can tell when its cached copy is out of date.
+    [
+        "CREATE TABLE IF NOT EXISTS change_counter (value INTEGER NOT NULL);",
+        "INSERT INTO change_counter (value) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM change_counter);",
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_items_count_insert AFTER INSERT ON menu_items BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_items_count_update AFTER UPDATE ON menu_items BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS menu_items_count_delete AFTER DELETE ON menu_items BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+    ],
+]
+
+INVENTORY_MIGRATIONS = [
+    # 1: the original table.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY,
+            item_name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            category TEXT
+        );
+        """,
+    ],
+    # 2: unique item names and a category index.
+    [
+        """
+        UPDATE inventory SET item_name = item_name || ' (' || id || ')'
+        WHERE id NOT IN (SELECT MIN(id) FROM inventory GROUP BY item_name);
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_item_name ON inventory (item_name);",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_category ON inventory (category);",
+    ],
+    # 3: recipes, mapping each menu item (by its id in menu.db) to the inventory it uses per serving.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS recipes (
+            menu_id INTEGER NOT NULL,
+            inventory_id INTEGER NOT NULL REFERENCES inventory (id) ON DELETE CASCADE,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            PRIMARY KEY (menu_id, inventory_id)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_recipes_inventory_id ON recipes (inventory_id);",
+    ],
+    # 4: a full-text index over item name and category, kept in step by triggers.
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS inventory_fts USING fts5 (
+            item_name, category,
+            content = 'inventory', content_rowid = 'id'
+        );
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_insert AFTER INSERT ON inventory BEGIN
+            INSERT INTO inventory_fts (rowid, item_name, category)
+            VALUES (new.id, new.item_name, new.category);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_delete AFTER DELETE ON inventory BEGIN
+            INSERT INTO inventory_fts (inventory_fts, rowid, item_name, category)
+            VALUES ('delete', old.id, old.item_name, old.category);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_update AFTER UPDATE OF item_name, category ON inventory BEGIN
+            INSERT INTO inventory_fts (inventory_fts, rowid, item_name, category)
+            VALUES ('delete', old.id, old.item_name, old.category);
+            INSERT INTO inventory_fts (rowid, item_name, category)
+            VALUES (new.id, new.item_name, new.category);
+        END;
+        """,
+        "INSERT INTO inventory_fts (inventory_fts) VALUES ('rebuild');",
+    ],
+    # 5: a ledger of every stock change, and optional reorder levels per item. Current
+    # quantities are entered in the ledger as an opening count.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY,
+            inventory_id INTEGER NOT NULL,
+            change INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_stock_movements_inventory_id ON stock_movements (inventory_id, created_at);",
+        """
+        CREATE TABLE IF NOT EXISTS stock_thresholds (
+            inventory_id INTEGER PRIMARY KEY REFERENCES inventory (id) ON DELETE CASCADE,
+            reorder_point INTEGER NOT NULL CHECK (reorder_point >= 0),
+            reorder_quantity INTEGER CHECK (reorder_quantity > 0)
+        );
+        """,
+        """
+        INSERT INTO stock_movements (inventory_id, change, reason, created_at)
+        SELECT id, quantity, 'count', strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime') FROM inventory;
+        """,
+    ],
+    # 6: the tickets whose ingredients have been taken out of stock, so an order
+    # replayed from the journal is only counted once.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS depleted_tickets (
+            ticket_id TEXT PRIMARY KEY,
+            depleted_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """,
+    ],
+    # 7: the journaled inventory edits that have been applied, so an edit replayed
+    # from the journal (a restock in particular) is only applied once.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS applied_edits (
+            edit_id TEXT PRIMARY KEY,
+            applied_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """,
+    ],
+    # 8: a count of changes to inventory and recipes, bumped by triggers on every row written
+    # however it is written, so a process can tell when its cached copy is out of date.
+    [
+        "CREATE TABLE IF NOT EXISTS change_counter (value INTEGER NOT NULL);",
+        "INSERT INTO change_counter (value) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM change_counter);",
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_count_insert AFTER INSERT ON inventory BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_count_update AFTER UPDATE ON inventory BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_count_delete AFTER DELETE ON inventory BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_count_insert AFTER INSERT ON recipes BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_count_update AFTER UPDATE ON recipes BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_count_delete AFTER DELETE ON recipes BEGIN
+            UPDATE change_counter SET value = value + 1;
+        END;
+        """,
+    ],
+]
+
+ORDER_MIGRATIONS = [
+    # 1: completed orders and their lines. Orders are only ever appended; ticket_id
+    # is generated when the order is rung up, so saving the same ticket twice is a no-op.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY,
+            ticket_id TEXT NOT NULL UNIQUE,
+            terminal TEXT,
+            created_at TEXT NOT NULL,
+            subtotal_cents INTEGER NOT NULL,
+            tax_cents INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_lines (
+            id INTEGER PRIMARY KEY,
+            order_id INTEGER NOT NULL REFERENCES orders (id),
+            menu_id INTEGER,
+            name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price_cents INTEGER NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);",
+        "CREATE INDEX IF NOT EXISTS idx_order_lines_order_id ON order_lines (order_id);",
+    ],
+    # 2: the menu category of each order line, and sales rollups. The rollups are
+    # updated in the same transaction as every saved order, so reports read a few
+    # rows per hour or day instead of every order line. Lines saved before this
+    # version have no category and are counted as 'Uncategorized'.
+    [
+        "ALTER TABLE order_lines ADD COLUMN category TEXT;",
+        """
+        CREATE TABLE IF NOT EXISTS sales_hourly (
+            hour TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            subtotal_cents INTEGER NOT NULL,
+            tax_cents INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily_categories (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            revenue_cents INTEGER NOT NULL,
+            PRIMARY KEY (day, category)
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily_items (
+            day TEXT NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            revenue_cents INTEGER NOT NULL,
+            PRIMARY KEY (day, name, category)
+        ) WITHOUT ROWID;
+        """,
+        """
+        INSERT INTO sales_hourly
+        SELECT substr(created_at, 1, 13), COUNT(*), SUM(subtotal_cents), SUM(tax_cents), SUM(total_cents)
+        FROM orders GROUP BY 1;
+        """,
+        """
+        INSERT INTO sales_daily_categories
+        SELECT substr(orders.created_at, 1, 10), 'Uncategorized', SUM(quantity), SUM(quantity * unit_price_cents)
+        FROM order_lines JOIN orders ON orders.id = order_lines.order_id
+        GROUP BY 1;
+        """,
+        """
+        INSERT INTO sales_daily_items
+        SELECT substr(orders.created_at, 1, 10), name, 'Uncategorized', SUM(quantity), SUM(quantity * unit_price_cents)
+        FROM order_lines JOIN orders ON orders.id = order_lines.order_id
+        GROUP BY 1, 2;
+        """,
+    ],
+]
+
+def get_schema_version(conn):
+    """Return the schema version stored in the database's user_version pragma."""
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+def migrate(conn, migrations):
+    """
+    Bring a database up to the latest schema version.
+
+    Each pending version is applied in its own transaction together with the
+    user_version bump, so an interrupted upgrade never leaves a half-migrated schema.
+
+    :param conn: an open sqlite3 connection
+    :param migrations: a list of migrations, each a list of SQL statements
+    :return: the schema version after migrating
+    """
+    version = get_schema_version(conn)
+    if version > len(migrations):
+        raise RuntimeError(f"Database schema version {version} is newer than this program supports ({len(migrations)}).")
+    for target, statements in enumerate(migrations[version:], start=version + 1):
+        conn.commit() # Finish any implicit transaction before opening our own.
+        try:
+            conn.execute("BEGIN;")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target};")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
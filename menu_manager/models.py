@@ -1,23 +1,33 @@
-import sqlite3
-import tkinter as tk
+import bisect
+import itertools
+import threading
+import uuid
+from array import array
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from connections import default_connections
+from events import ChangeEvent, default_bus
+from instrumentation import metrics, rows_written, timed
+from migrations import INVENTORY_MIGRATIONS, MENU_MIGRATIONS, ORDER_MIGRATIONS, migrate
+from pricing import tax_cents, to_cents, to_dollars
+from search import PrefixTrie, fts_query
 
-class MenuItem:
-    """A class representing a menu item."""
-    def __init__(self, name, description, price, calories, category):
-        """
-        Initialize a MenuItem object.
+class MenuItem(namedtuple("MenuItem", ["name", "description", "price", "calories", "category"])):
+    """
+    A class representing a menu item.
 
-        :param name: the name of the menu item
-        :param description: the description of the menu item
-        :param price: the price of the menu item
-        :param calories: the number of calories in the menu item
-        :param category: the category of the menu item
-        """
-        self.name = name
-        self.description = description
-        self.price = price
-        self.calories = calories
-        self.category = category
+    Menu items are immutable tuples without a per-instance __dict__, which keeps large
+    catalogs small. Use _replace() to get a changed copy.
+
+    :param name: the name of the menu item
+    :param description: the description of the menu item
+    :param price: the price of the menu item
+    :param calories: the number of calories in the menu item
+    :param category: the category of the menu item
+    """
+    __slots__ = ()
 
     def __str__(self):
         return f"{self.name}: {self.description} ${self.price} ({self.calories} calories)"
@@ -28,136 +38,788 @@ class Menu:
         self.items = []
 
     def __str__(self):
-        menu_str = "Menu:\n"
-        for i, item in enumerate(self.items, start=1):
-            menu_str += f"{i}. {item}\n"
-        return menu_str
+        lines = ["Menu:"]
+        lines.extend(f"{i}. {item}" for i, item in enumerate(self.items, start=1))
+        return "\n".join(lines) + "\n"
     
+# A completed order, detached from the Order it came from so it can be saved on another thread.
+# lines is a tuple of TicketLine tuples.
+Ticket = namedtuple("Ticket", ["ticket_id", "terminal", "created_at", "lines", "subtotal_cents", "tax_cents"])
+TicketLine = namedtuple("TicketLine", ["menu_id", "name", "quantity", "unit_price_cents", "category"])
+
+# The sales report category for order lines saved without one.
+UNCATEGORIZED = "Uncategorized"
+
+# The category of the ticket lines that record promotions, which have a negative price.
+DISCOUNTS = "Discounts"
+
 class Order:
-    """A class representing an order of menu items."""
-    TAX_RATE = 0.07
-    def __init__(self):
-        self.items = []
+    """
+    A class representing an order of menu items.
+
+    Lines are kept as menu_id -> quantity, with one MenuItem per distinct item, and
+    the subtotal is kept up to date in integer cents as items are added, so totals
+    never need to be re-summed. With a PromotionEngine, the discounts are kept up
+    to date the same way, one line at a time.
+    """
+    TAX_RATE = Decimal("0.07")
+    def __init__(self, promotions=None):
+        """
+        Initialize the Order object.
+
+        :param promotions: a PromotionEngine to discount the order with
+        """
+        self.discounts = promotions.discounts() if promotions else None
+        self.clear()
+
+    def clear(self):
+        """Remove every item from the order."""
+        self.lines = {}
+        self.menu_items = {}
+        self.subtotal_cents = 0 # Before discounts
+        if self.discounts is not None:
+            self.discounts.clear()
+
+    def add_item(self, item, item_id=None, quantity=1):
+        """
+        Add a menu item to the order.
+
+        :param item: the MenuItem to add
+        :param item_id: the menu item's database ID (the item's name is used if not given)
+        :param quantity: how many to add
+        """
+        key = item_id if item_id is not None else item.name
+        self.lines[key] = self.lines.get(key, 0) + quantity
+        self.menu_items[key] = item
+        self.subtotal_cents += to_cents(item.price) * quantity
+        if self.discounts is not None:
+            self.discounts.update(self, key)
+
+    @property
+    def items(self):
+        """Every unit ordered, as a list of MenuItem objects."""
+        return [self.menu_items[key] for key, quantity in self.lines.items() for _ in range(quantity)]
 
-    def add_item(self, item):
-        """Add a menu item to the order."""
-        self.items.append(item)
+    @property
+    def discount_cents(self):
+        """The total of the order's promotions, in cents."""
+        return self.discounts.total_cents if self.discounts is not None else 0
 
     def total_cost(self):
-        """Calculate the total cost of the order, including subtotal, tax, and total."""
-        print()
-        subtotal = sum(item.price for item in self.items)
-        total_tax = subtotal * Order.TAX_RATE
-        total_cost = subtotal + total_tax
-        return subtotal, total_tax, total_cost
+        """Calculate the total cost of the order: the subtotal after discounts, the tax on it, and the total."""
+        subtotal = self.subtotal_cents - self.discount_cents
+        total_tax = tax_cents(subtotal, Order.TAX_RATE)
+        return to_dollars(subtotal), to_dollars(total_tax), to_dollars(subtotal + total_tax)
     
+    def to_ticket(self, terminal=None):
+        """
+        Return a Ticket snapshot of the order, ready to be saved by an OrderRepository.
+
+        Each promotion is a line of its own with a negative price, in the Discounts
+        category, and the ticket's subtotal is after discounts.
+        """
+        lines = tuple(
+            TicketLine(key if isinstance(key, int) else None, self.menu_items[key].name, quantity,
+                       to_cents(self.menu_items[key].price), self.menu_items[key].category)
+            for key, quantity in self.lines.items()
+        )
+        if self.discounts is not None:
+            lines += tuple(TicketLine(None, name, 1, -cents, DISCOUNTS) for name, cents in self.discounts.applied())
+        subtotal = self.subtotal_cents - self.discount_cents
+        return Ticket(uuid.uuid4().hex, terminal, datetime.now().isoformat(timespec="seconds"),
+                      lines, subtotal, tax_cents(subtotal, Order.TAX_RATE))
+
     def __str__(self):
-        order_str = "Order:\n"
-        for i, item in enumerate(self.items, start=1):
-            order_str += f"{i}. {item}\n"
         subtotal, total_tax, total_cost = self.total_cost()
-        order_str += f"Subtotal: ${subtotal:.2f}\n"
-        order_str += f"Tax ({Order.TAX_RATE*100}%): ${total_tax:.2f}\n"
-        order_str += f"Total: ${total_cost:.2f}"
-        return order_str
+        lines = ["Order:"]
+        lines.extend(f"{i}. {self.menu_items[key]} x{quantity}" for i, (key, quantity) in enumerate(self.lines.items(), start=1))
+        if self.discounts is not None:
+            lines.extend(f"{name}: -${to_dollars(cents)}" for name, cents in self.discounts.applied())
+        lines.append(f"Subtotal: ${subtotal:.2f}")
+        lines.append(f"Tax ({(Order.TAX_RATE * 100).normalize():f}%): ${total_tax:.2f}") # 7%, not 7.00%
+        lines.append(f"Total: ${total_cost:.2f}")
+        return "\n".join(lines)
+
+# One row of the inventory table.
+InventoryItem = namedtuple("InventoryItem", ["id", "item_name", "quantity", "category"])
+
+class InventoryTable:
+    """
+    Inventory rows stored column by column, for full-table reads.
+
+    Ids and quantities are packed into arrays of machine integers and names and
+    categories are kept in plain lists, so reading the whole table allocates four
+    containers instead of one object per row. Indexing or iterating yields
+    InventoryItem tuples, built only as they are asked for.
+    """
+    __slots__ = ("ids", "item_names", "quantities", "categories")
+
+    def __init__(self, rows=()):
+        """
+        Initialize the InventoryTable object.
+
+        :param rows: an iterable of (id, item_name, quantity, category) rows
+        """
+        self.ids = array("q")
+        self.item_names = []
+        self.quantities = array("q")
+        self.categories = []
+        for row in rows:
+            self.append(row)
+
+    def append(self, row):
+        """Add an (id, item_name, quantity, category) row."""
+        item_id, item_name, quantity, category = row
+        self.ids.append(item_id)
+        self.item_names.append(item_name)
+        self.quantities.append(quantity)
+        self.categories.append(category)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return InventoryItem(self.ids[index], self.item_names[index], self.quantities[index], self.categories[index])
+
+    def __iter__(self):
+        return map(InventoryItem, self.ids, self.item_names, self.quantities, self.categories)
+
+# The categories offered for new menu and inventory items. Items can have any category.
+MENU_CATEGORIES = ("Entrees", "Sides", "Beverages", "Desserts")
+INVENTORY_CATEGORIES = ("Food", "Cleaning Supplies", "Misc")
+
+class MenuCatalog:
+    """
+    An in-memory copy of the menu_items table, indexed by id, name, category, and name prefix.
+
+    Categories are whatever the items have. Each category's ids are kept sorted by
+    name, the same order as the menu_items (category, name) index.
+    """
+    def __init__(self):
+        self.items_by_id = {}
+        self.ids_by_name = {}
+        self.ids_by_category = {}
+        self.name_trie = PrefixTrie()
+
+    def load(self, rows):
+        """Replace the catalog contents with rows from the menu_items table."""
+        self.__init__()
+        for row in rows:
+            self.put(row[0], MenuItem(row[1], row[2], row[3], row[4], row[5]))
+
+    def put(self, item_id, item):
+        """Add or replace a single menu item in the catalog."""
+        self.remove(item_id)
+        self.items_by_id[item_id] = item
+        bisect.insort(self.ids_by_name.setdefault(item.name, []), item_id)
+        self.name_trie.add(item.name, item_id)
+        bisect.insort(self.ids_by_category.setdefault(item.category, []), item_id, key=self.sort_key)
+
+    def remove(self, item_id):
+        """Remove a single menu item from the catalog, if present."""
+        item = self.items_by_id.pop(item_id, None)
+        if item is None:
+            return
+        name_ids = self.ids_by_name[item.name]
+        name_ids.remove(item_id)
+        if not name_ids:
+            del self.ids_by_name[item.name]
+        self.name_trie.remove(item.name, item_id)
+        category_ids = self.ids_by_category[item.category]
+        category_ids.remove(item_id)
+        if not category_ids:
+            del self.ids_by_category[item.category]
+
+    def sort_key(self, item_id):
+        """The order of items within a category: by name, then id."""
+        return self.items_by_id[item_id].name, item_id
+
+    def categories(self):
+        """Return the categories that have items, sorted."""
+        return sorted(self.ids_by_category)
+
+    def get(self, item_id):
+        """Return the menu item with the given ID, or None."""
+        return self.items_by_id.get(item_id)
+
+    def get_by_name(self, name):
+        """Return a menu item and its ID based on its name, or (None, None)."""
+        ids = self.ids_by_name.get(name)
+        if not ids:
+            return None, None
+        return self.items_by_id[ids[0]], ids[0]
+
+    def complete(self, text, limit=None):
+        """
+        Return (id, MenuItem) pairs whose name has a word starting with each word of text.
+
+        Matches are sorted by name. An empty text matches nothing.
+        """
+        matches = sorted(self.name_trie.search(text), key=self.sort_key)
+        return [(item_id, self.items_by_id[item_id]) for item_id in matches[:limit]]
+
+    def by_category(self):
+        """Return all menu items separated by category, with categories and the items in each sorted by name."""
+        return {
+            category: [self.items_by_id[item_id] for item_id in self.ids_by_category[category]]
+            for category in self.categories()
+        }
+
+class AvailabilityIndex:
+    """
+    How many servings of each menu item the current inventory can still make.
+
+    Servings are precomputed per menu item and only recomputed for the items that
+    use an inventory row when that row changes, so checking an item is a dict lookup.
+
+    One index is shared by the GUI's database thread, the order writer, and the
+    HTTP service's workers, so every change holds the index's lock, including the
+    read-then-write ones in add_stock() and deplete().
+    """
+    def __init__(self, stock, recipes):
+        """
+        Initialize the AvailabilityIndex object.
+
+        :param stock: an iterable of (inventory_id, quantity) pairs
+        :param recipes: an iterable of (menu_id, inventory_id, quantity) rows
+        """
+        self.lock = threading.RLock()
+        self.stock = dict(stock)
+        self.recipes = {} # menu_id -> {inventory_id: quantity per serving}
+        self.used_by = {} # inventory_id -> set of menu_ids
+        self.servings = {}
+        for menu_id, inventory_id, quantity in recipes:
+            self.recipes.setdefault(menu_id, {})[inventory_id] = quantity
+            self.used_by.setdefault(inventory_id, set()).add(menu_id)
+        for menu_id in self.recipes:
+            self.recompute(menu_id)
+
+    def recompute(self, menu_id):
+        """Recompute the servings left for one menu item."""
+        recipe = self.recipes.get(menu_id)
+        if not recipe:
+            self.servings.pop(menu_id, None)
+            return
+        self.servings[menu_id] = max(0, min(self.stock.get(inventory_id, 0) // quantity for inventory_id, quantity in recipe.items()))
+
+    def set_stock(self, inventory_id, quantity):
+        """Record a new quantity for an inventory item and update the menu items that use it."""
+        with self.lock:
+            self.stock[inventory_id] = quantity
+            for menu_id in self.used_by.get(inventory_id, ()):
+                self.recompute(menu_id)
+
+    def add_stock(self, inventory_id, change):
+        """Add change (negative to subtract) to an inventory item's quantity."""
+        with self.lock:
+            self.set_stock(inventory_id, self.stock.get(inventory_id, 0) + change)
+
+    def deplete(self, lines):
+        """Subtract the inventory used by an order's (menu_id, quantity) lines."""
+        with self.lock:
+            for inventory_id, used in self.usage(lines).items():
+                self.set_stock(inventory_id, self.stock.get(inventory_id, 0) - used)
+
+    def remove_stock(self, inventory_id):
+        """Forget an inventory item, along with every recipe line that used it."""
+        with self.lock:
+            self.stock.pop(inventory_id, None)
+            for menu_id in self.used_by.pop(inventory_id, ()):
+                del self.recipes[menu_id][inventory_id]
+                self.recompute(menu_id)
+
+    def set_recipe(self, menu_id, ingredients):
+        """Replace the recipe for one menu item."""
+        with self.lock:
+            for inventory_id in self.recipes.pop(menu_id, {}):
+                self.used_by[inventory_id].discard(menu_id)
+            if ingredients:
+                self.recipes[menu_id] = dict(ingredients)
+                for inventory_id in ingredients:
+                    self.used_by.setdefault(inventory_id, set()).add(menu_id)
+            self.recompute(menu_id)
+
+    def usage(self, lines):
+        """Return {inventory_id: quantity} used by an order's (menu_id, quantity) lines."""
+        used = {}
+        with self.lock:
+            for menu_id, quantity in lines:
+                for inventory_id, per_serving in self.recipes.get(menu_id, {}).items():
+                    used[inventory_id] = used.get(inventory_id, 0) + per_serving * quantity
+        return used
+
+    def servings_left(self, menu_id):
+        """Return how many servings can still be made, or None if the item has no recipe."""
+        return self.servings.get(menu_id)
+
+    def can_make(self, menu_id, quantity=1):
+        """Return whether the inventory covers quantity more servings. Items without a recipe always can."""
+        servings = self.servings.get(menu_id)
+        return servings is None or servings >= quantity
+
+class Repository:
+    """Shared connection and transaction handling for the repositories."""
+    TRACKS_CHANGES = False # Whether the database has a change_counter that this repository's cache follows
 
-class MenuRepository:
+    def __init__(self, db_name, connections=None, bus=None):
+        """
+        Initialize the Repository object.
+
+        :param db_name: the name of the sqlite database file
+        :param connections: the ConnectionManager to get connections from (defaults to the shared one)
+        :param bus: the EventBus to publish committed changes to (defaults to the shared one)
+        """
+        self.db_name = db_name
+        self.connections = connections or default_connections
+        self.local = threading.local() # Cursor and transaction state for each thread
+        self.bus = bus or default_bus
+        self.schema_lock = threading.Lock()
+        self.schema_ready = False
+        self.change_lock = threading.Lock()
+        self.change_count = None # The change_counter value the cache is up to date with, or None if unknown
+
+    def create_schema(self, conn):
+        """Create or upgrade this repository's tables. Called once, on first connect."""
+
+    @property
+    def conn(self):
+        """This thread's connection to the database. The schema is brought up to date on first use."""
+        conn = self.connections.connect(self.db_name)
+        if not self.schema_ready:
+            with self.schema_lock:
+                if not self.schema_ready:
+                    self.create_schema(conn)
+                    self.schema_ready = True
+        return conn
+
+    @property
+    def cursor(self):
+        """This thread's cursor on the database connection."""
+        cursor = getattr(self.local, "cursor", None)
+        if cursor is None:
+            cursor = self.local.cursor = self.conn.cursor()
+        return cursor
+
+    @property
+    def in_transaction(self):
+        """Whether this thread is inside a transaction() block."""
+        return getattr(self.local, "in_transaction", False)
+
+    @in_transaction.setter
+    def in_transaction(self, value):
+        self.local.in_transaction = value
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into a single commit.
+
+        Write methods called inside the block skip their own commit. Everything is
+        committed when the block exits, or rolled back if it raises. Nested blocks
+        join the outermost transaction.
+
+        The transaction is opened explicitly: sqlite3 only opens one by itself for
+        INSERT, UPDATE, DELETE, and REPLACE, so a statement starting with WITH would
+        otherwise commit on its own.
+        """
+        if self.in_transaction:
+            yield self
+            return
+        self.in_transaction = True
+        self.local.pending_changes = []
+        try:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN IMMEDIATE;") # Take the write lock now, waiting for it like any write
+            start = self.read_change_count() if self.TRACKS_CHANGES else None
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        else:
+            end = self.read_change_count() if self.TRACKS_CHANGES else None
+            self.conn.commit()
+            if self.TRACKS_CHANGES:
+                self.count_own_changes(start, end)
+        finally:
+            self.in_transaction = False
+        for change in self.local.pending_changes:
+            self.notify(*change)
+
+    def commit(self):
+        """Commit the current write, unless it is part of a larger transaction."""
+        if not self.in_transaction:
+            self.conn.commit()
+
+    def rollback(self):
+        """Discard all uncommitted writes."""
+        self.conn.rollback()
+        self.local.pending_changes = []
+
+    def read_change_count(self):
+        """Return the database's change_counter, which triggers bump for every row written to the cached tables."""
+        return self.conn.execute("SELECT value FROM change_counter;").fetchone()[0]
+
+    def count_own_changes(self, start, end):
+        """
+        Note that this repository's transaction moved the change_counter from start to end.
+
+        Called after the commit. The counter was read under the write lock, so if the
+        cache was up to date at start, every change since is one of this repository's
+        own, already applied to the cache.
+        """
+        with self.change_lock:
+            if self.change_count == start:
+                self.change_count = end
+
+    def changed_elsewhere(self):
+        """
+        Return whether anything but this repository has written to the cached tables since the last check.
+
+        That may be another process, such as the GUI, data_io.py, a second server, or
+        the sqlite3 shell, or another repository object on the same file. Writes made
+        through this repository's transactions, from any thread, don't count: they
+        already update the cache. The check is shared by every thread, and the first
+        one returns True, as there is nothing to compare with yet.
+        """
+        count = self.local.checked_count = self.read_change_count()
+        with self.change_lock:
+            changed = count != self.change_count
+            self.change_count = count
+        return changed
+
+    def check_reload(self):
+        """
+        Call after reloading the cache because changed_elsewhere() said so.
+
+        If anything was committed while the cache loaded, it may have been applied to
+        the old cache instead, so the next check reloads again.
+        """
+        if self.read_change_count() != self.local.checked_count:
+            with self.change_lock:
+                self.change_count = None
+
+    def add_listener(self, listener):
+        """
+        Call listener(table, action, item_id) after every committed change to this database.
+
+        action is "create", "update", or "delete" for a single row, or "reload" when
+        many rows changed at once. Listeners run on the thread that made the change.
+        For coalesced batches, subscribe to self.bus with subscribe_batches() instead.
+
+        :return: the Subscription, for self.bus.unsubscribe()
+        """
+        return self.bus.subscribe(lambda event: listener(event.table, event.action, event.item_id),
+                                  sources=(self.db_name,))
+
+    def changed(self, table, action, item_id=None):
+        """Report a change to the bus, or hold it until the current transaction commits."""
+        if self.in_transaction:
+            self.local.pending_changes.append((table, action, item_id))
+        else:
+            self.notify(table, action, item_id)
+
+    def notify(self, table, action, item_id):
+        """Publish a committed change."""
+        self.bus.publish(ChangeEvent(self.db_name, table, action, item_id))
+
+def as_timestamp(when):
+    """
+    Return when as an ISO timestamp string to compare with menu_item_history.effective_from.
+
+    History rows are stamped to the millisecond, but tickets to the second, so a time
+    given to the second is taken to mean the end of that second. An item changed
+    earlier in the same second as an order then counts as in effect for it.
+    """
+    when = when.isoformat() if isinstance(when, datetime) else when
+    return when + ".999" if len(when) == len("YYYY-MM-DDTHH:MM:SS") else when
+
+class MenuRepository(Repository):
     """A class for interacting with the menu database."""
-    def __init__(self, db_name):
+    TRACKS_CHANGES = True
+
+    def __init__(self, db_name, connections=None, bus=None):
         """
         Initialize the MenuRepository object.
 
         :param db_name: the name of the sqlite database file
+        :param connections: the ConnectionManager to get connections from (defaults to the shared one)
+        :param bus: the EventBus to publish committed changes to (defaults to the shared one)
         """
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
-        self.create_table()
+        super().__init__(db_name, connections, bus)
+        self.catalog = None # Loaded on first read, then kept in sync by the write methods.
+        self.catalog_loads = 0 # How many times the catalog has been read from the database
     #    self.add_test_data() # Add test data
 
-    def create_table(self):
-        """Create the menu_items table if it doesn't exist."""
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS menu_items (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                price REAL NOT NULL,
-                calories INTEGER,
-                category TEXT NOT NULL
-            );
-        """)
-        self.conn.commit()
+    def create_schema(self, conn):
+        """Create the menu_items table if it doesn't exist, and upgrade its schema if needed."""
+        migrate(conn, MENU_MIGRATIONS)
 
+    @timed("menu_repo.create_menu_item")
     def create_menu_item(self, item):
         """Add a menu item to the database."""
-        self.cursor.execute("""
+        with self.transaction():
+            self.cursor.execute("""
+                INSERT INTO menu_items (name, description, price, calories, category)
+                VALUES (?, ?, ?, ?, ?);
+            """, (item.name, item.description, item.price, item.calories, item.category))
+            item_id = self.cursor.lastrowid
+        if self.catalog is not None:
+            self.catalog.put(item_id, item)
+        self.changed("menu_items", "create", item_id)
+        return item_id
+
+    def get_catalog(self):
+        """
+        Return the in-memory menu catalog, loading it from the database the first time.
+
+        The catalog is loaded again if anything but this repository has written to
+        menu_items since, so writes from other processes are seen too.
+        """
+        stale = self.changed_elsewhere() # Checked before loading, so a write during the load is caught next time
+        catalog = self.catalog # Read once: another thread may invalidate it meanwhile
+        if catalog is None or stale:
+            metrics.count("menu_catalog.miss")
+            catalog = MenuCatalog()
+            catalog.load(self.cursor.execute("SELECT * FROM menu_items ORDER BY id;"))
+            self.catalog = catalog
+            self.catalog_loads += 1
+            self.check_reload()
+        else:
+            metrics.count("menu_catalog.hit")
+        return catalog
+
+    def get_catalog_version(self):
+        """
+        Return how many times the catalog has been loaded, after reloading it if it is out of date.
+
+        Together with the change events for this process's own writes, this tells
+        when the catalog has changed.
+        """
+        self.get_catalog()
+        return self.catalog_loads
+
+    def invalidate_catalog(self):
+        """Drop the in-memory catalog so the next read reloads it from the database."""
+        self.catalog = None
+
+    def rollback(self):
+        """Discard all uncommitted writes, along with any catalog changes made for them."""
+        super().rollback()
+        self.invalidate_catalog()
+
+    @timed("menu_repo.bulk_create", rows=rows_written)
+    def bulk_create(self, items):
+        """
+        Add many menu items to the database with a single executemany.
+
+        :param items: an iterable of MenuItem objects; it is consumed lazily
+        :return: the number of rows inserted
+        """
+        self.cursor.executemany("""
             INSERT INTO menu_items (name, description, price, calories, category)
             VALUES (?, ?, ?, ?, ?);
-        """, (item.name, item.description, item.price, item.calories, item.category))
-        self.conn.commit()
-        return self.cursor.lastrowid
+        """, ((item.name, item.description, item.price, item.calories, item.category) for item in items))
+        self.commit()
+        self.invalidate_catalog()
+        self.changed("menu_items", "reload")
+        return self.cursor.rowcount
+
+    @timed("menu_repo.bulk_upsert", rows=rows_written)
+    def bulk_upsert(self, items):
+        """
+        Add many menu items to the database, updating any that already exist by name.
 
+        :param items: an iterable of MenuItem objects; it is consumed lazily
+        :return: the number of rows inserted or updated
+        """
+        self.cursor.executemany("""
+            INSERT INTO menu_items (name, description, price, calories, category)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                description = excluded.description,
+                price = excluded.price,
+                calories = excluded.calories,
+                category = excluded.category;
+        """, ((item.name, item.description, item.price, item.calories, item.category) for item in items))
+        self.commit()
+        self.invalidate_catalog()
+        self.changed("menu_items", "reload")
+        return self.cursor.rowcount
+
+    def iter_menu_items(self):
+        """Yield (id, MenuItem) pairs straight from the database, one row at a time."""
+        for row in self.conn.execute("SELECT * FROM menu_items ORDER BY id;"):
+            yield row[0], MenuItem(row[1], row[2], row[3], row[4], row[5])
+
+    @timed("menu_repo.get_menu")
     def get_menu(self, item_id):
         """Return a single menu item from the database."""
-        self.cursor.execute("SELECT * FROM menu_items WHERE id = ?;", (item_id,))
-        row = self.cursor.fetchone()
-        if row:
-            return MenuItem(row[1], row[2], row[3], row[4], row[5])
-        return None
+        return self.get_catalog().get(item_id)
 
+    @timed("menu_repo.update_menu_item")
     def update_menu_item(self, item_id, updated_item):
         """Update a single menu item in the database."""
-        self.cursor.execute("""
-            UPDATE menu_items
-            SET name = ?, description = ?, price = ?, calories = ?, category = ?
-            WHERE id = ?;
-        """, (updated_item.name, updated_item.description, updated_item.price, updated_item.calories, updated_item.category, item_id))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE menu_items
+                SET name = ?, description = ?, price = ?, calories = ?, category = ?
+                WHERE id = ?;
+            """, (updated_item.name, updated_item.description, updated_item.price, updated_item.calories, updated_item.category, item_id))
+        if self.catalog is not None and self.cursor.rowcount:
+            self.catalog.put(item_id, updated_item)
+        self.changed("menu_items", "update", item_id)
 
+    @timed("menu_repo.delete_menu_item")
     def delete_menu_item(self, item_id):
         """Delete a single menu item from the database."""
-        self.cursor.execute("DELETE FROM menu_items WHERE id = ?;", (item_id,))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("DELETE FROM menu_items WHERE id = ?;", (item_id,))
+        if self.catalog is not None:
+            self.catalog.remove(item_id)
+        self.changed("menu_items", "delete", item_id)
 
+    @timed("menu_repo.get_menu_item_by_name")
     def get_menu_item_by_name(self, name):
         """Return a menu item and its ID from the database based on its name."""
-        # print(f"Searching for menu item: {name}") # TESTING PURPOSES ONLY
-        self.cursor.execute("SELECT * FROM menu_items WHERE name = ?;", (name,))
-        row = self.cursor.fetchone()
-        if row:
-            # print(f"Database row found {row}") # TESTING PURPOSES ONLY
-            menu_item = MenuItem(row[1], row[2], row[3], row[4], row[5])  # Create MenuItem object
-            return menu_item, row[0]  # Return both MenuItem object and its ID
-        # print("Menu item not found in database.") # TESTING PURPOSES ONLY
-        return None, None  # Return None if not found
+        return self.get_catalog().get_by_name(name)  # Return both MenuItem object and its ID
 
-    def get_all_menu_items(self):
-        """Return all menu items from the database. Separated by category."""
-        self.cursor.execute("SELECT * FROM menu_items;")
-        rows = self.cursor.fetchall()
-        menu_items = []
-        entrees = []
-        sides = []
-        beverages = []
-        desserts = []
+    @timed("menu_repo.complete_menu_items")
+    def complete_menu_items(self, text, limit=None):
+        """
+        Return (id, MenuItem) pairs whose names start with what has been typed so far.
+
+        Uses the catalog's prefix trie, so it is fast enough to run on every keystroke.
+        """
+        return self.get_catalog().complete(text, limit)
+
+    @timed("menu_repo.search_menu_items")
+    def search_menu_items(self, text, limit=None):
+        """
+        Return (id, MenuItem) pairs matching text in their name, description, or category.
+
+        Results come from the full-text index, best match first.
+
+        :param text: the words to search for; the last one may be unfinished
+        :param limit: the maximum number of results, or None for all of them
+        """
+        query = fts_query(text)
+        if query is None:
+            return []
+        catalog = self.get_catalog()
+        rows = self.conn.execute("""
+            SELECT rowid FROM menu_items_fts
+            WHERE menu_items_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?;
+        """, (query, -1 if limit is None else limit))
+        matches = []
+        for (item_id,) in rows:
+            item = catalog.get(item_id)
+            if item is not None: # Written by another process since the catalog was loaded
+                matches.append((item_id, item))
+        return matches
+
+    @timed("menu_repo.get_menu_item_as_of")
+    def get_menu_item_as_of(self, item_id, when):
+        """
+        Return a menu item as it was at a point in time, or None if it didn't exist then.
+
+        One seek on the history index, however long the item's history is.
+
+        :param item_id: the menu item's ID
+        :param when: an ISO timestamp such as a Ticket's created_at, or a datetime
+        """
+        row = self.conn.execute("""
+            SELECT name, description, price, calories, category, deleted FROM menu_item_history
+            WHERE menu_id = ? AND effective_from <= ?
+            ORDER BY effective_from DESC, id DESC
+            LIMIT 1;
+        """, (item_id, as_timestamp(when))).fetchone()
+        if row is None or row[5]:
+            return None
+        return MenuItem._make(row[:5])
+
+    @timed("menu_repo.get_prices_as_of")
+    def get_prices_as_of(self, item_ids, when):
+        """
+        Return {item_id: price} for the menu items that existed at a point in time.
+
+        Used to reprice past orders; each item costs one index seek.
+        """
+        when = as_timestamp(when)
+        prices = {}
+        for item_id in set(item_ids):
+            row = self.conn.execute("""
+                SELECT price, deleted FROM menu_item_history
+                WHERE menu_id = ? AND effective_from <= ?
+                ORDER BY effective_from DESC, id DESC
+                LIMIT 1;
+            """, (item_id, when)).fetchone()
+            if row is not None and not row[1]:
+                prices[item_id] = row[0]
+        return prices
+
+    @timed("menu_repo.get_menu_as_of")
+    def get_menu_as_of(self, when):
+        """Return the whole menu as it was at a point in time, as {item_id: MenuItem}."""
+        rows = self.conn.execute("""
+            SELECT history.menu_id, history.name, history.description, history.price, history.calories, history.category
+            FROM (SELECT DISTINCT menu_id FROM menu_item_history) AS items
+            JOIN menu_item_history AS history ON history.id = (
+                SELECT id FROM menu_item_history
+                WHERE menu_id = items.menu_id AND effective_from <= ?
+                ORDER BY effective_from DESC, id DESC
+                LIMIT 1
+            )
+            WHERE NOT history.deleted
+            ORDER BY history.menu_id;
+        """, (as_timestamp(when),))
+        return {row[0]: MenuItem._make(row[1:]) for row in rows}
 
+    def iter_menu_item_history(self, item_id):
+        """Yield (effective_from, MenuItem or None if deleted) for every version of a menu item, oldest first."""
+        rows = self.conn.execute("""
+            SELECT effective_from, name, description, price, calories, category, deleted FROM menu_item_history
+            WHERE menu_id = ?
+            ORDER BY effective_from, id;
+        """, (item_id,))
         for row in rows:
-            menu_item = MenuItem(row[1], row[2], row[3], row[4], row[5])
-            menu_items.append(menu_item)
-            if menu_item.category == "Entrees":
-                entrees.append(menu_item)
-            elif menu_item.category == "Sides":
-                sides.append(menu_item)
-            elif menu_item.category == "Beverages":
-                beverages.append(menu_item)
-            elif menu_item.category == "Desserts":
-                desserts.append(menu_item)
-        return {
-            "Entrees": entrees,
-            "Sides": sides,
-            "Beverages": beverages,
-            "Desserts": desserts
-        }
+            yield row[0], None if row[6] else MenuItem._make(row[1:6])
+
+    @timed("menu_repo.get_all_menu_items")
+    def get_all_menu_items(self):
+        """Return all menu items from the database, separated by category, with categories sorted by name."""
+        return self.get_catalog().by_category()
+
+    @timed("menu_repo.page_menu_items")
+    def page_menu_items(self, after=None, limit=100, offset=0):
+        """
+        Return one page of menu items in (category, name) order, read straight from the database.
+
+        Pages are found by keyset: each one starts just after the (category, name) of
+        the last row of the page before it, which the category index finds directly
+        however deep into the table it is.
+
+        :param after: the (category, name) of the row before the page, or None to start at the beginning
+        :param limit: the most rows to return
+        :param offset: rows to skip after that, to jump ahead to a page whose start isn't known yet
+        :return: a list of (id, MenuItem) pairs
+        """
+        if after is None:
+            rows = self.conn.execute("""
+                SELECT * FROM menu_items ORDER BY category, name LIMIT ? OFFSET ?;
+            """, (limit, offset))
+        else:
+            rows = self.conn.execute("""
+                SELECT * FROM menu_items WHERE (category, name) > (?, ?)
+                ORDER BY category, name LIMIT ? OFFSET ?;
+            """, (after[0], after[1], limit, offset))
+        return [(row[0], MenuItem._make(row[1:])) for row in rows]
+
+    @timed("menu_repo.count_menu_items")
+    def count_menu_items(self):
+        """Return the number of menu items."""
+        return self.conn.execute("SELECT COUNT(*) FROM menu_items;").fetchone()[0]
     
     # def add_test_data(self):
     #     """TESTING PURPOSES ONLY"""
@@ -175,80 +837,630 @@ class MenuRepository:
     #     """)
     #     self.conn.commit()
 
-class InventoryRepository:
-    def __init__(self, db_path):
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
-        self.create_inventory_table()
+class OrderRepository(Repository):
+    """A class for saving completed orders to the orders database."""
+    def __init__(self, db_name, connections=None, bus=None):
+        """
+        Initialize the OrderRepository object.
 
-    def create_inventory_table(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS inventory (
-                id INTEGER PRIMARY KEY,
-                item_name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                category TEXT
-            );
-        """)
-        self.conn.commit()
-
-    def create_inventory_item(self, item_name, quantity, category):
+        :param db_name: the name of the sqlite database file
+        :param connections: the ConnectionManager to get connections from (defaults to the shared one)
+        :param bus: the EventBus to publish committed changes to (defaults to the shared one)
+        """
+        super().__init__(db_name, connections, bus)
+
+    def create_schema(self, conn):
+        """Create the orders and order_lines tables if they don't exist, and upgrade their schema if needed."""
+        migrate(conn, ORDER_MIGRATIONS)
+
+    @timed("order_repo.save_tickets", rows=rows_written)
+    def save_tickets(self, tickets):
+        """
+        Append many tickets to the database in a single transaction.
+
+        Tickets whose ticket_id is already saved are skipped, so a batch can safely be retried.
+        The sales rollups are updated in the same transaction.
+
+        :param tickets: an iterable of Ticket tuples
+        :return: the number of new orders saved
+        """
+        saved = []
+        with self.transaction():
+            for ticket in tickets:
+                self.cursor.execute("""
+                    INSERT OR IGNORE INTO orders (ticket_id, terminal, created_at, subtotal_cents, tax_cents, total_cents)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """, (ticket.ticket_id, ticket.terminal, ticket.created_at,
+                      ticket.subtotal_cents, ticket.tax_cents, ticket.subtotal_cents + ticket.tax_cents))
+                if not self.cursor.rowcount:
+                    continue
+                order_id = self.cursor.lastrowid
+                self.changed("orders", "create", order_id)
+                self.cursor.executemany("""
+                    INSERT INTO order_lines (order_id, menu_id, name, quantity, unit_price_cents, category)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """, ((order_id,) + tuple(line) for line in ticket.lines))
+                saved.append(ticket)
+            self.add_to_rollups(saved)
+        return len(saved)
+
+    def add_to_rollups(self, tickets):
+        """
+        Add newly saved tickets to the hourly and daily sales rollups.
+
+        Tickets are summed in memory first, so a batch costs one upsert per hour, day,
+        category, and item it touches rather than one per order line.
+        """
+        hourly = {} # hour -> [orders, subtotal, tax, total]
+        categories = {} # (day, category) -> [quantity, revenue]
+        items = {} # (day, name, category) -> [quantity, revenue]
+        for ticket in tickets:
+            totals = hourly.setdefault(ticket.created_at[:13], [0, 0, 0, 0])
+            totals[0] += 1
+            totals[1] += ticket.subtotal_cents
+            totals[2] += ticket.tax_cents
+            totals[3] += ticket.subtotal_cents + ticket.tax_cents
+            day = ticket.created_at[:10]
+            for line in ticket.lines:
+                category = line.category or UNCATEGORIZED
+                revenue = line.quantity * line.unit_price_cents
+                for sums in (categories.setdefault((day, category), [0, 0]),
+                             items.setdefault((day, line.name, category), [0, 0])):
+                    sums[0] += line.quantity
+                    sums[1] += revenue
+        self.cursor.executemany("""
+            INSERT INTO sales_hourly (hour, orders, subtotal_cents, tax_cents, total_cents)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (hour) DO UPDATE SET
+                orders = orders + excluded.orders,
+                subtotal_cents = subtotal_cents + excluded.subtotal_cents,
+                tax_cents = tax_cents + excluded.tax_cents,
+                total_cents = total_cents + excluded.total_cents;
+        """, ((hour,) + tuple(totals) for hour, totals in hourly.items()))
+        self.cursor.executemany("""
+            INSERT INTO sales_daily_categories (day, category, quantity, revenue_cents)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, category) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue_cents = revenue_cents + excluded.revenue_cents;
+        """, (key + tuple(sums) for key, sums in categories.items()))
+        self.cursor.executemany("""
+            INSERT INTO sales_daily_items (day, name, category, quantity, revenue_cents)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (day, name, category) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue_cents = revenue_cents + excluded.revenue_cents;
+        """, (key + tuple(sums) for key, sums in items.items()))
+
+    @timed("order_repo.rebuild_rollups")
+    def rebuild_rollups(self):
+        """Recompute the sales rollups from every saved order, e.g. after editing orders by hand."""
+        with self.transaction():
+            self.cursor.execute("DELETE FROM sales_hourly;")
+            self.cursor.execute("DELETE FROM sales_daily_categories;")
+            self.cursor.execute("DELETE FROM sales_daily_items;")
+            self.cursor.execute("""
+                INSERT INTO sales_hourly
+                SELECT substr(created_at, 1, 13), COUNT(*), SUM(subtotal_cents), SUM(tax_cents), SUM(total_cents)
+                FROM orders GROUP BY 1;
+            """)
+            self.cursor.execute("""
+                INSERT INTO sales_daily_categories
+                SELECT substr(orders.created_at, 1, 10), COALESCE(category, ?), SUM(quantity), SUM(quantity * unit_price_cents)
+                FROM order_lines JOIN orders ON orders.id = order_lines.order_id
+                GROUP BY 1, 2;
+            """, (UNCATEGORIZED,))
+            self.cursor.execute("""
+                INSERT INTO sales_daily_items
+                SELECT substr(orders.created_at, 1, 10), name, COALESCE(category, ?), SUM(quantity), SUM(quantity * unit_price_cents)
+                FROM order_lines JOIN orders ON orders.id = order_lines.order_id
+                GROUP BY 1, 2, 3;
+            """, (UNCATEGORIZED,))
+
+    @timed("order_repo.save_order")
+    def save_order(self, order, terminal=None):
+        """Save a single Order and return its ticket ID."""
+        ticket = order.to_ticket(terminal)
+        self.save_tickets([ticket])
+        return ticket.ticket_id
+
+    @timed("order_repo.get_order")
+    def get_order(self, order_id):
+        """Return a saved order as a dict with its lines, or None."""
+        self.cursor.execute("SELECT * FROM orders WHERE id = ?;", (order_id,))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
         self.cursor.execute("""
-            INSERT INTO inventory (item_name, quantity, category)
-            VALUES (?, ?, ?);
-        """, (item_name, quantity, category))
-        self.conn.commit()
+            SELECT menu_id, name, quantity, unit_price_cents FROM order_lines WHERE order_id = ? ORDER BY id;
+        """, (order_id,))
+        return {
+            "id": row[0],
+            "ticket_id": row[1],
+            "terminal": row[2],
+            "created_at": row[3],
+            "subtotal_cents": row[4],
+            "tax_cents": row[5],
+            "total_cents": row[6],
+            "lines": self.cursor.fetchall()
+        }
+
+    def iter_tickets(self, order_ids=None):
+        """
+        Yield saved orders as Tickets, oldest first, reading one row at a time.
 
+        :param order_ids: the IDs of the orders to yield (defaults to every order)
+        """
+        where, params = "", ()
+        if order_ids is not None:
+            order_ids = list(order_ids)
+            where = f"WHERE orders.id IN ({', '.join('?' for _ in order_ids)})"
+            params = order_ids
+        rows = self.conn.execute(f"""
+            SELECT orders.id, ticket_id, terminal, created_at, subtotal_cents, tax_cents,
+                   menu_id, name, quantity, unit_price_cents, category
+            FROM orders LEFT JOIN order_lines ON order_lines.order_id = orders.id
+            {where}
+            ORDER BY orders.id, order_lines.id;
+        """, params)
+        for _, order_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            order_rows = list(order_rows)
+            lines = tuple(TicketLine(*row[6:]) for row in order_rows if row[7] is not None)
+            yield Ticket(*order_rows[0][1:4], lines, *order_rows[0][4:6])
+
+    @timed("order_repo.count_orders")
+    def count_orders(self):
+        """Return the number of saved orders."""
+        return self.conn.execute("SELECT COUNT(*) FROM orders;").fetchone()[0]
+
+class InventoryRepository(Repository):
+    TRACKS_CHANGES = True
+
+    def __init__(self, db_path, connections=None, bus=None):
+        super().__init__(db_path, connections, bus)
+        self.availability = None # Loaded on first use, then kept in sync by the write methods.
+
+    def create_schema(self, conn):
+        """Create the inventory and recipes tables if they don't exist, and upgrade their schema if needed."""
+        migrate(conn, INVENTORY_MIGRATIONS)
+
+    def get_availability(self):
+        """
+        Return the menu item availability index, loading it from the database the first time.
+
+        Like the menu catalog, the index is loaded again after anything but this repository writes to
+        inventory or recipes.
+        """
+        stale = self.changed_elsewhere()
+        availability = self.availability # Read once: another thread may invalidate it meanwhile
+        if availability is None or stale:
+            metrics.count("availability.miss")
+            stock = self.conn.execute("SELECT id, quantity FROM inventory;").fetchall()
+            recipes = self.conn.execute("SELECT menu_id, inventory_id, quantity FROM recipes;").fetchall()
+            availability = self.availability = AvailabilityIndex(stock, recipes)
+            self.check_reload()
+        else:
+            metrics.count("availability.hit")
+        return availability
+
+    def invalidate_availability(self):
+        """Drop the availability index so the next use reloads it from the database."""
+        self.availability = None
+
+    def rollback(self):
+        """Discard all uncommitted writes, along with any availability changes made for them."""
+        super().rollback()
+        self.invalidate_availability()
+
+    @timed("inventory_repo.create_inventory_item")
+    def create_inventory_item(self, item_name, quantity, category, edit_id=None):
+        with self.transaction():
+            if not self.claim_edit(edit_id):
+                return
+            self.cursor.execute("""
+                INSERT INTO inventory (item_name, quantity, category)
+                VALUES (?, ?, ?);
+            """, (item_name, quantity, category))
+            item_id = self.cursor.lastrowid
+            self.record_movement(item_id, quantity, "count")
+        availability = self.availability
+        if availability is not None:
+            availability.set_stock(item_id, quantity)
+        self.changed("inventory", "create", item_id)
+
+    @timed("inventory_repo.get_inventory_item")
     def get_inventory_item(self, item_id):
+        """Gets an inventory item by ID, as an InventoryItem, or None."""
         self.cursor.execute("SELECT * FROM inventory WHERE id = ?;", (item_id,))
         row = self.cursor.fetchone()
-        if row:
-            return {
-                "id": row[0],
-                "item_name": row[1],
-                "quantity": row[2],
-                "category": row[3]
-            }
-        return None
-
-    def update_inventory_item(self, item_id, item_name, quantity, category):
+        return InventoryItem._make(row) if row else None
+
+    @timed("inventory_repo.update_inventory_item")
+    def update_inventory_item(self, item_id, item_name, quantity, category, edit_id=None):
+        with self.transaction():
+            if not self.claim_edit(edit_id):
+                return
+            # Any change to the count goes in the ledger as an adjustment.
+            self.cursor.execute("""
+                INSERT INTO stock_movements (inventory_id, change, reason, created_at)
+                SELECT id, ? - quantity, 'adjust', ? FROM inventory WHERE id = ? AND quantity != ?;
+            """, (quantity, datetime.now().isoformat(timespec="seconds"), item_id, quantity))
+            self.cursor.execute("""
+                UPDATE inventory
+                SET item_name = ?, quantity = ?, category = ?
+                WHERE id = ?;
+            """, (item_name, quantity, category, item_id))
+            updated = self.cursor.rowcount
+        availability = self.availability
+        if availability is not None and updated:
+            availability.set_stock(item_id, quantity)
+        self.changed("inventory", "update", item_id)
+
+    @timed("inventory_repo.restock")
+    def restock(self, item_id, quantity, reason="restock", edit_id=None):
+        """
+        Add to an inventory item's count, e.g. when a delivery arrives.
+
+        :param item_id: the inventory item's ID
+        :param quantity: the amount received (negative for waste or returns)
+        :param reason: the reason recorded in the stock ledger
+        :param edit_id: the journal's idempotency key; if given, a restock already applied under it is skipped
+        """
+        with self.transaction():
+            if not self.claim_edit(edit_id):
+                return
+            self.cursor.execute("UPDATE inventory SET quantity = quantity + ? WHERE id = ?;", (quantity, item_id))
+            if not self.cursor.rowcount:
+                return
+            self.record_movement(item_id, quantity, reason)
+        availability = self.availability
+        if availability is not None:
+            availability.add_stock(item_id, quantity)
+        self.changed("inventory", "update", item_id)
+
+    def claim_edit(self, edit_id):
+        """
+        Record a journaled edit as applied, inside the edit's own transaction.
+
+        :param edit_id: the edit's idempotency key, or None for an edit that isn't journaled
+        :return: False if the edit was already applied, so it must be skipped, otherwise True
+        """
+        if edit_id is None:
+            return True
+        self.cursor.execute("INSERT OR IGNORE INTO applied_edits (edit_id, applied_at) VALUES (?, ?);",
+                            (edit_id, datetime.now().isoformat(timespec="seconds")))
+        return bool(self.cursor.rowcount)
+
+    def record_movement(self, item_id, change, reason):
+        """Add one row to the stock ledger. Called by the write methods, inside their transaction."""
+        if change:
+            self.cursor.execute("""
+                INSERT INTO stock_movements (inventory_id, change, reason, created_at)
+                VALUES (?, ?, ?, ?);
+            """, (item_id, change, reason, datetime.now().isoformat(timespec="seconds")))
+
+    def snapshot_stock(self):
+        """Copy every item's quantity to a temporary table, before a bulk write."""
+        self.cursor.execute("DROP TABLE IF EXISTS temp.stock_before;")
+        self.cursor.execute("CREATE TEMP TABLE stock_before AS SELECT id, quantity FROM inventory;")
+
+    def record_stock_changes(self, reason):
+        """Add a ledger row for every quantity that changed since snapshot_stock(), in one statement."""
         self.cursor.execute("""
-            UPDATE inventory
-            SET item_name = ?, quantity = ?, category = ?
-            WHERE id = ?;
-        """, (item_name, quantity, category, item_id))
-        self.conn.commit()
+            INSERT INTO stock_movements (inventory_id, change, reason, created_at)
+            SELECT inventory.id, inventory.quantity - COALESCE(stock_before.quantity, 0), ?, ?
+            FROM inventory LEFT JOIN temp.stock_before AS stock_before ON stock_before.id = inventory.id
+            WHERE stock_before.quantity IS NOT inventory.quantity;
+        """, (reason, datetime.now().isoformat(timespec="seconds")))
+        self.cursor.execute("DROP TABLE temp.stock_before;")
+
+    @timed("inventory_repo.set_reorder_level")
+    def set_reorder_level(self, item_id, reorder_point, reorder_quantity=None):
+        """
+        Set when an inventory item counts as low on stock.
+
+        :param item_id: the inventory item's ID
+        :param reorder_point: the item is low once its quantity is at or below this (None to go back to the forecast)
+        :param reorder_quantity: how much to order when it is low (None to use the forecast)
+        """
+        if reorder_point is None:
+            self.cursor.execute("DELETE FROM stock_thresholds WHERE inventory_id = ?;", (item_id,))
+        else:
+            self.cursor.execute("""
+                INSERT INTO stock_thresholds (inventory_id, reorder_point, reorder_quantity)
+                VALUES (?, ?, ?)
+                ON CONFLICT (inventory_id) DO UPDATE SET
+                    reorder_point = excluded.reorder_point,
+                    reorder_quantity = excluded.reorder_quantity;
+            """, (item_id, reorder_point, reorder_quantity))
+        self.commit()
+        self.changed("stock_thresholds", "update", item_id)
+
+    def iter_stock_movements(self, item_id=None, since=None):
+        """
+        Yield stock ledger rows as (id, inventory_id, change, reason, created_at) tuples, oldest first.
+
+        :param item_id: only yield rows for this inventory item
+        :param since: only yield rows created at or after this ISO timestamp
+        """
+        conditions, params = [], []
+        if item_id is not None:
+            conditions.append("inventory_id = ?")
+            params.append(item_id)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        yield from self.conn.execute(f"SELECT * FROM stock_movements {where} ORDER BY id;", params)
+
+    @timed("inventory_repo.get_stock_usage")
+    def get_stock_usage(self, windows_since):
+        """
+        Return every inventory item with the amount sold in each of several windows, in one query.
+
+        :param windows_since: ISO timestamps, one per window; each window runs from its timestamp until now
+        :return: a list of (id, item_name, quantity, reorder_point, reorder_quantity, used...) rows,
+                 with one used column per window
+        """
+        used = ", ".join(
+            "COALESCE(SUM(CASE WHEN stock_movements.created_at >= ? THEN -stock_movements.change END), 0)"
+            for _ in windows_since
+        ) or "0"
+        return self.conn.execute(f"""
+            SELECT inventory.id, inventory.item_name, inventory.quantity,
+                   stock_thresholds.reorder_point, stock_thresholds.reorder_quantity, {used}
+            FROM inventory
+            LEFT JOIN stock_thresholds ON stock_thresholds.inventory_id = inventory.id
+            LEFT JOIN stock_movements ON stock_movements.inventory_id = inventory.id
+                AND stock_movements.reason = 'sale' AND stock_movements.created_at >= ?
+            GROUP BY inventory.id
+            ORDER BY inventory.id;
+        """, (*windows_since, min(windows_since, default=""))).fetchall()
+
+    @timed("inventory_repo.delete_inventory_item")
+    def delete_inventory_item(self, item_id, edit_id=None):
+        with self.transaction():
+            if not self.claim_edit(edit_id):
+                return
+            self.cursor.execute("DELETE FROM recipes WHERE inventory_id = ?;", (item_id,))
+            self.cursor.execute("DELETE FROM stock_thresholds WHERE inventory_id = ?;", (item_id,))
+            self.cursor.execute("DELETE FROM inventory WHERE id = ?;", (item_id,))
+        availability = self.availability
+        if availability is not None:
+            availability.remove_stock(item_id)
+        self.changed("inventory", "delete", item_id)
+
+    @timed("inventory_repo.set_recipe")
+    def set_recipe(self, menu_id, ingredients):
+        """
+        Replace the recipe for a menu item.
+
+        :param menu_id: the menu item's ID in the menu database
+        :param ingredients: a dict of inventory_id to the quantity used per serving (empty to remove the recipe)
+        """
+        if any(quantity <= 0 for quantity in ingredients.values()):
+            raise ValueError("Recipe quantities must be positive.")
+        with self.transaction():
+            self.cursor.execute("DELETE FROM recipes WHERE menu_id = ?;", (menu_id,))
+            self.cursor.executemany("""
+                INSERT INTO recipes (menu_id, inventory_id, quantity)
+                VALUES (?, ?, ?);
+            """, ((menu_id, inventory_id, quantity) for inventory_id, quantity in ingredients.items()))
+        availability = self.availability
+        if availability is not None:
+            availability.set_recipe(menu_id, ingredients)
+        self.changed("recipes", "update", menu_id)
+
+    @timed("inventory_repo.bulk_create_recipes", rows=rows_written)
+    def bulk_create_recipes(self, rows):
+        """
+        Add many recipe lines with a single executemany. A line that already exists raises IntegrityError.
+
+        :param rows: an iterable of (menu_id, inventory_id, quantity) tuples; it is consumed lazily
+        :return: the number of rows inserted
+        """
+        self.cursor.executemany("""
+            INSERT INTO recipes (menu_id, inventory_id, quantity)
+            VALUES (?, ?, ?);
+        """, rows)
+        self.commit()
+        self.invalidate_availability()
+        self.changed("recipes", "reload")
+        return self.cursor.rowcount
+
+    @timed("inventory_repo.bulk_upsert_recipes", rows=rows_written)
+    def bulk_upsert_recipes(self, rows):
+        """
+        Add or replace many recipe lines with a single executemany.
 
-    def delete_inventory_item(self, item_id):
-        self.cursor.execute("DELETE FROM inventory WHERE id = ?;", (item_id,))
-        self.conn.commit()
+        :param rows: an iterable of (menu_id, inventory_id, quantity) tuples; it is consumed lazily
+        :return: the number of rows written
+        """
+        self.cursor.executemany("""
+            INSERT INTO recipes (menu_id, inventory_id, quantity)
+            VALUES (?, ?, ?)
+            ON CONFLICT (menu_id, inventory_id) DO UPDATE SET quantity = excluded.quantity;
+        """, rows)
+        self.commit()
+        self.invalidate_availability()
+        self.changed("recipes", "reload")
+        return self.cursor.rowcount
+
+    def iter_recipes(self):
+        """Yield recipe rows straight from the database as (menu_id, inventory_id, quantity) tuples."""
+        yield from self.conn.execute("SELECT menu_id, inventory_id, quantity FROM recipes ORDER BY menu_id, inventory_id;")
+
+    @timed("inventory_repo.get_recipe")
+    def get_recipe(self, menu_id):
+        """Return a menu item's recipe as a dict of inventory_id to quantity per serving."""
+        self.cursor.execute("SELECT inventory_id, quantity FROM recipes WHERE menu_id = ?;", (menu_id,))
+        return dict(self.cursor.fetchall())
+
+    @timed("inventory_repo.deplete_for_order", rows=rows_written)
+    def deplete_for_order(self, lines, ticket_id=None):
+        """
+        Subtract the inventory used by an order, in one UPDATE statement.
+
+        Quantities may go below zero; the sale happened either way, and a negative
+        count flags the item for recounting.
+
+        :param lines: an iterable of (menu_id, quantity) pairs; lines without a menu_id are skipped
+        :param ticket_id: the order's ticket_id; if given, an order already depleted under it is skipped
+        :return: the number of inventory rows changed
+        """
+        lines = [(menu_id, quantity) for menu_id, quantity in lines if menu_id is not None]
+        if not lines:
+            return 0
+        values = ", ".join("(?, ?)" for _ in lines)
+        params = [value for line in lines for value in line]
+        used = f"""
+            WITH sold (menu_id, quantity) AS (VALUES {values}),
+            used AS (
+                SELECT recipes.inventory_id, SUM(recipes.quantity * sold.quantity) AS quantity
+                FROM sold JOIN recipes ON recipes.menu_id = sold.menu_id
+                GROUP BY recipes.inventory_id
+            )
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.transaction():
+            if ticket_id is not None:
+                self.cursor.execute("INSERT OR IGNORE INTO depleted_tickets (ticket_id, depleted_at) VALUES (?, ?);",
+                                    (ticket_id, now))
+                if not self.cursor.rowcount:
+                    return 0
+            self.cursor.execute(used + """
+                INSERT INTO stock_movements (inventory_id, change, reason, created_at)
+                SELECT used.inventory_id, -used.quantity, 'sale', ?
+                FROM used JOIN inventory ON inventory.id = used.inventory_id;
+            """, params + [now])
+            self.cursor.execute(used + """
+                UPDATE inventory
+                SET quantity = quantity - (SELECT used.quantity FROM used WHERE used.inventory_id = inventory.id)
+                WHERE id IN (SELECT inventory_id FROM used);
+            """, params)
+            changed = self.conn.execute("SELECT changes();").fetchone()[0] # rowcount isn't set for WITH statements
+        availability = self.availability
+        if availability is not None:
+            availability.deplete(lines)
+        self.changed("inventory", "reload")
+        return changed
+
+    def deplete_for_tickets(self, tickets):
+        """
+        Subtract the inventory used by many orders in one transaction, each ticket only once.
+
+        :param tickets: an iterable of Ticket tuples; tickets already depleted are skipped
+        :return: the number of inventory rows changed, counting a row once per ticket
+        """
+        changed = 0
+        with self.transaction():
+            for ticket in tickets:
+                changed += self.deplete_for_order(((line.menu_id, line.quantity) for line in ticket.lines),
+                                                  ticket.ticket_id)
+        return changed
+
+    @timed("inventory_repo.bulk_create", rows=rows_written)
+    def bulk_create(self, items):
+        """
+        Add many inventory items to the database with a single executemany.
+
+        :param items: an iterable of (item_name, quantity, category) tuples; it is consumed lazily
+        :return: the number of rows inserted
+        """
+        with self.transaction():
+            self.snapshot_stock()
+            self.cursor.executemany("""
+                INSERT INTO inventory (item_name, quantity, category)
+                VALUES (?, ?, ?);
+            """, items)
+            inserted = self.cursor.rowcount
+            self.record_stock_changes("count")
+        self.invalidate_availability()
+        self.changed("inventory", "reload")
+        return inserted
 
+    @timed("inventory_repo.bulk_upsert", rows=rows_written)
+    def bulk_upsert(self, items):
+        """
+        Add many inventory items to the database, replacing the quantity and category
+        of any that already exist by name.
+
+        :param items: an iterable of (item_name, quantity, category) tuples; it is consumed lazily
+        :return: the number of rows inserted or updated
+        """
+        with self.transaction():
+            self.snapshot_stock()
+            self.cursor.executemany("""
+                INSERT INTO inventory (item_name, quantity, category)
+                VALUES (?, ?, ?)
+                ON CONFLICT (item_name) DO UPDATE SET
+                    quantity = excluded.quantity,
+                    category = excluded.category;
+            """, items)
+            written = self.cursor.rowcount
+            self.record_stock_changes("count")
+        self.invalidate_availability()
+        self.changed("inventory", "reload")
+        return written
+
+    def iter_inventory_items(self):
+        """Yield InventoryItem rows straight from the database, one at a time."""
+        yield from map(InventoryItem._make, self.conn.execute("SELECT * FROM inventory ORDER BY id;"))
+
+    @timed("inventory_repo.get_all_inventory_items")
     def get_all_inventory_items(self):
-        """Gets all inventory items from the database."""
-        self.cursor.execute("SELECT * FROM inventory;")
-        rows = self.cursor.fetchall()
-        inventory_items = []
-        for row in rows:
-            inventory_item = {
-                "id": row[0],
-                "item_name": row[1],
-                "quantity": row[2],
-                "category": row[3]
-            }
-            inventory_items.append(inventory_item)
-        return inventory_items
+        """Gets all inventory items from the database, as an InventoryTable."""
+        return InventoryTable(self.conn.execute("SELECT * FROM inventory ORDER BY id;"))
+
+    @timed("inventory_repo.page_inventory_items")
+    def page_inventory_items(self, after=None, limit=100, offset=0):
+        """
+        Return one page of inventory items in id order, starting just after the id after.
+
+        :param after: the id of the row before the page, or None to start at the beginning
+        :param limit: the most rows to return
+        :param offset: rows to skip after that, to jump ahead to a page whose start isn't known yet
+        :return: an InventoryTable
+        """
+        return InventoryTable(self.conn.execute("""
+            SELECT * FROM inventory WHERE id > ? ORDER BY id LIMIT ? OFFSET ?;
+        """, (-1 if after is None else after, limit, offset)))
+
+    @timed("inventory_repo.count_inventory_items")
+    def count_inventory_items(self):
+        """Return the number of inventory items."""
+        return self.conn.execute("SELECT COUNT(*) FROM inventory;").fetchone()[0]
+
+    @timed("inventory_repo.get_inventory_categories")
+    def get_inventory_categories(self):
+        """Return the categories used by inventory items, sorted."""
+        rows = self.conn.execute("SELECT DISTINCT category FROM inventory WHERE category IS NOT NULL ORDER BY category;")
+        return [row[0] for row in rows]
     
+    @timed("inventory_repo.search_inventory_items")
+    def search_inventory_items(self, text, limit=None):
+        """
+        Return inventory items matching text in their name or category, best match first.
+
+        :param text: the words to search for; the last one may be unfinished
+        :param limit: the maximum number of results, or None for all of them
+        :return: an InventoryTable of the matches
+        """
+        query = fts_query(text)
+        if query is None:
+            return InventoryTable()
+        rows = self.conn.execute("""
+            SELECT inventory.* FROM inventory_fts
+            JOIN inventory ON inventory.id = inventory_fts.rowid
+            WHERE inventory_fts MATCH ?
+            ORDER BY inventory_fts.rank
+            LIMIT ?;
+        """, (query, -1 if limit is None else limit))
+        return InventoryTable(rows)
+
+    @timed("inventory_repo.get_inventory_item_by_name")
     def get_inventory_item_by_name(self, name):
-        """Gets an inventory item by name."""
+        """Gets an inventory item by name, as an InventoryItem, or None."""
         self.cursor.execute("SELECT * FROM inventory WHERE item_name = ?", (name,))
         row = self.cursor.fetchone()
-        if row:
-            inventory_item = {
-                "id": row[0],
-                "name": row[1],
-                "quantity": row[2],
-                "category": row[3]
-            }
-            return inventory_item
-        else:
-            return None
\ No newline at end of file
+        return InventoryItem._make(row) if row else None
\ No newline at end of file
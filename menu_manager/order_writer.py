@@ -0,0 +1,258 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from models import Ticket, TicketLine
+
+logger = logging.getLogger(__name__)
+
+# The longest wait between attempts while the database stays locked or unwritable.
+MAX_RETRY_DELAY = 2.0
+
+def journal_path(orders_db):
+    """Return the journal file that goes with an orders database, e.g. orders.journal for orders.db."""
+    return os.path.splitext(orders_db)[0] + ".journal"
+
+def dead_letter_path(journal):
+    """Return the file that tickets which can never be saved are moved to, e.g. orders.journal.failed."""
+    return journal.path + ".failed"
+
+# A change to the inventory made by hand, queued like a ticket. action is a key of
+# EDIT_ACTIONS, args are that method's arguments, and edit_id is its idempotency key.
+InventoryEdit = namedtuple("InventoryEdit", ["edit_id", "action", "args"])
+
+# The InventoryRepository method that applies each kind of InventoryEdit.
+EDIT_ACTIONS = {
+    "create": "create_inventory_item",
+    "update": "update_inventory_item",
+    "restock": "restock",
+    "delete": "delete_inventory_item",
+}
+
+def describe(entry):
+    """Return a short description of a Ticket or InventoryEdit for messages."""
+    if isinstance(entry, InventoryEdit):
+        return f"inventory {entry.action} {entry.edit_id}"
+    return f"ticket {entry.ticket_id}"
+
+def ticket_to_json(ticket):
+    """Return a Ticket as a JSON-ready list."""
+    return [ticket.ticket_id, ticket.terminal, ticket.created_at, [list(line) for line in ticket.lines],
+            ticket.subtotal_cents, ticket.tax_cents]
+
+def ticket_from_json(data):
+    """Return the Ticket for a list from ticket_to_json."""
+    ticket_id, terminal, created_at, lines, subtotal_cents, tax_cents = data
+    return Ticket(ticket_id, terminal, created_at, tuple(TicketLine(*line) for line in lines), subtotal_cents, tax_cents)
+
+def entry_to_json(entry):
+    """Return a Ticket or InventoryEdit as a JSON-ready value for the journal."""
+    if isinstance(entry, InventoryEdit):
+        return {"edit_id": entry.edit_id, "action": entry.action, "args": list(entry.args)}
+    return ticket_to_json(entry)
+
+def entry_from_json(data):
+    """Return the Ticket or InventoryEdit for a value from entry_to_json."""
+    if isinstance(data, dict):
+        return InventoryEdit(data["edit_id"], data["action"], tuple(data["args"]))
+    return ticket_from_json(data)
+
+class OrderWriter:
+    """
+    Saves tickets and inventory edits on a background thread, committing them in groups.
+
+    submit() only puts the ticket on a queue, so the register never waits on the
+    database. The writer thread collects whatever has arrived within max_delay seconds
+    (up to max_batch tickets) and saves it with one commit, which lets many
+    terminals ring up orders at the same time without one fsync per ticket.
+
+    Given a Journal, submit() first appends the ticket to it, so an accepted order
+    survives a crash or a database that stays locked: the writer keeps retrying,
+    and tickets still in the journal at startup are saved again. A ticket that fails
+    with anything other than a lock or I/O error will never be saved, so it is moved
+    to the dead-letter file next to the journal (see dead_letter_path) and the
+    journal moves on past it. Given an InventoryRepository, the writer also takes
+    each ticket's ingredients out of stock. Both steps use the ticket_id as an
+    idempotency key, so a ticket that is replayed is never saved or counted twice.
+
+    Inventory edits made by hand (submit_edit) go through the same queue and journal,
+    so they are applied in order with the sales around them, and each carries an
+    edit_id that the InventoryRepository records, so a replayed restock is only
+    counted once.
+    """
+    STOP = object()
+
+    def __init__(self, order_repo, max_batch=500, max_delay=0.05, retries=5, journal=None, inventory_repo=None,
+                 on_failure=None):
+        """
+        Initialize the OrderWriter object, queue any tickets left in the journal, and start its thread.
+
+        :param order_repo: the OrderRepository to save tickets with
+        :param max_batch: the most tickets to save in one transaction
+        :param max_delay: seconds to wait for more tickets before committing a batch
+        :param retries: how many times to retry a batch while the database is locked (without a journal)
+        :param journal: a Journal to record tickets in before they are saved
+        :param inventory_repo: an InventoryRepository to deplete for every saved ticket, and to apply edits to
+        :param on_failure: called on the writer thread with (entry, error) for each ticket or edit that can never be saved
+        """
+        self.order_repo = order_repo
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.journal = journal
+        self.inventory_repo = inventory_repo
+        self.on_failure = on_failure
+        self.queue = queue.Queue() # (journal offset or None, Ticket or InventoryEdit) pairs
+        self.submit_lock = threading.Lock() # Keeps the queue in journal order
+        self.failed = [] # Tickets and edits that could not be saved, kept so they are not lost
+        self.held = False # Whether a ticket that may still save later is holding the journal's checkpoint back
+        self.stopping = False
+        if journal is not None:
+            for offset, entry in journal.pending():
+                self.queue.put((offset, entry_from_json(entry)))
+        self.thread = threading.Thread(target=self.run, name="OrderWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, ticket):
+        """
+        Queue a ticket to be saved. Returns as soon as it is in the journal, if there is one.
+
+        :raises OSError: if the ticket couldn't be written to the journal
+        """
+        self.enqueue(ticket)
+
+    def submit_edit(self, action, *args):
+        """
+        Queue an inventory edit to be applied, after every ticket and edit submitted before it.
+
+        :param action: "create", "update", "restock", or "delete"
+        :param args: the arguments for the matching InventoryRepository method (see EDIT_ACTIONS)
+        :return: the edit's edit_id
+        :raises OSError: if the edit couldn't be written to the journal
+        """
+        if action not in EDIT_ACTIONS:
+            raise ValueError(f"Unknown inventory edit: {action}")
+        if self.inventory_repo is None:
+            raise ValueError("This OrderWriter has no InventoryRepository to edit.")
+        edit = InventoryEdit(uuid.uuid4().hex, action, args)
+        self.enqueue(edit)
+        return edit.edit_id
+
+    def enqueue(self, entry):
+        """Journal a ticket or edit, if there is a journal, and put it on the queue."""
+        if self.journal is None:
+            self.queue.put((None, entry))
+            return
+        with self.submit_lock:
+            self.queue.put((self.journal.append(entry_to_json(entry)), entry))
+
+    def flush(self):
+        """Block until every ticket and edit submitted so far has been saved (or failed)."""
+        self.queue.join()
+
+    def close(self):
+        """Save any queued tickets and stop the writer thread. With a journal, tickets that still can't be saved stay in it."""
+        self.stopping = True
+        self.queue.put((None, OrderWriter.STOP))
+        self.thread.join()
+        if self.journal is not None:
+            self.journal.close()
+
+    def run(self):
+        """The writer thread's loop: gather a batch, save it, repeat."""
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item[1] is OrderWriter.STOP:
+                self.queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item[1] is OrderWriter.STOP:
+                    self.queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            if not self.save_batch([entry for _, entry in batch]):
+                self.held = True
+            # The journal is only checkpointed while every earlier ticket was saved or dead-lettered too.
+            if self.journal is not None and not self.held:
+                self.journal.checkpoint(batch[-1][0])
+            for _ in batch:
+                self.queue.task_done()
+
+    def save_batch(self, batch):
+        """
+        Save a batch of tickets and edits, retrying while another connection holds the write lock.
+
+        Locks and disk I/O errors are retried, with a growing delay. Without a journal
+        the batch is given up after the configured retries; with one it is retried
+        until it is saved or the writer is closed. A batch failing with any other
+        error is saved one entry at a time, so one bad ticket doesn't hold back the rest,
+        and a single entry failing that way is dead-lettered.
+
+        :return: False if an entry may still be saved by a later try (it was given up on
+            while locked), otherwise True
+        """
+        attempt = 0
+        while True:
+            try:
+                self.apply(batch)
+                return True
+            except sqlite3.OperationalError as error:
+                attempt += 1
+                if (self.stopping if self.journal is not None else attempt > self.retries):
+                    break
+                if attempt == 1:
+                    logger.warning("Saving %d entries failed (%s); retrying", len(batch), error)
+                time.sleep(min(0.05 * attempt, MAX_RETRY_DELAY))
+            except sqlite3.Error as error:
+                if len(batch) > 1:
+                    logger.warning("Saving %d entries failed (%s); saving them one at a time", len(batch), error)
+                    return all([self.save_batch([entry]) for entry in batch])
+                logger.error("The %s can never be saved: %s", describe(batch[0]), error)
+                self.failed.extend(batch)
+                self.dead_letter(batch[0], error)
+                if self.on_failure is not None:
+                    self.on_failure(batch[0], error)
+                return True
+        self.failed.extend(batch)
+        return False
+
+    def apply(self, batch):
+        """
+        Save a batch in order: each run of tickets with one commit, and each edit with its own.
+
+        Everything is keyed, so after a failure part-way the whole batch can be applied again.
+        """
+        for is_edit, entries in itertools.groupby(batch, key=lambda entry: isinstance(entry, InventoryEdit)):
+            if is_edit:
+                for edit in entries:
+                    getattr(self.inventory_repo, EDIT_ACTIONS[edit.action])(*edit.args, edit_id=edit.edit_id)
+                continue
+            tickets = list(entries)
+            self.order_repo.save_tickets(tickets)
+            if self.inventory_repo is not None:
+                self.inventory_repo.deplete_for_tickets(tickets)
+
+    def dead_letter(self, entry, error):
+        """Append a ticket or edit that can never be saved, and why, to the dead-letter file."""
+        if self.journal is None:
+            return
+        kind = "edit" if isinstance(entry, InventoryEdit) else "ticket"
+        try:
+            with open(dead_letter_path(self.journal), "a", encoding="utf-8") as file:
+                file.write(json.dumps({kind: entry_to_json(entry), "error": str(error)}) + "\n")
+        except OSError:
+            logger.exception("Could not write the %s to the dead-letter file", describe(entry))
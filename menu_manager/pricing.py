@@ -0,0 +1,37 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# All money is handled as integer cents, so adding and removing items never
+# drifts the way repeated float sums do. Tax is rounded half-up to the cent.
+
+def to_cents(price):
+    """Convert a price in dollars (float, str, or Decimal) to integer cents."""
+    return int((Decimal(str(price)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_dollars(cents):
+    """Convert integer cents to a Decimal dollar amount with two places."""
+    return Decimal(cents).scaleb(-2)
+
+def tax_cents(subtotal_cents, tax_rate):
+    """Return the tax on a subtotal, in cents, rounded half-up."""
+    return int((subtotal_cents * Decimal(str(tax_rate))).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def percent_of(cents, percent):
+    """Return percent percent of an amount in cents, rounded half-up to the cent."""
+    return int((cents * Decimal(str(percent)) / 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def price_orders(orders, prices, tax_rate):
+    """
+    Price many orders at once.
+
+    :param orders: an iterable of orders, each an iterable of (menu_id, quantity) lines
+    :param prices: a mapping of menu_id to unit price in cents
+    :param tax_rate: the tax rate as a Decimal, str, or float
+    :return: a list of (subtotal, tax, total) tuples in cents, one per order
+    """
+    rate = Decimal(str(tax_rate))
+    totals = []
+    for lines in orders:
+        subtotal = sum(prices[menu_id] * quantity for menu_id, quantity in lines)
+        tax = tax_cents(subtotal, rate)
+        totals.append((subtotal, tax, subtotal + tax))
+    return totals
@@ -0,0 +1,360 @@
+"""
+Discounts and promotions for orders: percent or amount off, combos, and happy hours.
+
+Promotions are defined in promotions.json next to a location's databases, for example:
+
+    [
+        {"name": "Happy Hour", "percent": "20", "categories": ["Beverages"],
+         "days": ["mon", "tue", "wed", "thu", "fri"], "start": "15:00", "end": "18:00"},
+        {"name": "Salad Dollar Off", "amount": "1.00", "items": ["Garden Salad"]},
+        {"name": "Burger Combo", "price": "9.99",
+         "combo": [{"items": ["Burger"]}, {"items": ["Fries"]}, {"categories": ["Beverages"]}]}
+    ]
+
+A percent or amount promotion takes money off every unit of the items and
+categories it names (every item, if it names neither). A combo sells one unit from
+each of its components, with "quantity" units if given, for a fixed price. Any
+promotion can be limited to days of the week and a time of day; an end time
+before the start time runs past midnight.
+
+Units used in a combo get no other discount. Every other unit gets the single
+best percent or amount discount that applies to it; discounts don't stack.
+Combos are filled in the order they are defined, most expensive units first.
+
+PromotionEngine compiles the definitions once into lookups by item name and
+category, so pricing a line only looks at the promotions that can apply to it.
+OrderDiscounts keeps an order's discounts up to date as items are added,
+repricing only the line that changed (and, when the item can be part of a
+combo, the combos and the lines they draw from).
+
+Usage:
+    python menu_manager/promotions.py                       # check the file and show what is active now
+    python menu_manager/promotions.py --file promotions.json
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pricing import percent_of, to_cents, to_dollars
+
+PROMOTIONS_FILE = "menu_manager/database/promotions.json"
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# One part of a combo: a unit count of any item named in items or in one of categories.
+ComboComponent = namedtuple("ComboComponent", ["items", "categories", "quantity"])
+
+class Promotion(namedtuple("Promotion", ["name", "kind", "value", "items", "categories", "components",
+                                         "days", "start", "end"])):
+    """
+    A class representing one promotion, as read from a definition.
+
+    :param name: the name shown on the order and the receipt
+    :param kind: "percent", "amount", or "combo"
+    :param value: the percent off (a Decimal), the cents off each unit, or the combo's price in cents
+    :param items: the menu item names a percent or amount promotion applies to
+    :param categories: the categories a percent or amount promotion applies to
+    :param components: a combo's ComboComponents
+    :param days: the weekdays (0 for Monday) the promotion runs, or None for every day
+    :param start: the "HH:MM" time it starts each day, or None
+    :param end: the "HH:MM" time it ends each day, or None
+    """
+    __slots__ = ()
+
+    def active(self, now):
+        """Whether the promotion runs at the datetime now."""
+        if self.days is not None and now.weekday() not in self.days:
+            return False
+        if self.start is None and self.end is None:
+            return True
+        time = now.strftime("%H:%M")
+        start, end = self.start or "00:00", self.end or "24:00"
+        if start <= end:
+            return start <= time < end
+        return time >= start or time < end
+
+    def unit_discount(self, price_cents):
+        """The cents a percent or amount promotion takes off one unit at price_cents."""
+        if self.kind == "percent":
+            return percent_of(price_cents, self.value)
+        return min(self.value, price_cents)
+
+def parse_time(definition, key):
+    """Return definition[key] as an "HH:MM" string, or None if it isn't set."""
+    value = definition.get(key)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%H:%M").strftime("%H:%M")
+    except (TypeError, ValueError):
+        raise ValueError(f"{definition.get('name')!r}: {key} must be a time like \"15:30\".")
+
+def parse_promotion(definition):
+    """
+    Return the Promotion for one definition dict.
+
+    :raises ValueError: if the definition is incomplete or has a value of the wrong kind
+    """
+    if not isinstance(definition, dict) or not definition.get("name"):
+        raise ValueError("Every promotion needs a name.")
+    name = definition["name"]
+    kinds = [kind for kind in ("percent", "amount", "combo") if kind in definition]
+    if len(kinds) != 1:
+        raise ValueError(f"{name!r}: give exactly one of percent, amount, or combo.")
+    kind = kinds[0]
+    components = ()
+    try:
+        if kind == "percent":
+            value = Decimal(str(definition["percent"]))
+            if not 0 < value <= 100:
+                raise ValueError(f"{name!r}: percent must be more than 0 and at most 100.")
+        elif kind == "amount":
+            value = to_cents(definition["amount"])
+        else:
+            value = to_cents(definition["price"])
+            components = tuple(
+                ComboComponent(frozenset(part.get("items", ())), frozenset(part.get("categories", ())),
+                               int(part.get("quantity", 1)))
+                for part in definition["combo"]
+            )
+            if not components or any(not (part.items or part.categories) or part.quantity <= 0 for part in components):
+                raise ValueError(f"{name!r}: every combo component needs items or categories and a positive quantity.")
+    except (KeyError, TypeError, AttributeError, InvalidOperation):
+        raise ValueError(f"{name!r}: a {kind} promotion needs a valid {'price' if kind == 'combo' else kind}.")
+    if value < 0:
+        raise ValueError(f"{name!r}: the {kind} can't be negative.")
+    days = definition.get("days")
+    if days is not None:
+        try:
+            days = frozenset(DAYS.index(day.lower()[:3]) for day in days)
+        except (AttributeError, ValueError):
+            raise ValueError(f"{name!r}: days must be weekday names like \"mon\".")
+    return Promotion(name, kind, value, frozenset(definition.get("items", ())),
+                     frozenset(definition.get("categories", ())), components, days,
+                     parse_time(definition, "start"), parse_time(definition, "end"))
+
+class PromotionEngine:
+    """A set of promotions, indexed by the item names and categories they apply to."""
+    def __init__(self, promotions=()):
+        """
+        Initialize the PromotionEngine object.
+
+        :param promotions: Promotions, or definition dicts to parse
+        """
+        self.promotions = [
+            promotion if isinstance(promotion, Promotion) else parse_promotion(promotion) for promotion in promotions
+        ]
+        self.by_item = {} # Item name -> percent and amount promotions naming it
+        self.by_category = {} # Category -> percent and amount promotions naming it
+        self.everywhere = [] # Percent and amount promotions for every item
+        self.combos = [promotion for promotion in self.promotions if promotion.kind == "combo"]
+        self.combo_items = set()
+        self.combo_categories = set()
+        for promotion in self.promotions:
+            if promotion.kind == "combo":
+                for component in promotion.components:
+                    self.combo_items.update(component.items)
+                    self.combo_categories.update(component.categories)
+            elif not promotion.items and not promotion.categories:
+                self.everywhere.append(promotion)
+            else:
+                for name in promotion.items:
+                    self.by_item.setdefault(name, []).append(promotion)
+                for category in promotion.categories:
+                    self.by_category.setdefault(category, []).append(promotion)
+
+    def __len__(self):
+        return len(self.promotions)
+
+    def best_unit_discount(self, item, now):
+        """
+        Return (cents, Promotion) for the biggest percent or amount discount on one unit of item, or None.
+
+        :param item: a MenuItem
+        :param now: the datetime to check the promotions' hours against
+        """
+        price = to_cents(item.price)
+        best = None
+        for promotions in (self.by_item.get(item.name, ()), self.by_category.get(item.category, ()), self.everywhere):
+            for promotion in promotions:
+                if promotion.active(now):
+                    cents = promotion.unit_discount(price)
+                    if cents > 0 and (best is None or cents > best[0]):
+                        best = (cents, promotion)
+        return best
+
+    def in_combo(self, item):
+        """Whether item can be part of any combo."""
+        return item.name in self.combo_items or item.category in self.combo_categories
+
+    def discounts(self):
+        """Return a new, empty OrderDiscounts for an order priced with these promotions."""
+        return OrderDiscounts(self)
+
+def fill_combo(combo, units, order):
+    """
+    Pick the units for one of a combo, most expensive first.
+
+    :param units: key -> units still free to use
+    :return: (key -> units taken, their total price in cents), or None if the combo can't be filled
+    """
+    taken = {}
+    total = 0
+    for component in combo.components:
+        needed = component.quantity
+        eligible = [
+            key for key, count in units.items()
+            if count - taken.get(key, 0) > 0
+            and (order.menu_items[key].name in component.items or order.menu_items[key].category in component.categories)
+        ]
+        eligible.sort(key=lambda key: to_cents(order.menu_items[key].price), reverse=True)
+        for key in eligible:
+            count = min(needed, units[key] - taken.get(key, 0))
+            taken[key] = taken.get(key, 0) + count
+            total += count * to_cents(order.menu_items[key].price)
+            needed -= count
+            if not needed:
+                break
+        if needed:
+            return None
+    return taken, total
+
+class OrderDiscounts:
+    """The discounts on one order, kept up to date as its lines change."""
+    def __init__(self, engine):
+        """
+        Initialize the OrderDiscounts object.
+
+        :param engine: the PromotionEngine to price with
+        """
+        self.engine = engine
+        self.clear()
+
+    def clear(self):
+        """Forget every discount, for an empty order."""
+        self.line_discounts = {} # Order line key -> (cents, promotion name)
+        self.combo_units = {} # Order line key -> units used in combos
+        self.combo_discounts = [] # (promotion name, cents), in definition order
+
+    @property
+    def total_cents(self):
+        """The total discount on the order, in cents."""
+        return sum(cents for cents, _ in self.line_discounts.values()) + sum(cents for _, cents in self.combo_discounts)
+
+    def applied(self):
+        """Return (promotion name, cents) for every promotion on the order, combos first."""
+        totals = dict(self.combo_discounts)
+        for cents, name in self.line_discounts.values():
+            totals[name] = totals.get(name, 0) + cents
+        return list(totals.items())
+
+    def update(self, order, key, now=None):
+        """
+        Reprice after the line for key was added or changed.
+
+        Only that line is repriced, unless its item can be part of a combo; then the
+        combos are refilled and every line whose combo units changed is repriced too.
+
+        :param order: the Order whose line changed
+        :param key: the line's key in order.lines
+        :param now: the datetime to check the promotions' hours against (defaults to now)
+        """
+        now = now or datetime.now()
+        changed = {key}
+        if self.engine.combos and key in order.menu_items and self.engine.in_combo(order.menu_items[key]):
+            before = self.combo_units
+            self.fill_combos(order, now)
+            changed.update(line for line in before.keys() | self.combo_units.keys()
+                           if before.get(line) != self.combo_units.get(line))
+        for line in changed:
+            self.price_line(order, line, now)
+
+    def reprice(self, order, now=None):
+        """Reprice every line of order from scratch, e.g. when a happy hour starts or ends."""
+        now = now or datetime.now()
+        self.clear()
+        if self.engine.combos:
+            self.fill_combos(order, now)
+        for key in order.lines:
+            self.price_line(order, key, now)
+
+    def fill_combos(self, order, now):
+        """Refill every active combo from the order's lines, in definition order."""
+        units = dict(order.lines)
+        self.combo_units = {}
+        self.combo_discounts = []
+        for combo in self.engine.combos:
+            if not combo.active(now):
+                continue
+            discount = 0
+            while True:
+                filled = fill_combo(combo, units, order)
+                if filled is None or filled[1] <= combo.value:
+                    break
+                taken, total = filled
+                for key, count in taken.items():
+                    units[key] -= count
+                    self.combo_units[key] = self.combo_units.get(key, 0) + count
+                discount += total - combo.value
+            if discount:
+                self.combo_discounts.append((combo.name, discount))
+
+    def price_line(self, order, key, now):
+        """Apply the best unit discount to the line's units that aren't in a combo."""
+        units = order.lines.get(key, 0) - self.combo_units.get(key, 0)
+        best = self.engine.best_unit_discount(order.menu_items[key], now) if units > 0 else None
+        if best is None:
+            self.line_discounts.pop(key, None)
+        else:
+            self.line_discounts[key] = (best[0] * units, best[1].name)
+
+def load_promotions(path=PROMOTIONS_FILE):
+    """
+    Return a PromotionEngine for the promotions in a JSON file, or an empty one if the file doesn't exist.
+
+    :raises ValueError: if the file isn't a JSON list of valid promotion definitions
+    """
+    if not os.path.exists(path):
+        return PromotionEngine()
+    with open(path, encoding="utf-8") as file:
+        definitions = json.load(file)
+    if not isinstance(definitions, list):
+        raise ValueError(f"{path} should hold a list of promotions.")
+    return PromotionEngine(definitions)
+
+def describe(promotion):
+    """Return one line describing a promotion."""
+    if promotion.kind == "percent":
+        offer = f"{promotion.value}% off"
+    elif promotion.kind == "amount":
+        offer = f"${to_dollars(promotion.value)} off each"
+    else:
+        parts = [" or ".join(sorted(component.items | component.categories)) for component in promotion.components]
+        offer = f"{' + '.join(parts)} for ${to_dollars(promotion.value)}"
+    targets = ""
+    if promotion.kind != "combo":
+        targets = " " + ", ".join(sorted(promotion.items | promotion.categories)) if promotion.items or promotion.categories else " everything"
+    hours = ""
+    if promotion.days is not None:
+        hours += " on " + ", ".join(DAYS[day] for day in sorted(promotion.days))
+    if promotion.start or promotion.end:
+        hours += f" from {promotion.start or '00:00'} to {promotion.end or '24:00'}"
+    return f"{promotion.name}: {offer}{targets}{hours}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the promotions file and show which promotions are running.")
+    parser.add_argument("--file", default=PROMOTIONS_FILE, help="promotions file")
+    args = parser.parse_args(argv)
+
+    engine = load_promotions(args.file)
+    now = datetime.now()
+    for promotion in engine.promotions:
+        print(("* " if promotion.active(now) else "  ") + describe(promotion))
+    if not engine.promotions:
+        print(f"No promotions in {args.file}.")
+    else:
+        print("* running now")
+
+if __name__ == "__main__":
+    main()
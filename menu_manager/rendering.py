@@ -0,0 +1,243 @@
+"""
+Render the menu and order receipts as plain text, HTML, or ESC/POS bytes for receipt printers.
+
+Templates use str.format syntax with plain field names ("{name:<20}"). Each one is
+parsed once and cached, and rendering writes the pieces straight to a stream, so a
+batch of receipts is never built up in memory.
+
+Usage:
+    python menu_manager/rendering.py menu --format html --output menu.html
+    python menu_manager/rendering.py receipts 41 42 43 --format escpos --output /dev/usb/lp0
+"""
+import argparse
+import functools
+import html
+import io
+import string
+import sys
+from models import MenuRepository, OrderRepository
+from pricing import to_cents, to_dollars
+
+MENU_DB = "menu_manager/database/menu.db"
+ORDERS_DB = "menu_manager/database/orders.db"
+
+class Template:
+    """A str.format-style template, parsed once and rendered many times."""
+    def __init__(self, source, escape=None):
+        """
+        Initialize the Template object.
+
+        :param source: the template text; fields are plain names with an optional format spec
+        :param escape: a function applied to every formatted field, e.g. html.escape
+        """
+        self.escape = escape
+        self.parts = [] # Literal strings, and (field, format spec) pairs
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if literal:
+                self.parts.append(literal)
+            if field is not None:
+                if not field.isidentifier() or conversion:
+                    raise ValueError(f"Unsupported template field: {{{field}}}")
+                self.parts.append((field, spec or ""))
+
+    def render(self, write, values):
+        """Write the template filled in from the values dict, one piece at a time."""
+        for part in self.parts:
+            if isinstance(part, str):
+                write(part)
+            else:
+                text = format(values[part[0]], part[1])
+                write(self.escape(text) if self.escape else text)
+
+@functools.lru_cache(maxsize=256)
+def compile_template(source, escape=None):
+    """Return the Template for source, parsing it only the first time."""
+    return Template(source, escape)
+
+class Renderer:
+    """
+    Renders menus and receipts through a set of named templates.
+
+    Subclasses set TEMPLATES, and optionally escape (applied to every field) and
+    encoding (to write bytes instead of text).
+    """
+    TEMPLATES = {}
+    escape = None
+    encoding = None
+
+    def __init__(self, templates=None):
+        """
+        Initialize the Renderer object.
+
+        :param templates: a dict of template names to sources, replacing some of the defaults
+        """
+        sources = dict(self.TEMPLATES, **(templates or {}))
+        self.templates = {name: compile_template(source, self.escape) for name, source in sources.items()}
+
+    def writer(self, stream):
+        """Return a write function for stream, encoding text if this renderer writes bytes."""
+        if self.encoding is None:
+            return stream.write
+        encoding = self.encoding
+        return lambda text: stream.write(text.encode(encoding, "replace"))
+
+    def menu(self, menu_items, stream, title="Menu"):
+        """
+        Write a menu to stream.
+
+        :param menu_items: a dict of category to a list of MenuItems, as from MenuRepository.get_all_menu_items
+        """
+        write = self.writer(stream)
+        templates = self.templates
+        templates["menu_start"].render(write, {"title": title})
+        for category, items in menu_items.items():
+            if not items:
+                continue
+            templates["category_start"].render(write, {"category": category})
+            for item in items:
+                templates["menu_item"].render(write, {
+                    "name": item.name, "description": item.description or "",
+                    "price": to_dollars(to_cents(item.price)), "calories": item.calories, "category": item.category,
+                })
+            templates["category_end"].render(write, {"category": category})
+        templates["menu_end"].render(write, {"title": title})
+
+    def receipt(self, ticket, stream, title="Menu Manager"):
+        """Write the receipt for a Ticket to stream."""
+        self.write_receipt(ticket, self.writer(stream), title)
+
+    def receipts(self, tickets, stream, title="Menu Manager"):
+        """Write one receipt after another for an iterable of Tickets. Returns how many were written."""
+        write = self.writer(stream)
+        count = 0
+        for ticket in tickets:
+            self.write_receipt(ticket, write, title)
+            count += 1
+        return count
+
+    def write_receipt(self, ticket, write, title):
+        """Write one receipt through a write function from writer()."""
+        templates = self.templates
+        templates["receipt_start"].render(write, {
+            "title": title, "ticket_id": ticket.ticket_id, "created_at": ticket.created_at.replace("T", " "),
+            "terminal": ticket.terminal or "",
+        })
+        for line in ticket.lines:
+            templates["receipt_line"].render(write, {
+                "name": line.name, "quantity": line.quantity, "unit_price": to_dollars(line.unit_price_cents),
+                "amount": to_dollars(line.quantity * line.unit_price_cents),
+            })
+        templates["receipt_end"].render(write, {
+            "subtotal": to_dollars(ticket.subtotal_cents), "tax": to_dollars(ticket.tax_cents),
+            "total": to_dollars(ticket.subtotal_cents + ticket.tax_cents),
+        })
+
+class TextRenderer(Renderer):
+    """Plain text, 40 columns wide."""
+    TEMPLATES = {
+        "menu_start": "{title:^40}\n\n",
+        "category_start": "{category}\n" + "-" * 40 + "\n",
+        "menu_item": "{name:<32}{price:>8}\n  {description}\n  {calories} calories\n",
+        "category_end": "\n",
+        "menu_end": "",
+        "receipt_start": "{title:^40}\n{created_at:<20}{ticket_id:>20.8}\n" + "-" * 40 + "\n",
+        "receipt_line": "{quantity:>3} {name:<26.26}{amount:>10}\n",
+        "receipt_end": ("-" * 40 + "\n" + "Subtotal".ljust(30) + "{subtotal:>10}\n" + "Tax".ljust(30) + "{tax:>10}\n"
+                        + "Total".ljust(30) + "{total:>10}\n\n"),
+    }
+
+class HtmlRenderer(Renderer):
+    """HTML with every field escaped. Menus are whole pages; receipts are fragments that can be written one after another."""
+    escape = staticmethod(html.escape)
+    TEMPLATES = {
+        "menu_start": '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head><body>\n<h1>{title}</h1>\n',
+        "category_start": "<h2>{category}</h2>\n<ul>\n",
+        "menu_item": "<li><strong>{name}</strong> ${price}<br>{description} <small>({calories} calories)</small></li>\n",
+        "category_end": "</ul>\n",
+        "menu_end": "</body></html>\n",
+        "receipt_start": '<div class="receipt">\n<h2>{title}</h2>\n<p>{created_at} &middot; {ticket_id}</p>\n<table>\n',
+        "receipt_line": "<tr><td>{quantity}</td><td>{name}</td><td>${amount}</td></tr>\n",
+        "receipt_end": "</table>\n<p>Subtotal: ${subtotal}<br>Tax: ${tax}<br><strong>Total: ${total}</strong></p>\n</div>\n",
+    }
+
+# ESC/POS control sequences
+ESC_INIT = "\x1b@"
+ESC_BOLD_ON = "\x1bE\x01"
+ESC_BOLD_OFF = "\x1bE\x00"
+ESC_CENTER = "\x1ba\x01"
+ESC_LEFT = "\x1ba\x00"
+ESC_CUT = "\x1dV\x42\x00" # Feed to the cutter, then a partial cut
+
+class EscPosRenderer(Renderer):
+    """Byte streams for ESC/POS receipt printers, 32 columns wide."""
+    encoding = "cp437"
+    TEMPLATES = {
+        "menu_start": ESC_INIT + ESC_CENTER + ESC_BOLD_ON + "{title}\n" + ESC_BOLD_OFF + ESC_LEFT + "\n",
+        "category_start": ESC_BOLD_ON + "{category}\n" + ESC_BOLD_OFF,
+        "menu_item": "{name:<24.24}{price:>8}\n",
+        "category_end": "\n",
+        "menu_end": ESC_CUT,
+        "receipt_start": ESC_INIT + ESC_CENTER + ESC_BOLD_ON + "{title}\n" + ESC_BOLD_OFF
+                         + "{created_at}\n{ticket_id:.8}\n" + ESC_LEFT + "-" * 32 + "\n",
+        "receipt_line": "{quantity:>2} {name:<19.19}{amount:>10}\n",
+        "receipt_end": ("-" * 32 + "\n" + "Subtotal".ljust(22) + "{subtotal:>10}\n" + "Tax".ljust(22) + "{tax:>10}\n"
+                       + ESC_BOLD_ON + "Total".ljust(22) + "{total:>10}\n" + ESC_BOLD_OFF + "\n\n" + ESC_CUT),
+    }
+
+RENDERERS = {"text": TextRenderer, "html": HtmlRenderer, "escpos": EscPosRenderer}
+
+@functools.lru_cache(maxsize=None)
+def get_renderer(format_name):
+    """Return the shared renderer for "text", "html", or "escpos"."""
+    return RENDERERS[format_name]()
+
+def render_menu(menu_items, format_name="text", title="Menu"):
+    """Return a menu as a str (or bytes, for escpos)."""
+    renderer = get_renderer(format_name)
+    stream = io.BytesIO() if renderer.encoding else io.StringIO()
+    renderer.menu(menu_items, stream, title)
+    return stream.getvalue()
+
+def render_receipt(ticket, format_name="text", title="Menu Manager"):
+    """Return a Ticket's receipt as a str (or bytes, for escpos)."""
+    renderer = get_renderer(format_name)
+    stream = io.BytesIO() if renderer.encoding else io.StringIO()
+    renderer.receipt(ticket, stream, title)
+    return stream.getvalue()
+
+def format_for_path(path):
+    """Guess the format from a file name: .html or .htm for HTML, .bin or .escpos for ESC/POS, otherwise text."""
+    lowered = path.lower()
+    if lowered.endswith((".html", ".htm")):
+        return "html"
+    if lowered.endswith((".bin", ".escpos")):
+        return "escpos"
+    return "text"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the menu or saved order receipts.")
+    parser.add_argument("what", choices=["menu", "receipts"])
+    parser.add_argument("order_ids", nargs="*", type=int, help="the orders to print receipts for (default: all)")
+    parser.add_argument("--format", choices=list(RENDERERS), help="output format (default: from the --output extension, else text)")
+    parser.add_argument("--output", help="file to write (default: standard output)")
+    parser.add_argument("--menu-db", default=MENU_DB)
+    parser.add_argument("--orders-db", default=ORDERS_DB)
+    args = parser.parse_args(argv)
+
+    renderer = get_renderer(args.format or (format_for_path(args.output) if args.output else "text"))
+    if args.output:
+        stream = open(args.output, "wb" if renderer.encoding else "w", encoding=None if renderer.encoding else "utf-8")
+    else:
+        stream = sys.stdout.buffer if renderer.encoding else sys.stdout
+    try:
+        if args.what == "menu":
+            renderer.menu(MenuRepository(args.menu_db).get_all_menu_items(), stream)
+        else:
+            order_repo = OrderRepository(args.orders_db)
+            renderer.receipts(order_repo.iter_tickets(args.order_ids or None), stream)
+    finally:
+        if args.output:
+            stream.close()
+
+if __name__ == "__main__":
+    main()
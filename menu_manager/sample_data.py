@@ -0,0 +1,32 @@
+"""
+Reproducible synthetic menus, inventories, and order streams.
+
+The same seed always produces the same data, so benchmark runs on different
+days or machines work on identical rows.
+"""
+import random
+from models import INVENTORY_CATEGORIES, MENU_CATEGORIES, MenuItem
+
+WORDS = ["Classic", "Spicy", "Grilled", "Crispy", "Smoky", "Fresh", "Double", "Mini",
+         "Burger", "Chicken", "Fries", "Salad", "Soda", "Tea", "Shake", "Brownie", "Wrap", "Taco"]
+
+def menu_items(count, seed=0, start=0):
+    """Yield count MenuItem objects, with names unique across calls that use different start numbers."""
+    rng = random.Random(seed)
+    for number in range(start, start + count):
+        name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {number:07d}"
+        yield MenuItem(name, f"A {name.lower()}", round(rng.uniform(0.99, 24.99), 2),
+                       rng.randrange(0, 1500), rng.choice(MENU_CATEGORIES))
+
+def inventory_items(count, seed=0, start=0):
+    """Yield count (item_name, quantity, category) tuples, with names unique across calls that use different start numbers."""
+    rng = random.Random(seed)
+    for number in range(start, start + count):
+        yield f"{rng.choice(WORDS)} stock {number:07d}", rng.randrange(0, 500), rng.choice(INVENTORY_CATEGORIES)
+
+def order_stream(count, menu_ids, max_lines=6, max_quantity=4, seed=0):
+    """Yield count orders, each a list of (menu_id, quantity) lines drawn from menu_ids."""
+    rng = random.Random(seed)
+    menu_ids = list(menu_ids)
+    for _ in range(count):
+        yield [(rng.choice(menu_ids), rng.randint(1, max_quantity)) for _ in range(rng.randint(1, max_lines))]
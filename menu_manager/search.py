@@ -0,0 +1,92 @@
+import re
+
+WORD = re.compile(r"\w+")
+
+def words(text):
+    """Split text into lowercase words."""
+    return WORD.findall(text.lower())
+
+def fts_query(text):
+    """
+    Turn what the user typed into an FTS5 MATCH expression.
+
+    Every word must appear, and the last one may be unfinished, so "gri chic" finds
+    "Grilled Chicken". Words are quoted, so FTS5 operators in the input are ignored.
+    Returns None if there is nothing to search for.
+    """
+    terms = words(text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+class PrefixTrie:
+    """
+    A prefix tree from words to keys, for type-ahead.
+
+    Every word of a name is added, so "bur" finds "Classic Burger". Finding the keys
+    under a prefix walks the whole branch below it, so it costs the length of the
+    prefix plus the number of stored words starting with it: a one-letter prefix
+    visits a large share of the tree, a longer one only a few nodes.
+    """
+    def __init__(self):
+        self.root = {}
+        # Each node is a dict of character -> child node. The key None holds the set of
+        # keys for names containing a word that ends at that node.
+
+    def add(self, name, key):
+        """Index every word of name under key."""
+        for word in words(name):
+            node = self.root
+            for character in word:
+                node = node.setdefault(character, {})
+            node.setdefault(None, set()).add(key)
+
+    def remove(self, name, key):
+        """Remove key from every word of name, pruning branches left empty."""
+        for word in words(name):
+            path = [self.root]
+            for character in word:
+                node = path[-1].get(character)
+                if node is None:
+                    break
+                path.append(node)
+            else:
+                keys = path[-1].get(None)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del path[-1][None]
+                for depth in range(len(word), 0, -1):
+                    if path[depth]:
+                        break
+                    del path[depth - 1][word[depth - 1]]
+
+    def keys_with_prefix(self, prefix):
+        """Return the set of keys with a word starting with prefix."""
+        node = self.root
+        for character in prefix:
+            node = node.get(character)
+            if node is None:
+                return set()
+        found = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for character, child in node.items():
+                if character is None:
+                    found |= child
+                else:
+                    stack.append(child)
+        return found
+
+    def search(self, text):
+        """Return the set of keys whose name has a word starting with each word of text."""
+        terms = words(text)
+        if not terms:
+            return set()
+        found = self.keys_with_prefix(terms[0])
+        for term in terms[1:]:
+            if not found:
+                break
+            found &= self.keys_with_prefix(term)
+        return found
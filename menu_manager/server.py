@@ -0,0 +1,312 @@
+"""
+A small JSON-over-HTTP service for the menu, orders, and inventory.
+
+Several tablets or a kitchen display can share one set of databases through it
+instead of each running its own copy of the Tkinter app. It uses only the standard
+library: asyncio handles the connections, and SQLite work runs on threads so it
+never blocks the event loop.
+
+Usage:
+    python menu_manager/server.py --port 8080
+    python menu_manager/server.py --port 8080 --kitchen-port 8090   # also serve kitchen displays (see kitchen.py)
+
+Endpoints:
+    GET  /menu              the catalog grouped by category (supports ETag / If-None-Match)
+    GET  /menu/<id>         one menu item
+    GET  /inventory         every inventory item
+    POST /orders            {"terminal": "...", "lines": [{"menu_id": 1, "quantity": 2}]}
+    GET  /orders/<id>       a saved order with its lines
+    GET  /metrics           timings and counters (start with --metrics to record them)
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from connections import ConnectionManager
+from instrumentation import enable as enable_metrics, metrics
+from journal import Journal
+from kitchen import follow_orders, load_scheduler, start_kitchen_server
+from locations import database_paths
+from models import InventoryRepository, MenuRepository, Order, OrderRepository
+from order_writer import OrderWriter, journal_path
+from pricing import to_dollars
+from promotions import load_promotions
+
+REASONS = {200: "OK", 202: "Accepted", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+MAX_BODY = 1024 * 1024
+
+class HTTPError(Exception):
+    """An error that should be sent back to the client with the given status."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class MenuService:
+    """Answers HTTP requests using the repositories."""
+    def __init__(self, menu_db, inventory_db, orders_db, read_workers=4, promotions=None):
+        """
+        Initialize the MenuService object.
+
+        :param menu_db: the menu database file
+        :param inventory_db: the inventory database file
+        :param orders_db: the orders database file
+        :param read_workers: how many threads may read from SQLite at once
+        :param promotions: a PromotionEngine to discount orders with
+        """
+        self.promotions = promotions
+        self.connections = ConnectionManager()
+        self.menu_repo = MenuRepository(menu_db, self.connections)
+        self.inventory_repo = InventoryRepository(inventory_db, self.connections)
+        self.order_repo = OrderRepository(orders_db, self.connections)
+        self.order_writer = OrderWriter(self.order_repo, journal=Journal(journal_path(orders_db)),
+                                        inventory_repo=self.inventory_repo)
+        # Reads share a bounded pool; writes go through one thread, as SQLite allows one writer anyway.
+        self.readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="read")
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write")
+        self.inflight = {} # Identical reads in progress, so concurrent requests share one query
+        self.menu_version = 0
+        self.etag_prefix = uuid.uuid4().hex[:8] # ETags from an earlier run never match
+        self.menu_body = None # ((event version, catalog loads), JSON bytes) for the catalog endpoint
+        self.menu_repo.add_listener(self.on_menu_change)
+
+    def on_menu_change(self, table, action, item_id):
+        """Bump the catalog version so the next request rebuilds the body and ETag."""
+        self.menu_version += 1
+
+    async def read(self, key, function, *args):
+        """Run a read on the reader pool. Concurrent reads with the same key share one call."""
+        task = self.inflight.get(key)
+        if task is not None:
+            metrics.count("server.coalesced_reads")
+        else:
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(loop.run_in_executor(self.readers, function, *args))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def write(self, function, *args):
+        """Run a write on the writer thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.writer, function, *args)
+
+    def get_menu_version(self):
+        """
+        Return (event version, catalog loads), which changes whenever the catalog does.
+
+        This process's own writes bump the event version; writes from other processes
+        make the repository reload the catalog. Runs on a reader thread.
+        """
+        version = self.menu_version
+        return version, self.menu_repo.get_catalog_version()
+
+    def build_menu_body(self):
+        """Serialize the catalog, grouped by category, with item IDs."""
+        version = self.get_menu_version()
+        catalog = self.menu_repo.get_catalog()
+        menu = {
+            category: [dict(menu_item_json(catalog.items_by_id[item_id]), id=item_id) for item_id in ids]
+            for category, ids in sorted(catalog.ids_by_category.items())
+        }
+        return version, json.dumps(menu).encode()
+
+    async def get_menu(self, headers):
+        version = await self.read("menu_version", self.get_menu_version)
+        if self.menu_body is None or self.menu_body[0] != version:
+            metrics.count("server.menu_body.miss")
+            self.menu_body = await self.read("menu", self.build_menu_body)
+        (events, loads), body = self.menu_body
+        etag = f'"{self.etag_prefix}-{events}.{loads}"'
+        if headers.get("if-none-match") == etag:
+            metrics.count("server.etag_not_modified")
+            return 304, b"", {"ETag": etag}
+        return 200, body, {"ETag": etag, "Cache-Control": "no-cache"}
+
+    async def get_menu_item(self, item_id):
+        item = await self.read(("menu", item_id), self.menu_repo.get_menu, item_id)
+        if item is None:
+            raise HTTPError(404, f"No menu item with ID {item_id}.")
+        return 200, dict(menu_item_json(item), id=item_id)
+
+    async def get_inventory(self):
+        inventory = await self.read("inventory", self.inventory_repo.get_all_inventory_items)
+        return 200, [item._asdict() for item in inventory]
+
+    async def get_order(self, order_id):
+        order = await self.read(("order", order_id), self.order_repo.get_order, order_id)
+        if order is None:
+            raise HTTPError(404, f"No order with ID {order_id}.")
+        return 200, order
+
+    async def post_order(self, body):
+        try:
+            request = json.loads(body or b"{}")
+            lines = [(int(line["menu_id"]), int(line.get("quantity", 1))) for line in request["lines"]]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPError(400, 'Expected {"lines": [{"menu_id": <id>, "quantity": <n>}, ...]}.')
+        if not lines or any(quantity <= 0 for _, quantity in lines):
+            raise HTTPError(400, "An order needs at least one line with a positive quantity.")
+        return await self.write(self.place_order, lines, request.get("terminal"))
+
+    def place_order(self, lines, terminal):
+        """Price, check, and queue an order. Runs on the writer thread."""
+        catalog = self.menu_repo.get_catalog()
+        availability = self.inventory_repo.get_availability()
+        order = Order(self.promotions)
+        for menu_id, quantity in lines:
+            item = catalog.get(menu_id)
+            if item is None:
+                raise HTTPError(404, f"No menu item with ID {menu_id}.")
+            order.add_item(item, menu_id, quantity)
+        for menu_id, quantity in order.lines.items():
+            if not availability.can_make(menu_id, quantity):
+                raise HTTPError(409, f"There is not enough inventory to make {quantity} {order.menu_items[menu_id].name}.")
+        ticket = order.to_ticket(terminal)
+        self.order_writer.submit(ticket)
+        # Deplete now, so the next order's availability check sees it. If the database
+        # is busy, the order writer does it instead; the ticket_id keeps it to once.
+        try:
+            self.inventory_repo.deplete_for_order(order.lines.items(), ticket.ticket_id)
+        except sqlite3.OperationalError:
+            pass
+        subtotal, tax, total = order.total_cost()
+        return 202, {"ticket_id": ticket.ticket_id, "discount": str(to_dollars(order.discount_cents)),
+                     "subtotal": str(subtotal), "tax": str(tax), "total": str(total)}
+
+    async def route(self, method, path, headers, body):
+        """Dispatch a request. Returns (status, body, extra headers)."""
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts == ["metrics"] and method == "GET":
+            return 200, json.dumps(metrics.snapshot()).encode(), {}
+        if parts == ["menu"] and method == "GET":
+            return await self.get_menu(headers)
+        if parts == ["inventory"] and method == "GET":
+            result = await self.get_inventory()
+        elif parts == ["orders"] and method == "POST":
+            result = await self.post_order(body)
+        elif len(parts) == 2 and parts[0] in ("menu", "orders") and method == "GET":
+            if not parts[1].isdigit():
+                raise HTTPError(404, "Not found.")
+            if parts[0] == "menu":
+                result = await self.get_menu_item(int(parts[1]))
+            else:
+                result = await self.get_order(int(parts[1]))
+        elif parts and parts[0] in ("menu", "inventory", "orders"):
+            raise HTTPError(405, f"{method} is not supported here.")
+        else:
+            raise HTTPError(404, "Not found.")
+        status, data = result
+        return status, json.dumps(data).encode(), {}
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    try:
+                        length = int(headers.get("content-length", 0) or 0)
+                    except ValueError:
+                        length = None
+                    if length is None or length < 0:
+                        keep_alive = False # The body can't be skipped without knowing its length
+                        raise HTTPError(400, "Content-Length must be a whole number of bytes.")
+                    if length > MAX_BODY:
+                        raise HTTPError(413, "Request body too large.")
+                    body = await reader.readexactly(length) if length else b""
+                    started = time.perf_counter()
+                    status, payload, extra = await self.route(method, path, headers, body)
+                    if metrics.enabled:
+                        metrics.record(f"http.{method} /{path.split('?')[0].strip('/').split('/')[0]}", time.perf_counter() - started)
+                except HTTPError as error:
+                    status, payload, extra = error.status, json.dumps({"error": str(error)}).encode(), {}
+                    keep_alive = keep_alive and error.status != 413
+                except Exception as error:
+                    status, payload, extra = 500, json.dumps({"error": str(error)}).encode(), {}
+                response_headers = {
+                    "Content-Type": "application/json",
+                    "Content-Length": str(len(payload)),
+                    "Connection": "keep-alive" if keep_alive else "close",
+                }
+                response_headers.update(extra)
+                head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                head += "".join(f"{name}: {value}\r\n" for name, value in response_headers.items())
+                writer.write(head.encode("latin-1") + b"\r\n" + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        """Finish queued work and close the databases."""
+        self.writer.shutdown(wait=True)
+        self.readers.shutdown(wait=True)
+        self.order_writer.close()
+        self.connections.close_all()
+
+def menu_item_json(item):
+    """Return a MenuItem as a JSON-ready dict."""
+    return item._asdict()
+
+async def serve(service, host, port):
+    """Run the HTTP server until cancelled."""
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the menu, orders, and inventory over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--location", help="serve this store location's databases (default: the unsharded ones)")
+    parser.add_argument("--menu-db", help="menu database file (overrides --location)")
+    parser.add_argument("--inventory-db", help="inventory database file (overrides --location)")
+    parser.add_argument("--orders-db", help="orders database file (overrides --location)")
+    parser.add_argument("--promotions", help="promotions file (overrides --location)")
+    parser.add_argument("--kitchen", help="kitchen stations file (overrides --location)")
+    parser.add_argument("--kitchen-port", type=int, help="also serve kitchen displays on this port")
+    parser.add_argument("--read-workers", type=int, default=4, help="threads for concurrent database reads")
+    parser.add_argument("--metrics", action="store_true", help="record timings and counters for /metrics")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        enable_metrics()
+
+    paths = database_paths(args.location)
+    service = MenuService(args.menu_db or paths["menu"], args.inventory_db or paths["inventory"],
+                          args.orders_db or paths["orders"], args.read_workers,
+                          load_promotions(args.promotions or paths["promotions"]))
+    if args.kitchen_port:
+        kitchen = load_scheduler(args.kitchen or paths["kitchen"])
+        start_kitchen_server(kitchen, args.kitchen_port, args.host)
+        follow_orders(kitchen, service.order_repo)
+        print(f"Kitchen displays on http://{args.host}:{args.kitchen_port}/")
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Tests for the menu catalog and availability index caches: when they reload and when they don't.
+
+Run from the menu_manager folder with:
+
+    python -m unittest
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from connections import ConnectionManager
+from events import EventBus
+from models import InventoryRepository, MenuItem, MenuRepository
+
+BURGER = MenuItem("Burger", "Beef", 8.0, 700, "Entrees")
+FRIES = MenuItem("Fries", "Salted", 3.0, 300, "Sides")
+
+def on_thread(function, *args):
+    """Run function on a new thread, as the database or writer thread would, and return its result."""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(function(*args)))
+    thread.start()
+    thread.join()
+    return results[0]
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.menu_path = os.path.join(directory, "menu.db")
+        self.inventory_path = os.path.join(directory, "inventory.db")
+        self.connections = ConnectionManager()
+        self.addCleanup(self.connections.close_all)
+        self.menu_repo = MenuRepository(self.menu_path, self.connections, EventBus())
+        self.inventory_repo = InventoryRepository(self.inventory_path, self.connections, EventBus())
+
+    def other_process(self, path):
+        """Return a plain connection to path, standing in for another program writing to the database."""
+        conn = sqlite3.connect(path)
+        self.addCleanup(conn.close)
+        return conn
+
+class MenuCatalogTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.menu_repo.create_menu_item(BURGER)
+        self.menu_repo.get_catalog()
+        self.loads = self.menu_repo.catalog_loads
+
+    def test_other_threads_share_the_loaded_catalog(self):
+        self.assertIs(on_thread(self.menu_repo.get_catalog), self.menu_repo.get_catalog())
+        self.assertEqual(self.menu_repo.catalog_loads, self.loads)
+
+    def test_own_writes_from_another_thread_do_not_reload(self):
+        item_id = on_thread(self.menu_repo.create_menu_item, FRIES)
+        on_thread(self.menu_repo.update_menu_item, item_id, FRIES._replace(price=3.5))
+        self.assertEqual(self.menu_repo.get_menu(item_id).price, 3.5)
+        self.assertEqual(self.menu_repo.catalog_loads, self.loads)
+
+    def test_writes_from_another_process_reload(self):
+        conn = self.other_process(self.menu_path)
+        conn.execute("UPDATE menu_items SET price = 9.0 WHERE name = 'Burger';")
+        conn.commit()
+        self.assertEqual(self.menu_repo.get_menu_item_by_name("Burger")[0].price, 9.0)
+        self.assertEqual(self.menu_repo.catalog_loads, self.loads + 1)
+        self.menu_repo.get_catalog()
+        self.assertEqual(self.menu_repo.catalog_loads, self.loads + 1)
+
+    def test_writes_from_another_repository_reload(self):
+        other = MenuRepository(self.menu_path, ConnectionManager(), EventBus())
+        self.addCleanup(other.connections.close_all)
+        other.create_menu_item(FRIES)
+        self.assertIsNotNone(self.menu_repo.get_menu_item_by_name("Fries")[0])
+
+    def test_write_during_a_reload_reloads_again(self):
+        conn = self.other_process(self.menu_path)
+        self.assertFalse(self.menu_repo.changed_elsewhere())
+        conn.execute("INSERT INTO menu_items (name, price, category) VALUES ('Shake', 4.0, 'Beverages');")
+        conn.commit()
+        # The catalog was loaded from before the insert, so the next check must not trust it.
+        self.menu_repo.check_reload()
+        self.assertTrue(self.menu_repo.changed_elsewhere())
+
+class AvailabilityTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.inventory_repo.create_inventory_item("Bun", 10, "Food")
+        self.inventory_repo.set_recipe(1, {1: 1})
+        self.availability = self.inventory_repo.get_availability()
+
+    def test_depletion_on_the_writer_thread_does_not_reload(self):
+        on_thread(self.inventory_repo.deplete_for_order, [(1, 3)], "t1")
+        availability = self.inventory_repo.get_availability()
+        self.assertIs(availability, self.availability)
+        self.assertEqual(availability.servings_left(1), 7)
+
+    def test_stock_counted_elsewhere_reloads(self):
+        conn = self.other_process(self.inventory_path)
+        conn.execute("UPDATE inventory SET quantity = 2;")
+        conn.commit()
+        availability = self.inventory_repo.get_availability()
+        self.assertIsNot(availability, self.availability)
+        self.assertEqual(availability.servings_left(1), 2)
+
+if __name__ == "__main__":
+    unittest.main()
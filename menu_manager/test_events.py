@@ -0,0 +1,68 @@
+"""
+Tests for change event coalescing and batched delivery.
+
+Run from the menu_manager folder with:
+
+    python -m unittest
+"""
+import unittest
+from events import ChangeEvent, EventBus, coalesce
+
+def event(action, item_id=None, table="menu_items", source="menu.db"):
+    """Return a ChangeEvent, by default for a row of menu.db's menu_items."""
+    return ChangeEvent(source, table, action, item_id)
+
+class CoalesceTest(unittest.TestCase):
+    def test_create_then_update_is_a_create(self):
+        self.assertEqual(coalesce([event("create", 1), event("update", 1), event("update", 1)]), [event("create", 1)])
+
+    def test_create_then_delete_drops_the_row(self):
+        self.assertEqual(coalesce([event("create", 1), event("update", 2), event("delete", 1)]), [event("update", 2)])
+
+    def test_update_then_delete_is_a_delete(self):
+        self.assertEqual(coalesce([event("update", 1), event("delete", 1)]), [event("delete", 1)])
+
+    def test_delete_then_create_is_an_update(self):
+        self.assertEqual(coalesce([event("delete", 1), event("create", 1)]), [event("update", 1)])
+
+    def test_first_seen_order_is_kept(self):
+        events = [event("update", 3), event("create", 1), event("update", 2), event("update", 3)]
+        self.assertEqual(coalesce(events), [event("update", 3), event("create", 1), event("update", 2)])
+
+    def test_burst_becomes_a_reload(self):
+        burst = [event("update", item_id) for item_id in range(10)]
+        self.assertEqual(coalesce(burst, reload_threshold=9), [event("reload")])
+        self.assertEqual(coalesce(burst, reload_threshold=10), burst)
+
+    def test_reload_threshold_is_per_table(self):
+        burst = [event("update", item_id) for item_id in range(5)] + [event("update", 1, table="inventory")]
+        self.assertEqual(coalesce(burst, reload_threshold=3), [event("reload"), event("update", 1, table="inventory")])
+
+    def test_reload_absorbs_row_events_for_its_table(self):
+        events = [event("update", 1), event("reload"), event("create", 2), event("update", 1, source="other.db")]
+        self.assertEqual(coalesce(events), [event("reload"), event("update", 1, source="other.db")])
+
+class EventBusTest(unittest.TestCase):
+    def test_batches_are_filtered_and_coalesced(self):
+        bus = EventBus()
+        batches = []
+        bus.subscribe_batches(batches.append, tables=("menu_items",), delay=60)
+        self.addCleanup(bus.close)
+        bus.publish(event("create", 1))
+        bus.publish(event("update", 1, table="inventory"))
+        bus.publish(event("update", 1))
+        self.assertEqual(batches, [])
+        bus.flush()
+        self.assertEqual(batches, [[event("create", 1)]])
+
+    def test_immediate_subscribers_get_every_event(self):
+        bus = EventBus()
+        seen = []
+        bus.subscribe(seen.append, sources=("menu.db",))
+        bus.publish(event("create", 1))
+        bus.publish(event("create", 1, source="other.db"))
+        bus.publish(event("update", 1))
+        self.assertEqual(seen, [event("create", 1), event("update", 1)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Tests for the menu item history and the as-of lookups used to reprice past orders.
+
+Run from the menu_manager folder with:
+
+    python -m unittest
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from connections import ConnectionManager
+from events import EventBus
+from migrations import MENU_MIGRATIONS
+from models import MenuItem, MenuRepository, Order, Ticket, TicketLine
+from pricing import price_orders, to_cents
+
+BURGER = MenuItem("Burger", "Beef", 8.0, 700, "Entrees")
+FRIES = MenuItem("Fries", "Salted", 3.0, 300, "Sides")
+
+def ticket_at(created_at, lines):
+    """Return a ticket rung up at created_at (to the second, like Order.to_ticket) for (menu_id, item, quantity) lines."""
+    ticket_lines = tuple(TicketLine(menu_id, item.name, quantity, to_cents(item.price), item.category)
+                         for menu_id, item, quantity in lines)
+    subtotal = sum(line.quantity * line.unit_price_cents for line in ticket_lines)
+    return Ticket("t", None, created_at, ticket_lines, subtotal, 0)
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "menu.db")
+        # A menu from before the history was kept: its items are backfilled with an empty effective_from.
+        conn = sqlite3.connect(path)
+        for statements in MENU_MIGRATIONS[:3]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute("PRAGMA user_version = 3;")
+        conn.executemany("INSERT INTO menu_items (id, name, description, price, calories, category) VALUES (?, ?, ?, ?, ?, ?);",
+                         [(1, *BURGER), (2, *FRIES)])
+        conn.commit()
+        conn.close()
+        connections = ConnectionManager()
+        self.addCleanup(connections.close_all)
+        self.menu_repo = MenuRepository(path, connections, EventBus())
+        # Later versions, stamped by hand so the tests don't depend on the clock.
+        self.menu_repo.conn.executemany("""
+            INSERT INTO menu_item_history (menu_id, effective_from, name, description, price, calories, category, deleted)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+        """, [(1, "2024-03-01T09:00:00.250", *BURGER._replace(price=9.0), 0),
+              (2, "2024-06-01T00:00:00.000", *FRIES, 1)])
+        self.menu_repo.conn.commit()
+
+    def test_backfilled_rows_are_in_effect_from_the_beginning(self):
+        self.assertEqual(self.menu_repo.get_menu_item_as_of(1, "2000-01-01T00:00:00"), BURGER)
+        self.assertEqual(self.menu_repo.get_menu_item_as_of(2, "2024-02-15T12:00:00"), FRIES)
+
+    def test_lookup_picks_the_version_in_effect(self):
+        self.assertEqual(self.menu_repo.get_menu_item_as_of(1, "2024-03-01T08:59:59").price, 8.0)
+        self.assertEqual(self.menu_repo.get_menu_item_as_of(1, "2024-12-31T00:00:00").price, 9.0)
+
+    def test_change_earlier_in_the_same_second_counts(self):
+        # Tickets are stamped to the second; the change at 09:00:00.250 came before an order at 09:00:00.
+        self.assertEqual(self.menu_repo.get_menu_item_as_of(1, "2024-03-01T09:00:00").price, 9.0)
+        self.assertEqual(self.menu_repo.get_menu_item_as_of(1, "2024-03-01T09:00:00.100").price, 8.0)
+
+    def test_deleted_items_are_gone_after_deletion(self):
+        self.assertIsNone(self.menu_repo.get_menu_item_as_of(2, "2024-06-01T00:00:00"))
+        self.assertEqual(self.menu_repo.get_prices_as_of([1, 2], "2024-07-01T00:00:00"), {1: 9.0})
+        self.assertEqual(self.menu_repo.get_menu_as_of("2024-07-01T00:00:00"), {1: BURGER._replace(price=9.0)})
+        self.assertEqual(self.menu_repo.get_menu_as_of("2024-05-01T00:00:00"), {1: BURGER._replace(price=9.0), 2: FRIES})
+
+    def test_reprice_tickets_at_their_created_at(self):
+        # The burger went from $8 to $9 at 09:00:00.250 on March 1st.
+        for created_at, burger_price in (("2024-02-15T12:00:00", 8.0), ("2024-03-01T09:00:00", 9.0),
+                                         ("2024-05-01T18:30:00", 9.0)):
+            ticket = ticket_at(created_at, [(1, BURGER._replace(price=burger_price), 2), (2, FRIES, 1)])
+            prices = self.menu_repo.get_prices_as_of([line.menu_id for line in ticket.lines], ticket.created_at)
+            [(subtotal, _, _)] = price_orders([[(line.menu_id, line.quantity) for line in ticket.lines]],
+                                              {menu_id: to_cents(price) for menu_id, price in prices.items()},
+                                              Order.TAX_RATE)
+            self.assertEqual(subtotal, ticket.subtotal_cents, created_at)
+
+    def test_writes_are_recorded_and_history_is_append_only(self):
+        item_id = self.menu_repo.create_menu_item(MenuItem("Shake", "Vanilla", 4.0, 600, "Beverages"))
+        self.menu_repo.update_menu_item(item_id, MenuItem("Shake", "Vanilla", 4.5, 600, "Beverages"))
+        self.menu_repo.delete_menu_item(item_id)
+        versions = [item for _, item in self.menu_repo.iter_menu_item_history(item_id)]
+        self.assertEqual([item.price if item else None for item in versions], [4.0, 4.5, None])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.menu_repo.conn.execute("UPDATE menu_item_history SET price = 0;")
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.menu_repo.conn.execute("DELETE FROM menu_item_history;")
+
+if __name__ == "__main__":
+    unittest.main()
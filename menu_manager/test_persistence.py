@@ -0,0 +1,249 @@
+"""
+Tests for the order journal, the stock ledger, and the schema migrations.
+
+Run from the menu_manager folder with:
+
+    python -m unittest
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from connections import ConnectionManager
+from events import EventBus
+from journal import Journal
+from migrations import MENU_MIGRATIONS, INVENTORY_MIGRATIONS, ORDER_MIGRATIONS, get_schema_version, migrate
+from models import InventoryRepository, OrderRepository, Ticket, TicketLine
+from order_writer import InventoryEdit, OrderWriter, dead_letter_path, entry_to_json, journal_path, ticket_to_json
+
+def make_ticket(ticket_id, name="Burger", quantity=2):
+    """Return a one-line ticket for menu item 1."""
+    return Ticket(ticket_id, "T1", "2024-01-01 12:00:00.000", (TicketLine(1, name, quantity, 500, "Entrees"),),
+                  500 * quantity, 35 * quantity)
+
+class TempDirTestCase(unittest.TestCase):
+    """Gives each test its own folder, removed afterwards."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def path(self, name):
+        """Return the path of a file in the test's folder."""
+        return os.path.join(self.directory, name)
+
+class JournalTest(TempDirTestCase):
+    def test_pending_survives_reopen(self):
+        journal = Journal(self.path("orders.journal"), sync=False)
+        first = journal.append({"n": 1})
+        journal.append({"n": 2})
+        journal.checkpoint(first)
+        journal.close()
+
+        journal = Journal(self.path("orders.journal"), sync=False)
+        self.addCleanup(journal.close)
+        self.assertEqual([entry for _, entry in journal.pending()], [{"n": 2}])
+
+    def test_partial_last_line_is_dropped(self):
+        journal = Journal(self.path("orders.journal"), sync=False)
+        journal.append({"n": 1})
+        journal.close()
+        with open(self.path("orders.journal"), "ab") as file:
+            file.write(b'{"n":')
+
+        journal = Journal(self.path("orders.journal"), sync=False)
+        self.addCleanup(journal.close)
+        with self.assertLogs("journal", "WARNING"):
+            self.assertEqual([entry for _, entry in journal.pending()], [{"n": 1}])
+        offset = journal.append({"n": 2})
+        self.assertEqual(offset, os.path.getsize(self.path("orders.journal")))
+        self.assertEqual([entry for _, entry in journal.pending()], [{"n": 1}, {"n": 2}])
+
+    def test_checkpoint_at_the_end_compacts(self):
+        journal = Journal(self.path("orders.journal"), sync=False, compact_size=1)
+        self.addCleanup(journal.close)
+        offset = journal.append({"n": 1})
+        journal.checkpoint(offset)
+        self.assertEqual(os.path.getsize(self.path("orders.journal")), 0)
+        self.assertEqual(journal.backlog(), 0)
+        self.assertEqual(journal.pending(), [])
+
+class WriterTestCase(TempDirTestCase):
+    """Sets up order and inventory databases with one ingredient used by menu item 1."""
+    def setUp(self):
+        super().setUp()
+        self.connections = ConnectionManager()
+        self.addCleanup(self.connections.close_all)
+        bus = EventBus()
+        self.order_repo = OrderRepository(self.path("orders.db"), self.connections, bus)
+        self.inventory_repo = InventoryRepository(self.path("inventory.db"), self.connections, bus)
+        self.inventory_repo.create_inventory_item("Bun", 10, "Bread")
+        self.inventory_repo.set_recipe(1, {1: 1})
+        self.journal_path = journal_path(self.path("orders.db"))
+
+    def start_writer(self):
+        """Open the journal and start an OrderWriter on it, as the program does at startup."""
+        return OrderWriter(self.order_repo, max_delay=0, journal=Journal(self.journal_path, sync=False),
+                           inventory_repo=self.inventory_repo)
+
+    def stock(self):
+        return self.inventory_repo.get_inventory_item(1).quantity
+
+class OrderWriterReplayTest(WriterTestCase):
+    def test_journaled_tickets_are_saved_after_a_crash(self):
+        # A crash right after the tickets were accepted: they are in the journal only.
+        journal = Journal(self.journal_path, sync=False)
+        journal.append(ticket_to_json(make_ticket("a")))
+        journal.append(ticket_to_json(make_ticket("b")))
+        journal.close()
+
+        writer = self.start_writer()
+        writer.flush()
+        writer.close()
+        self.assertEqual(self.order_repo.count_orders(), 2)
+        self.assertEqual(self.stock(), 6)
+        journal = Journal(self.journal_path, sync=False)
+        self.addCleanup(journal.close)
+        self.assertEqual(journal.pending(), [])
+
+    def test_replaying_a_saved_ticket_is_harmless(self):
+        # A crash after the ticket was saved but before the checkpoint was written.
+        ticket = make_ticket("a")
+        self.order_repo.save_tickets([ticket])
+        self.inventory_repo.deplete_for_tickets([ticket])
+        journal = Journal(self.journal_path, sync=False)
+        journal.append(ticket_to_json(ticket))
+        journal.close()
+
+        writer = self.start_writer()
+        writer.flush()
+        writer.close()
+        self.assertEqual(self.order_repo.count_orders(), 1)
+        self.assertEqual(self.stock(), 8)
+
+    def test_ticket_that_can_never_be_saved_is_dead_lettered(self):
+        writer = self.start_writer()
+        with self.assertLogs("order_writer", "WARNING") as logs:
+            writer.submit(make_ticket("a"))
+            writer.submit(make_ticket("bad", name=None)) # order_lines.name is NOT NULL
+            writer.submit(make_ticket("c"))
+            writer.flush()
+            writer.close()
+        self.assertIn("ticket bad can never be saved", "\n".join(logs.output))
+        self.assertEqual([ticket.ticket_id for ticket in writer.failed], ["bad"])
+        self.assertEqual(self.order_repo.count_orders(), 2)
+        self.assertEqual(self.stock(), 6)
+
+        with open(dead_letter_path(writer.journal), encoding="utf-8") as file:
+            entries = [json.loads(line) for line in file]
+        self.assertEqual([entry["ticket"][0] for entry in entries], ["bad"])
+        self.assertIn("NOT NULL", entries[0]["error"])
+
+        # The bad ticket doesn't hold the journal back, so nothing is replayed after a restart.
+        writer = self.start_writer()
+        self.assertEqual(writer.journal.backlog(), 0)
+        writer.close()
+        self.assertEqual(self.order_repo.count_orders(), 2)
+
+class InventoryEditReplayTest(WriterTestCase):
+    def test_edits_are_applied_in_order_with_sales(self):
+        writer = self.start_writer()
+        writer.submit_edit("update", 1, "Bun", 20, "Bread")
+        writer.submit(make_ticket("a"))
+        writer.submit_edit("restock", 1, 5)
+        writer.flush()
+        writer.close()
+        self.assertEqual(self.stock(), 23)
+
+    def test_replaying_an_applied_restock_is_harmless(self):
+        # A crash after the restock was applied but before the checkpoint was written.
+        edit = InventoryEdit("r1", "restock", (1, 5))
+        self.inventory_repo.restock(1, 5, edit_id="r1")
+        journal = Journal(self.journal_path, sync=False)
+        journal.append(entry_to_json(edit))
+        journal.close()
+
+        writer = self.start_writer()
+        writer.flush()
+        writer.close()
+        self.assertEqual(self.stock(), 15)
+
+    def test_edit_that_can_never_be_applied_is_dead_lettered(self):
+        failures = []
+        writer = OrderWriter(self.order_repo, max_delay=0, journal=Journal(self.journal_path, sync=False),
+                             inventory_repo=self.inventory_repo, on_failure=lambda entry, error: failures.append(entry))
+        with self.assertLogs("order_writer", "ERROR"):
+            edit_id = writer.submit_edit("create", "Bun", 5, "Bread") # Item names are unique
+            writer.flush()
+            writer.close()
+        self.assertEqual([edit.edit_id for edit in failures], [edit_id])
+        with open(dead_letter_path(writer.journal), encoding="utf-8") as file:
+            entries = [json.loads(line) for line in file]
+        self.assertEqual([entry["edit"]["edit_id"] for entry in entries], [edit_id])
+        self.assertEqual(self.stock(), 10)
+
+class StockLedgerTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.connections = ConnectionManager()
+        self.addCleanup(self.connections.close_all)
+        self.inventory_repo = InventoryRepository(self.path("inventory.db"), self.connections, EventBus())
+        self.inventory_repo.create_inventory_item("Bun", 10, "Bread")
+        self.inventory_repo.set_recipe(1, {1: 1})
+
+    def sales(self):
+        return self.inventory_repo.conn.execute("SELECT COUNT(*) FROM stock_movements WHERE reason = 'sale';").fetchone()[0]
+
+    def test_depletion_is_recorded_in_the_ledger(self):
+        self.assertEqual(self.inventory_repo.deplete_for_order([(1, 3)]), 1)
+        self.assertEqual(self.inventory_repo.get_inventory_item(1).quantity, 7)
+        self.assertEqual(self.sales(), 1)
+
+    def test_failed_depletion_leaves_no_ledger_rows(self):
+        self.inventory_repo.conn.execute("""
+            CREATE TRIGGER fail_update BEFORE UPDATE ON inventory BEGIN SELECT RAISE(ABORT, 'no updates'); END;
+        """)
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.inventory_repo.deplete_for_order([(1, 3)])
+        self.assertEqual(self.sales(), 0)
+        self.assertEqual(self.inventory_repo.get_inventory_item(1).quantity, 10)
+
+class MigrationTest(unittest.TestCase):
+    def test_new_databases_reach_the_latest_version(self):
+        for migrations in (MENU_MIGRATIONS, INVENTORY_MIGRATIONS, ORDER_MIGRATIONS):
+            conn = sqlite3.connect(":memory:")
+            self.addCleanup(conn.close)
+            self.assertEqual(get_schema_version(conn), 0)
+            self.assertEqual(migrate(conn, migrations), len(migrations))
+            # Running again finds nothing to do.
+            self.assertEqual(migrate(conn, migrations), len(migrations))
+
+    def test_table_from_before_versioning_is_adopted(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.execute("""
+            CREATE TABLE menu_items (
+                id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT,
+                price REAL NOT NULL, calories INTEGER, category TEXT NOT NULL
+            );
+        """)
+        conn.executemany("INSERT INTO menu_items (name, description, price, calories, category) VALUES (?, ?, ?, ?, ?);",
+                         [("Fries", "Salted", 3.0, 300, "Sides"), ("Fries", "Curly", 3.5, 350, "Sides")])
+        conn.commit()
+
+        self.assertEqual(migrate(conn, MENU_MIGRATIONS), len(MENU_MIGRATIONS))
+        names = [row[0] for row in conn.execute("SELECT name FROM menu_items ORDER BY id;")]
+        self.assertEqual(names, ["Fries", "Fries (2)"])
+        matches = conn.execute("SELECT rowid FROM menu_items_fts WHERE menu_items_fts MATCH 'curly';").fetchall()
+        self.assertEqual(matches, [(2,)])
+
+    def test_newer_database_is_refused(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.execute(f"PRAGMA user_version = {len(ORDER_MIGRATIONS) + 1};")
+        with self.assertRaises(RuntimeError):
+            migrate(conn, ORDER_MIGRATIONS)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Tests for integer-cent pricing and tax.
+
+Run from the menu_manager folder with:
+
+    python -m unittest
+"""
+import unittest
+from decimal import Decimal
+from models import MenuItem, Order
+from pricing import percent_of, price_orders, tax_cents, to_cents, to_dollars
+
+class CentsTest(unittest.TestCase):
+    def test_to_cents_rounds_half_up(self):
+        self.assertEqual(to_cents(10.99), 1099)
+        self.assertEqual(to_cents("2.675"), 268)
+        self.assertEqual(to_cents(2.675), 268) # The float's repr, not its binary value
+        self.assertEqual(to_cents(Decimal("0.005")), 1)
+        self.assertEqual(to_cents(0.1 + 0.2), 30)
+
+    def test_to_dollars(self):
+        self.assertEqual(to_dollars(1099), Decimal("10.99"))
+        self.assertEqual(str(to_dollars(5)), "0.05")
+        self.assertEqual(str(to_dollars(-100)), "-1.00")
+
+    def test_tax_rounds_half_up(self):
+        self.assertEqual(tax_cents(150, Order.TAX_RATE), 11) # 10.5 cents
+        self.assertEqual(tax_cents(149, Order.TAX_RATE), 10) # 10.43 cents
+        self.assertEqual(tax_cents(0, Order.TAX_RATE), 0)
+
+    def test_percent_of_rounds_half_up(self):
+        self.assertEqual(percent_of(250, Decimal("10")), 25)
+        self.assertEqual(percent_of(105, Decimal("10")), 11) # 10.5 cents
+        self.assertEqual(percent_of(999, Decimal("100")), 999)
+
+class OrderTotalTest(unittest.TestCase):
+    def test_many_small_items_do_not_drift(self):
+        order = Order()
+        for _ in range(1000):
+            order.add_item(MenuItem("Mint", "", 0.10, 5, "Sides"), 1)
+        self.assertEqual(order.subtotal_cents, 10000)
+        self.assertEqual(order.total_cost(), (Decimal("100.00"), Decimal("7.00"), Decimal("107.00")))
+
+    def test_receipt_shows_the_tax_rate(self):
+        order = Order()
+        order.add_item(MenuItem("Burger", "", 10.99, 700, "Entrees"), 1)
+        self.assertIn("Tax (7%): $0.77", str(order))
+
+    def test_batch_pricing_matches_single_orders(self):
+        menu = {1: MenuItem("Burger", "", 10.99, 700, "Entrees"), 2: MenuItem("Fries", "", 3.49, 300, "Sides"),
+                3: MenuItem("Soda", "", 1.25, 150, "Beverages")}
+        orders = [[(1, 1)], [(1, 2), (2, 1)], [(2, 3), (3, 7)], [(1, 1), (2, 1), (3, 1)]]
+        prices = {menu_id: to_cents(item.price) for menu_id, item in menu.items()}
+        batch = price_orders(orders, prices, Order.TAX_RATE)
+        for lines, (subtotal, tax, total) in zip(orders, batch):
+            order = Order()
+            for menu_id, quantity in lines:
+                order.add_item(menu[menu_id], menu_id, quantity)
+            self.assertEqual(order.total_cost(), (to_dollars(subtotal), to_dollars(tax), to_dollars(total)))
+            ticket = order.to_ticket()
+            self.assertEqual((ticket.subtotal_cents, ticket.tax_cents), (subtotal, tax))
+
+if __name__ == "__main__":
+    unittest.main()
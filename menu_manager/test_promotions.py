@@ -0,0 +1,103 @@
+"""
+Tests for promotions: combos, best-single discounts, hours, and discounted tickets.
+
+Run from the menu_manager folder with:
+
+    python -m unittest
+"""
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from models import DISCOUNTS, MenuItem, Order
+from promotions import PromotionEngine, parse_promotion
+from rendering import render_receipt
+
+MONDAY = datetime(2024, 1, 1, 12, 0) # A Monday at noon
+
+BURGER = MenuItem("Burger", "", 8.00, 700, "Entrees")
+WINGS = MenuItem("Wings", "", 6.00, 600, "Entrees")
+FRIES = MenuItem("Fries", "", 3.00, 300, "Sides")
+SODA = MenuItem("Soda", "", 2.00, 150, "Beverages")
+
+BURGER_COMBO = {"name": "Burger Combo", "price": "9.99",
+                "combo": [{"items": ["Burger"]}, {"items": ["Fries"]}]}
+
+def make_order(definitions, *items, now=MONDAY):
+    """Return an Order priced with definitions at now, holding one unit of each item (by its position as ID)."""
+    order = Order(PromotionEngine(definitions))
+    ids = {}
+    for item in items:
+        order.add_item(item, ids.setdefault(item.name, len(ids) + 1))
+    order.discounts.reprice(order, now)
+    return order
+
+class ComboTest(unittest.TestCase):
+    def test_combo_beats_percent_discount(self):
+        order = make_order([{"name": "Ten Off", "percent": "10"}, BURGER_COMBO], BURGER, FRIES, SODA)
+        # Burger and fries go in the combo (11.00 for 9.99); only the soda gets 10% off.
+        self.assertEqual(dict(order.discounts.applied()), {"Burger Combo": 101, "Ten Off": 20})
+        self.assertEqual(order.discount_cents, 121)
+
+    def test_combo_needs_its_full_quantity(self):
+        wings_combo = [{"name": "Wing Basket", "price": "10.00",
+                        "combo": [{"items": ["Wings"], "quantity": 2}, {"items": ["Fries"]}]}]
+        self.assertEqual(make_order(wings_combo, WINGS, FRIES).discount_cents, 0)
+        self.assertEqual(make_order(wings_combo, WINGS, WINGS, FRIES).discount_cents, 500)
+        # Two full baskets and a spare order of wings.
+        self.assertEqual(make_order(wings_combo, *[WINGS] * 5, FRIES, FRIES).discount_cents, 1000)
+
+    def test_combo_that_costs_more_is_skipped(self):
+        pricey = dict(BURGER_COMBO, price="12.00")
+        self.assertEqual(make_order([pricey], BURGER, FRIES).discount_cents, 0)
+
+class DiscountTest(unittest.TestCase):
+    def test_only_the_best_discount_applies(self):
+        definitions = [{"name": "Ten Off", "percent": "10", "categories": ["Entrees"]},
+                       {"name": "Dollar Off", "amount": "1.00", "items": ["Burger"]}]
+        order = make_order(definitions, BURGER, BURGER)
+        self.assertEqual(order.discounts.applied(), [("Dollar Off", 200)])
+
+    def test_amount_off_never_goes_below_zero(self):
+        order = make_order([{"name": "Five Off", "amount": "5.00"}], SODA)
+        self.assertEqual(order.discount_cents, 200)
+
+class HoursTest(unittest.TestCase):
+    def test_happy_hour_boundaries(self):
+        happy_hour = parse_promotion({"name": "Happy Hour", "percent": "20", "days": ["mon", "tue", "wed", "thu", "fri"],
+                                      "start": "15:00", "end": "18:00"})
+        self.assertFalse(happy_hour.active(MONDAY.replace(hour=14, minute=59)))
+        self.assertTrue(happy_hour.active(MONDAY.replace(hour=15)))
+        self.assertTrue(happy_hour.active(MONDAY.replace(hour=17, minute=59)))
+        self.assertFalse(happy_hour.active(MONDAY.replace(hour=18)))
+        self.assertFalse(happy_hour.active(datetime(2024, 1, 6, 16, 0))) # Saturday
+
+    def test_hours_past_midnight(self):
+        late_night = parse_promotion({"name": "Late Night", "amount": "1.00", "start": "22:00", "end": "02:00"})
+        self.assertTrue(late_night.active(MONDAY.replace(hour=23)))
+        self.assertTrue(late_night.active(MONDAY.replace(hour=1, minute=59)))
+        self.assertFalse(late_night.active(MONDAY.replace(hour=2)))
+
+    def test_reprice_follows_the_clock(self):
+        definitions = [{"name": "Happy Hour", "percent": "50", "categories": ["Beverages"], "start": "15:00", "end": "18:00"}]
+        order = make_order(definitions, SODA)
+        self.assertEqual(order.discount_cents, 0)
+        order.discounts.reprice(order, MONDAY.replace(hour=16))
+        self.assertEqual(order.discount_cents, 100)
+
+class DiscountedTicketTest(unittest.TestCase):
+    def test_discounts_are_negative_receipt_lines(self):
+        ticket = make_order([{"name": "Dollar Off", "amount": "1.00", "items": ["Burger"]}], BURGER, FRIES).to_ticket()
+        discount_lines = [line for line in ticket.lines if line.category == DISCOUNTS]
+        self.assertEqual([(line.name, line.quantity, line.unit_price_cents) for line in discount_lines],
+                         [("Dollar Off", 1, -100)])
+        self.assertEqual(ticket.subtotal_cents, 1000)
+        self.assertEqual(sum(line.quantity * line.unit_price_cents for line in ticket.lines), ticket.subtotal_cents)
+        self.assertIn("-1.00", render_receipt(ticket))
+
+    def test_tax_is_charged_after_discounts(self):
+        order = make_order([{"name": "Dollar Off", "amount": "1.00", "items": ["Burger"]}], BURGER, FRIES)
+        self.assertEqual(order.total_cost(), (Decimal("10.00"), Decimal("0.70"), Decimal("10.70")))
+        self.assertEqual(order.to_ticket().tax_cents, 70)
+
+if __name__ == "__main__":
+    unittest.main()
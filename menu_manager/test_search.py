@@ -0,0 +1,97 @@
+"""
+Tests for type-ahead and full-text search.
+
+Run from the menu_manager folder with:
+
+    python -m unittest
+"""
+import unittest
+from connections import ConnectionManager
+from events import EventBus
+from models import InventoryRepository, InventoryTable, MenuItem, MenuRepository
+from search import PrefixTrie, fts_query
+
+def memory_connections(test):
+    """Return a ConnectionManager for an in-memory database, closed when the test ends."""
+    connections = ConnectionManager()
+    test.addCleanup(connections.close_all)
+    return connections
+
+class PrefixTrieTest(unittest.TestCase):
+    def setUp(self):
+        self.trie = PrefixTrie()
+        self.trie.add("Grilled Chicken", 1)
+        self.trie.add("Grilled Cheese", 2)
+        self.trie.add("Chicken Tenders", 3)
+
+    def test_any_word_can_start_a_match(self):
+        self.assertEqual(self.trie.search("gri"), {1, 2})
+        self.assertEqual(self.trie.search("chi"), {1, 3})
+        self.assertEqual(self.trie.search("CHEESE"), {2})
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.trie.search("gri chi"), {1})
+        self.assertEqual(self.trie.search("gri ten"), set())
+
+    def test_blank_text_matches_nothing(self):
+        self.assertEqual(self.trie.search(""), set())
+        self.assertEqual(self.trie.search("  !"), set())
+
+    def test_remove_prunes_empty_branches(self):
+        self.trie.remove("Grilled Cheese", 2)
+        self.assertEqual(self.trie.search("gri"), {1})
+        self.assertEqual(self.trie.keys_with_prefix("chee"), set())
+        self.assertNotIn("e", self.trie.root["c"]["h"])
+        self.trie.remove("Grilled Chicken", 1)
+        self.trie.remove("Chicken Tenders", 3)
+        self.assertEqual(self.trie.root, {})
+
+class FtsQueryTest(unittest.TestCase):
+    def test_words_are_quoted_prefixes(self):
+        self.assertEqual(fts_query("gri chi"), '"gri"* "chi"*')
+        self.assertEqual(fts_query('NOT "burger" OR'), '"not"* "burger"* "or"*')
+        self.assertIsNone(fts_query("  "))
+
+class MenuSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.menu_repo = MenuRepository(":memory:", memory_connections(self), EventBus())
+        for item in (MenuItem("Grilled Chicken", "With herbs", 9.5, 500, "Entrees"),
+                     MenuItem("Grilled Cheese", "On sourdough", 6, 450, "Entrees"),
+                     MenuItem("Chicken Tenders", "Crispy", 7, 600, "Entrees")):
+            self.menu_repo.create_menu_item(item)
+
+    def test_multi_word_search(self):
+        self.assertEqual([item.name for _, item in self.menu_repo.search_menu_items("gri chi")], ["Grilled Chicken"])
+
+    def test_description_and_category_are_searched(self):
+        self.assertEqual([item.name for _, item in self.menu_repo.search_menu_items("sourd")], ["Grilled Cheese"])
+        self.assertEqual(len(self.menu_repo.search_menu_items("entree")), 3)
+
+    def test_blank_search_finds_nothing(self):
+        self.assertEqual(self.menu_repo.search_menu_items(""), [])
+
+    def test_catalog_completion(self):
+        catalog = self.menu_repo.get_catalog()
+        self.assertEqual([item.name for _, item in catalog.complete("chi")], ["Chicken Tenders", "Grilled Chicken"])
+        self.assertEqual([item.name for _, item in catalog.complete("gri chi")], ["Grilled Chicken"])
+
+class InventorySearchTest(unittest.TestCase):
+    def setUp(self):
+        self.inventory_repo = InventoryRepository(":memory:", memory_connections(self), EventBus())
+        self.inventory_repo.create_inventory_item("Chicken Breast", 20, "Food")
+        self.inventory_repo.create_inventory_item("Grill Cleaner", 3, "Cleaning Supplies")
+
+    def test_multi_word_search(self):
+        found = self.inventory_repo.search_inventory_items("chi bre")
+        self.assertIsInstance(found, InventoryTable)
+        self.assertEqual([item.item_name for item in found], ["Chicken Breast"])
+        self.assertEqual([item.item_name for item in self.inventory_repo.search_inventory_items("clean")],
+                         ["Grill Cleaner"])
+
+    def test_blank_search_returns_an_empty_table(self):
+        found = self.inventory_repo.search_inventory_items("")
+        self.assertIsInstance(found, InventoryTable)
+        self.assertEqual(len(found), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,250 @@
+import difflib
+from collections import OrderedDict
+
+class ListboxView:
+    """
+    Keeps a Listbox in step with a list of row strings, touching only rows that changed.
+
+    sync() diffs the new rows against what is on screen and turns the difference into
+    the fewest Listbox deletes and inserts, so one edited item costs one or two widget
+    calls instead of clearing and refilling the whole list. Rows that don't change keep
+    their selection.
+    """
+    def __init__(self, listbox):
+        self.listbox = listbox
+        self.rows = []
+
+    def sync(self, rows):
+        """Make the Listbox show rows."""
+        rows = list(rows)
+        matcher = difflib.SequenceMatcher(None, self.rows, rows, autojunk=False)
+        # Apply from the bottom up so earlier indexes stay valid.
+        for tag, old_start, old_end, new_start, new_end in reversed(matcher.get_opcodes()):
+            if tag == "equal":
+                continue
+            if old_end > old_start:
+                self.listbox.delete(old_start, old_end - 1)
+            if new_end > new_start:
+                self.listbox.insert(old_start, *rows[new_start:new_end])
+        self.rows = rows
+
+class PagedRows:
+    """
+    The rows of a query, read a page at a time with keyset pagination and cached a few pages at a time.
+
+    fetch(after, limit, offset) returns the rows that come after the row whose key
+    is after (or the first rows, if after is None). Every page read remembers the key
+    its last row ends on, so the next page starts from there through the index no
+    matter how far down the table it is. Jumping to a page that hasn't been reached
+    yet skips forward from the nearest page that has.
+
+    Not thread-safe: every call has to come from the same (database) thread.
+    """
+    def __init__(self, fetch, count, key, page_size=100, cached_pages=10):
+        """
+        Initialize the PagedRows object.
+
+        :param fetch: a function (after, limit, offset) -> list of rows, in key order
+        :param count: a function () -> the number of rows
+        :param key: a function row -> the row's sort key, as fetch takes for after
+        :param page_size: rows per page
+        :param cached_pages: how many recently used pages to keep
+        """
+        self.fetch = fetch
+        self.count_rows = count
+        self.key = key
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget every cached page and count, after the table has changed."""
+        self.pages = OrderedDict() # Page number -> rows, least recently used first
+        self.starts = {0: None} # Page number -> key of the row before it
+        self.total = None
+
+    def __len__(self):
+        if self.total is None:
+            self.total = self.count_rows()
+        return self.total
+
+    def page(self, number):
+        """Return the rows of a page, from the cache if it's there."""
+        rows = self.pages.get(number)
+        if rows is not None:
+            self.pages.move_to_end(number)
+            return rows
+        known = max(page for page in self.starts if page <= number)
+        rows = list(self.fetch(self.starts[known], self.page_size, (number - known) * self.page_size))
+        if rows:
+            self.starts[number + 1] = self.key(rows[-1])
+        self.pages[number] = rows
+        if len(self.pages) > self.cached_pages:
+            self.pages.popitem(last=False)
+        return rows
+
+    def rows(self, start, stop):
+        """Return rows start up to (not including) stop."""
+        rows = []
+        for number in range(start // self.page_size, (stop - 1) // self.page_size + 1):
+            page_start = number * self.page_size
+            rows.extend(self.page(number)[max(start - page_start, 0):stop - page_start])
+        return rows
+
+class ListRows:
+    """Rows already in memory, such as search results, with the same interface as PagedRows."""
+    def __init__(self, rows):
+        self.items = list(rows)
+
+    def invalidate(self):
+        pass
+
+    def __len__(self):
+        return len(self.items)
+
+    def rows(self, start, stop):
+        return self.items[start:stop]
+
+class VirtualListView:
+    """
+    Shows a window of a PagedRows or ListRows in a fixed-height Listbox, as if it held every row.
+
+    The Listbox only ever holds the rows that fit in it. The scrollbar and mouse wheel
+    move the window, and each move reads just those rows on the database thread, so
+    a list of 100,000 items uses as little memory and widget time as one of twenty.
+    Rows are read with submit (DatabaseExecutor.submit); a read that is overtaken by
+    a newer one is dropped when it finishes.
+    """
+    def __init__(self, listbox, scrollbar, submit, format_row, height=10, on_render=None):
+        """
+        Initialize the VirtualListView object.
+
+        :param listbox: the Listbox to show rows in
+        :param scrollbar: a vertical Scrollbar next to it
+        :param submit: runs a function on the database thread, as DatabaseExecutor.submit
+        :param format_row: a function row -> the text shown for it
+        :param height: how many rows the Listbox shows
+        :param on_render: called with the visible rows every time they change
+        """
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        self.submit = submit
+        self.format_row = format_row
+        self.height = height
+        self.on_render = on_render
+        self.view = ListboxView(listbox)
+        self.source = None
+        self.rows = [] # The rows on screen
+        self.top = 0 # The index of the first row on screen
+        self.total = 0
+        self.generation = 0 # Bumped for every read, so stale reads can be recognised
+        listbox.config(height=height)
+        scrollbar.config(command=self.on_scroll)
+        listbox.bind("<MouseWheel>", lambda event: self.scroll_by(-1 if event.delta > 0 else 1, "units"))
+        listbox.bind("<Button-4>", lambda event: self.scroll_by(-1, "units"))
+        listbox.bind("<Button-5>", lambda event: self.scroll_by(1, "units"))
+
+    def set_source(self, source):
+        """Show another set of rows, from the top."""
+        self.source = source
+        self.top = 0
+        self.load()
+
+    def refresh(self, invalidate=False):
+        """
+        Read the visible rows again.
+
+        :param invalidate: drop the source's cached pages first, because its table has changed
+        """
+        self.load(invalidate)
+
+    def selected(self):
+        """Return the selected row, or None."""
+        index = self.listbox.curselection()
+        if index and index[0] < len(self.rows):
+            return self.rows[index[0]]
+        return None
+
+    def on_scroll(self, command, amount, unit=None):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", count, "units" or "pages")."""
+        if command == "moveto":
+            self.top = int(float(amount) * self.total)
+            self.load()
+        else:
+            self.scroll_by(int(amount), unit)
+
+    def scroll_by(self, count, unit):
+        """Move the window count rows, or count pages if unit is "pages"."""
+        self.top = max(0, self.top + count * (self.height if unit == "pages" else 1))
+        self.load()
+        return "break"
+
+    def load(self, invalidate=False):
+        """Reads the rows from self.top on the database thread, then shows them."""
+        if self.source is None:
+            return
+        self.generation += 1
+        generation = self.generation
+        self.submit(self.read, self.source, self.top, invalidate,
+                    on_done=lambda window: self.show(generation, window))
+
+    def read(self, source, top, invalidate):
+        """Returns (top, total, rows) for a window starting near top. Runs on the database thread."""
+        if invalidate:
+            source.invalidate()
+        total = len(source)
+        top = max(0, min(top, total - self.height))
+        return top, total, source.rows(top, min(top + self.height, total))
+
+    def show(self, generation, window):
+        """Shows the rows read by load(), unless a newer read has started since."""
+        top, total, rows = window
+        if generation != self.generation:
+            return
+        self.top, self.total, self.rows = top, total, rows
+        self.view.sync(map(self.format_row, rows))
+        if total:
+            self.scrollbar.set(top / total, (top + len(rows)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+        if self.on_render is not None:
+            self.on_render(rows)
+
+class TextView:
+    """Keeps a read-only Text widget in step with a list of lines, touching only lines that changed."""
+    def __init__(self, text):
+        self.text = text
+        self.lines = []
+
+    def sync(self, lines):
+        """Make the Text widget show lines."""
+        lines = list(lines)
+        matcher = difflib.SequenceMatcher(None, self.lines, lines, autojunk=False)
+        self.text.config(state="normal")
+        for tag, old_start, old_end, new_start, new_end in reversed(matcher.get_opcodes()):
+            if tag == "equal":
+                continue
+            # Text indexes are "line.column" with lines counted from 1.
+            if old_end > old_start:
+                self.text.delete(f"{old_start + 1}.0", f"{old_end + 1}.0")
+            if new_end > new_start:
+                self.text.insert(f"{old_start + 1}.0", "".join(line + "\n" for line in lines[new_start:new_end]))
+        self.text.config(state="disabled")
+        self.lines = lines
+
+def menu_text_lines(menu_items):
+    """Return the Menu tab's text, one line per list entry, for menu items grouped by category."""
+    lines = []
+    for category, items in menu_items.items():
+        lines.append(f"{category}:")
+        lines.extend(f"  {item}" for item in items)
+        lines.append("")
+    return lines
+
+def menu_item_row(row):
+    """Return the listbox text (the item's name) for an (id, MenuItem) row."""
+    return row[1].name
+
+def inventory_row(item):
+    """Return the listbox text for an InventoryItem."""
+    return f"{item.item_name} - {item.quantity} - {item.category}"